@@ -0,0 +1,2 @@
+# Бенчмарки производительности рекомендательной системы.
+# Запуск из корня репозитория: python -m benchmarks.<имя_модуля>
@@ -0,0 +1,69 @@
+# Бенчмарк приближённого поиска похожих пользователей (LSH) против точного перебора:
+# полнота рекомендаций и задержка одного запроса
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from recomandator3000 import DataManager, SimilarUserStrategy, User, UserLSHIndex
+
+
+def build(directory: str, n_users: int, n_movies: int, n_clusters: int, seed: int):
+    #пользователи из нескольких "вкусовых" групп: свои фильмы группа оценивает высоко
+    rng = random.Random(seed)
+    data_manager = DataManager(os.path.join(directory, "ann.json"))
+    favourites = [set(rng.sample(range(1, n_movies + 1), n_movies // n_clusters)) for _ in range(n_clusters)]
+    with data_manager._reading_storage():
+        for user_id in range(1, n_users + 1):
+            liked = favourites[user_id % n_clusters]
+            user = User(user_id, f"user{user_id}", "secret")
+            for movie_id in rng.sample(range(1, n_movies + 1), rng.randint(20, 60)):
+                base = 8 if movie_id in liked else 3
+                user.add_rating(movie_id, min(10, max(0, base + rng.randint(-2, 2))))
+            data_manager.add_user(user)
+    return data_manager
+
+
+def run(strategy: SimilarUserStrategy, users, max_results: int):
+    results, latencies = [], []
+    for user in users:
+        start = time.perf_counter()
+        results.append([movie.movie_id for movie in strategy.get_recommendations(user, max_results=max_results)])
+        latencies.append(time.perf_counter() - start)
+    return results, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LSH против точного поиска похожих пользователей")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--movies", type=int, default=2000)
+    parser.add_argument("--clusters", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--max-results", type=int, default=10)
+    parser.add_argument("--tables", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--bits", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        data_manager = build(directory, args.users, args.movies, args.clusters, seed=1)
+        queries = random.Random(2).sample(data_manager.get_all_users(), args.queries)
+        exact, exact_latencies = run(SimilarUserStrategy(data_manager), queries, args.max_results)
+
+        print(f"{'вариант':>12} {'полнота@k':>10} {'p50, мс':>9} {'p99, мс':>9} {'индекс, с':>10}")
+        print(f"{'точный':>12} {1.0:>10.3f} {statistics.median(exact_latencies) * 1000:>9.2f} "
+              f"{sorted(exact_latencies)[int(len(exact_latencies) * 0.99)] * 1000:>9.2f} {'-':>10}")
+        for n_tables in args.tables:
+            start = time.perf_counter()
+            index = UserLSHIndex(data_manager, n_tables=n_tables, n_bits=args.bits)
+            build_time = time.perf_counter() - start
+            approx, latencies = run(SimilarUserStrategy(data_manager, index), queries, args.max_results)
+            found = sum(len(set(a) & set(e)) for a, e in zip(approx, exact))
+            recall = found / max(1, sum(len(e) for e in exact))
+            print(f"{'LSH x' + str(n_tables):>12} {recall:>10.3f} {statistics.median(latencies) * 1000:>9.2f} "
+                  f"{sorted(latencies)[int(len(latencies) * 0.99)] * 1000:>9.2f} {build_time:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# Бенчмарк приёма событий оценок: событий в секунду при пакетном приёме (RatingIngestor)
+# против записи по одной оценке с сохранением после каждой, как в интерактивном приложении
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import generate
+from recomandator3000 import DataManager, RatingIngestor
+
+
+def write_events(path: str, n_events: int, n_users: int, n_movies: int, repeat_share: float, seed: int):
+    #события JSONL: часть - повторные оценки недавних пар, немного - неверные
+    rng = random.Random(seed)
+    recent = []
+    with open(path, "w", encoding="utf-8") as f:
+        for timestamp in range(n_events):
+            if recent and rng.random() < repeat_share:
+                user_id, movie_id = rng.choice(recent)
+            else:
+                user_id, movie_id = rng.randint(1, n_users), rng.randint(1, n_movies)
+                recent.append((user_id, movie_id))
+                if len(recent) > 1000:
+                    recent.pop(0)
+            rating = rng.randint(0, 10) if rng.random() > 0.01 else 42
+            f.write(json.dumps({"user": user_id, "movie": movie_id, "rating": rating,
+                                "timestamp": timestamp}) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетный приём событий оценок против записи по одной")
+    parser.add_argument("--events", type=int, default=1000000)
+    parser.add_argument("--ratings", type=int, default=100000, help="оценок в исходных данных")
+    parser.add_argument("--repeat-share", type=float, default=0.2, help="доля повторных оценок одной пары")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--queue-size", type=int, default=4)
+    parser.add_argument("--single-events", type=int, default=2000,
+                        help="событий для записи по одной (каждое - с fsync журнала)")
+    parser.add_argument("--storage", choices=["json", "db"], default="json")
+    parser.add_argument("--target", type=float, default=100000,
+                        help="целевая скорость, событий/с: ниже - код выхода 1")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        data_manager = DataManager(os.path.join(directory, f"ingest.{args.storage}"))
+        generate(data_manager, args.ratings)
+        n_users, n_movies = len(data_manager.get_all_users()), len(data_manager.catalog)
+        path = os.path.join(directory, "events.jsonl")
+        write_events(path, args.events, n_users, n_movies, args.repeat_share, seed=7)
+
+        # по одной: проверка, add_rating и сохранение после каждой оценки
+        events = RatingIngestor.read_events(path)
+        start = time.perf_counter()
+        for _, (user_id, movie_id, rating, _) in zip(range(args.single_events), events):
+            if 0 <= rating <= 10:
+                data_manager.get_user(user_id).add_rating(movie_id, rating)
+                data_manager.flush()
+        single_rate = args.single_events / (time.perf_counter() - start)
+
+        stats = RatingIngestor(data_manager, args.batch_size, args.queue_size).ingest_file(path)
+        batch_rate = stats["events"] / stats["seconds"]
+        data_manager.close()
+
+    print(f"{'способ':>12} {'событий/с':>12}")
+    print(f"{'по одной':>12} {single_rate:>12.0f}")
+    print(f"{'порциями':>12} {batch_rate:>12.0f}")
+    print(f"применено: {stats['applied']}, схлопнуто: {stats['coalesced']}, отклонено: {stats['rejected']}, "
+          f"порций: {stats['batches']}")
+    if batch_rate < args.target:
+        print(f"ниже цели {args.target:.0f} событий/с", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
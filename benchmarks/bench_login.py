@@ -0,0 +1,42 @@
+# Бенчмарк входа: время authenticate при росте числа пользователей
+import argparse
+import os
+import tempfile
+import time
+
+from recomandator3000 import DataManager, User
+
+
+def build(n_users: int, directory: str):
+    data_manager = DataManager(os.path.join(directory, f"login_{n_users}.json"))
+    # пользователи добавляются как при загрузке, без записи каждого в журнал
+    with data_manager._reading_storage():
+        for user_id in range(1, n_users + 1):
+            data_manager.add_user(User(user_id, f"User{user_id}", "secret"))
+    return data_manager
+
+
+def measure(data_manager: DataManager, n_users: int, repeats: int):
+    names = [f"user{(i * 7919) % n_users + 1}" for i in range(repeats)]
+    start = time.perf_counter()
+    for name in names:
+        assert data_manager.authenticate(name, "secret") is not None
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время входа в зависимости от числа пользователей")
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--repeats", type=int, default=10000)
+    args = parser.parse_args()
+
+    print(f"{'пользователей':>14} {'вход, мкс':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for n in args.users:
+            data_manager = build(n, directory)
+            print(f"{n:>14} {measure(data_manager, n, args.repeats) * 1e6:>10.2f}")
+            del data_manager
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# Бенчмарк памяти: байт на фильм и на оценку до и после компактного представления
+# (объекты с __dict__ против __slots__ и каталога по столбцам)
+import argparse
+import random
+import tracemalloc
+
+from recomandator3000 import Genre, Movie, MovieCatalog, User
+
+
+class DictMovie:
+    #прежний Movie: атрибуты в __dict__ каждого объекта
+    __init__ = Movie.__init__
+
+
+class DictUser:
+    #прежний User: атрибуты в __dict__ каждого объекта
+    __init__ = User.__init__
+    add_rating = User.add_rating
+
+
+def measure(build):
+    tracemalloc.start()
+    result = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current
+
+
+def movie_rows(n_movies: int):
+    random.seed(1)
+    genres = list(Genre)
+    directors = [f"Режиссёр {i}" for i in range(max(1, n_movies // 20))]
+    return [(movie_id, f"Фильм {movie_id}", random.sample(genres, random.randint(1, 3)),
+             random.choice(directors), random.randint(1950, 2024), round(random.uniform(1, 10), 1))
+            for movie_id in range(1, n_movies + 1)]
+
+
+def build_dict_catalog(rows):
+    #как при загрузке из файла: у каждого фильма свои копии строк и списка жанров
+    return {row[0]: DictMovie(row[0], row[1], list(row[2]), "".join(row[3]), row[4], row[5]) for row in rows}
+
+
+def build_columnar_catalog(rows):
+    catalog = MovieCatalog()
+    for row in rows:
+        catalog.add(Movie(row[0], row[1], list(row[2]), "".join(row[3]), row[4], row[5]))
+    return catalog
+
+
+def build_users(user_cls, n_users: int, ratings_per_user: int):
+    random.seed(2)
+    users = []
+    for user_id in range(1, n_users + 1):
+        user = user_cls(user_id, f"user{user_id}", "secret")
+        for movie_id in random.sample(range(1, 10 * ratings_per_user), ratings_per_user):
+            user.add_rating(movie_id, random.randint(0, 10))
+        users.append(user)
+    return users
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Память каталога и пользователей: объекты против компактного хранения")
+    parser.add_argument("--movies", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--ratings-per-user", type=int, nargs="+", default=[5, 20, 100])
+    args = parser.parse_args()
+
+    print(f"{'фильмов':>10} {'объекты, Б/фильм':>17} {'столбцы, Б/фильм':>17}")
+    for n in args.movies:
+        rows = movie_rows(n)
+        before = measure(lambda: build_dict_catalog(rows))
+        after = measure(lambda: build_columnar_catalog(rows))
+        print(f"{n:>10} {before / n:>17.1f} {after / n:>17.1f}")
+
+    print(f"\n{'оценок/польз.':>14} {'__dict__, Б/оценку':>19} {'__slots__, Б/оценку':>20}")
+    for k in args.ratings_per_user:
+        n_ratings = args.users * k
+        before = measure(lambda: build_users(DictUser, args.users, k))
+        after = measure(lambda: build_users(User, args.users, k))
+        print(f"{k:>14} {before / n_ratings:>19.1f} {after / n_ratings:>20.1f}")
+
+
+if __name__ == "__main__":
+    main()
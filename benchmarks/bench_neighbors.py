@@ -0,0 +1,81 @@
+# Бенчмарк готовых списков похожих пользователей (UserNeighborIndex): задержка запроса
+# "по похожим пользователям" с полным пересчётом и по спискам, стоимость записи оценки.
+# Совпадение списков с полным пересчётом проверяет tests/test_user_neighbors.py
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks.synthetic import generate
+from recomandator3000 import DataManager, SimilarUserStrategy, User, UserNeighborIndex
+
+
+def latencies(strategy: SimilarUserStrategy, users):
+    samples = []
+    for user in users:
+        start = time.perf_counter()
+        strategy.get_recommendations(user)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def random_writes(data_manager: DataManager, n_writes: int, n_movies: int, rng: random.Random):
+    #новые и изменённые оценки, изредка - замена пользователя целиком; возвращает секунды на запись
+    users = data_manager.get_all_users()
+    start = time.perf_counter()
+    for _ in range(n_writes):
+        user = rng.choice(users)
+        if rng.random() < 0.01:
+            replacement = User(user.user_id, user.name, "secret")
+            for movie_id in rng.sample(range(1, n_movies + 1), rng.randint(1, 30)):
+                replacement.add_rating(movie_id, rng.randint(0, 10))
+            data_manager.add_user(replacement)
+            users[users.index(user)] = replacement
+        elif user.watched_movies and rng.random() < 0.3:
+            user.add_rating(rng.choice(list(user.watched_movies)), rng.randint(0, 10))
+        else:
+            user.add_rating(rng.randint(1, n_movies), rng.randint(0, 10))
+    return (time.perf_counter() - start) / n_writes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Готовые списки похожих пользователей против пересчёта")
+    parser.add_argument("--ratings", type=int, default=100000)
+    parser.add_argument("--max-neighbors", type=int, default=100, help="0 - без ограничения")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--writes", type=int, default=2000)
+    args = parser.parse_args()
+    max_neighbors = args.max_neighbors or None
+
+    with tempfile.TemporaryDirectory() as directory:
+        data_manager = DataManager(os.path.join(directory, "neighbors.json"))
+        generate(data_manager, args.ratings)
+        n_movies = len(data_manager.catalog)
+        rng = random.Random(5)
+        users = rng.sample(data_manager.get_all_users(), min(args.queries, len(data_manager.get_all_users())))
+
+        full = SimilarUserStrategy(data_manager)
+        index = UserNeighborIndex(data_manager, max_neighbors)
+        indexed = SimilarUserStrategy(data_manager, neighbor_index=index)
+
+        full_latencies = latencies(full, users)
+        cold = latencies(indexed, users) # первый запрос строит список
+        warm = latencies(indexed, users)
+        write_plain = random_writes(data_manager, args.writes, n_movies, rng) # списки уже обновляются
+        users = [data_manager.get_user(user.user_id) for user in users]
+        after_writes = latencies(indexed, users)
+
+        pick = lambda samples, q: sorted(samples)[min(len(samples) - 1, int(len(samples) * q))] * 1000
+        print(f"{'вариант':>24} {'p50, мс':>9} {'p99, мс':>9}")
+        for label, samples in [("полный пересчёт", full_latencies), ("списки, первый запрос", cold),
+                               ("списки, готовые", warm), ("списки после записей", after_writes)]:
+            print(f"{label:>24} {pick(samples, 0.5):>9.2f} {pick(samples, 0.99):>9.2f}")
+        print(f"запись оценки с обновлением списков: {write_plain * 1e6:.0f} мкс, "
+              f"пересчитано списков: {index.rebuilds}, в среднем соседей: "
+              f"{statistics.mean(len(index.neighbors(user)) for user in users):.1f}")
+
+
+if __name__ == "__main__":
+    main()
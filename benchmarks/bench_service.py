@@ -0,0 +1,133 @@
+# Нагрузочный тест HTTP-сервиса: много одновременных клиентов с keep-alive,
+# смесь запросов рекомендаций и оценок; печатает запросов в секунду и перцентили задержки
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import generate
+from recomandator3000 import DataManager
+
+STRATEGIES = ["genre", "rating", "similar"]
+
+
+class Client:
+    #одно keep-alive соединение
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, path: str, payload: dict):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode("utf-8")
+        self.writer.write(f"POST {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+                          f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if not line.strip():
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def worker(client: Client, n_users: int, n_movies: int, deadline: float, write_share: float,
+                 rng: random.Random, latencies, errors):
+    status, session = await client.request("/login", {"name": f"user{rng.randint(1, n_users)}",
+                                                      "password": "secret"})
+    if status != 200:
+        errors.append(status)
+        return
+    token = session["token"]
+    while time.perf_counter() < deadline:
+        if rng.random() < write_share:
+            path, payload = "/rate", {"token": token, "movie_id": rng.randint(1, n_movies),
+                                      "rating": rng.randint(0, 10)}
+        else:
+            path, payload = "/recommend", {"token": token, "strategy": rng.choice(STRATEGIES),
+                                           "min_rating": rng.choice([0, 7]), "max_results": 10}
+        start = time.perf_counter()
+        status, _ = await client.request(path, payload)
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            errors.append(status)
+
+
+async def load(host: str, port: int, args):
+    latencies, errors = [], []
+    clients = [Client(host, port) for _ in range(args.clients)]
+    start = time.perf_counter()
+    deadline = start + args.duration
+    await asyncio.gather(*(worker(client, args.users, args.movies, deadline, args.write_share,
+                                  random.Random(i), latencies, errors)
+                           for i, client in enumerate(clients)))
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        client.close()
+    return latencies, errors, elapsed
+
+
+def start_server(directory: str, args):
+    #сервис в отдельном процессе на синтетических данных; возвращает (процесс, порт)
+    path = os.path.join(directory, "service.json")
+    data_manager = DataManager(path)
+    generate(data_manager, args.ratings, n_movies=args.movies, n_users=args.users)
+    data_manager.close()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen([sys.executable, os.path.join(root, "recomandator3000.py"), "--data", path,
+                                "--item-index", os.path.join(directory, "items.bin"),
+                                "serve", "--port", "0"],
+                               stdout=subprocess.PIPE, text=True, cwd=directory)
+    line = process.stdout.readline() # "Сервис слушает http://127.0.0.1:<порт>"
+    return process, int(line.rsplit(":", 1)[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест HTTP-сервиса рекомендаций")
+    parser.add_argument("--url", help="уже запущенный сервис host:port (иначе поднимается свой)")
+    parser.add_argument("--clients", type=int, default=50, help="одновременных соединений")
+    parser.add_argument("--duration", type=float, default=10.0, help="секунд нагрузки")
+    parser.add_argument("--write-share", type=float, default=0.1, help="доля запросов-оценок")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--movies", type=int, default=500)
+    parser.add_argument("--ratings", type=int, default=40000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        process = None
+        if args.url:
+            host, port = args.url.rsplit(":", 1)
+            port = int(port)
+        else:
+            host = "127.0.0.1"
+            process, port = start_server(directory, args)
+        try:
+            latencies, errors, elapsed = asyncio.run(load(host, port, args))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000 if latencies else 0.0
+    print(f"запросов: {len(latencies)}, ошибок: {len(errors)}, за {elapsed:.1f} с")
+    print(f"{len(latencies) / elapsed:.0f} запросов/с, p50 {pick(0.5):.2f} мс, p99 {pick(0.99):.2f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# Бенчмарк холодного старта: время от запуска процесса до первого меню
+# при полной загрузке data.json и в ленивом режиме (индекс смещений + mmap)
+import argparse
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from recomandator3000 import JsonStorage
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROMPT = "Выберите действие:".encode("utf-8")
+
+
+def write_snapshot(path: str, n_users: int, ratings_per_user: int, n_movies: int = 25):
+    #снимок в старом виде (json.dump с отступами) пишется потоково, без объектов User в памяти
+    rng = random.Random(1)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{\n    "users": {')
+        for user_id in range(1, n_users + 1):
+            watched = ", ".join(f'"{movie_id}": {rng.randint(0, 10)}'
+                                for movie_id in rng.sample(range(1, n_movies + 1), ratings_per_user))
+            f.write(f'{"," if user_id > 1 else ""}\n        "{user_id}": {{\n'
+                    f'            "name": "user{user_id}",\n            "password": "secret",\n'
+                    f'            "watched": {{{watched}}},\n            "preferred_genres": []\n        }}')
+        f.write("\n    }\n}\n")
+
+
+def time_to_menu(path: str, lazy: bool):
+    #секунды до приглашения главного меню; затем выход через пункт меню
+    command = [sys.executable, os.path.join(ROOT, "recomandator3000.py"), "--data", path]
+    if lazy:
+        command.append("--lazy")
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=os.path.dirname(path))
+    output = b""
+    while PROMPT not in output:
+        chunk = os.read(process.stdout.fileno(), 65536)
+        if not chunk:
+            raise RuntimeError("приложение завершилось до меню")
+        output += chunk
+    elapsed = time.perf_counter() - start
+    process.communicate(b"8\n")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время до первого меню: полная загрузка против ленивой")
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--ratings-per-user", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "data.json")
+        start = time.perf_counter()
+        write_snapshot(path, args.users, args.ratings_per_user)
+        print(f"снимок: {args.users} пользователей, {os.path.getsize(path) / 2**20:.0f} МБ, "
+              f"{time.perf_counter() - start:.1f} с")
+
+        # индекс смещений строится один раз (здесь - в этом процессе), дальше только читается
+        start = time.perf_counter()
+        JsonStorage(path, lazy=True)
+        print(f"индекс смещений: {time.perf_counter() - start:.1f} с, "
+              f"{os.path.getsize(path + '.idx') / 2**20:.0f} МБ")
+
+        # ru_maxrss детей - максимум по всем завершённым, поэтому ленивый прогон идёт первым
+        lazy = time_to_menu(path, lazy=True)
+        lazy_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        full = time_to_menu(path, lazy=False)
+        full_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+        print(f"{'режим':>16} {'до меню, с':>11} {'пик RSS, МБ':>12}")
+        print(f"{'ленивый':>16} {lazy:>11.2f} {lazy_rss / 1024:>12.0f}")
+        print(f"{'полная загрузка':>16} {full:>11.2f} {full_rss / 1024:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# Набор бенчмарков на синтетических данных разного масштаба: задержка стратегий (перцентили),
+# время и пиковая память загрузки/сохранения, стоимость входа. Результат - JSON для сравнения версий
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.synthetic import generate
+from recomandator3000 import DataManager, GenreBasedStrategy, HybridStrategy, RatingBasedStrategy, SimilarUserStrategy
+
+STRATEGIES = {"genre": GenreBasedStrategy, "rating": RatingBasedStrategy, "similar": SimilarUserStrategy,
+              "hybrid": HybridStrategy}
+# запросы: (min_rating, min_year, max_results)
+QUERIES = [(0.0, 0, 10), (7.0, 0, 10), (0.0, 2000, 10), (7.5, 2010, 20)]
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000
+    return {"p50_ms": pick(0.5), "p90_ms": pick(0.9), "p99_ms": pick(0.99), "max_ms": ordered[-1] * 1000,
+            "count": len(ordered)}
+
+
+def timed(func, track_memory: bool):
+    #время вызова и (отдельным прогоном под tracemalloc) пиковая память
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    peak = None
+    if track_memory:
+        del result
+        tracemalloc.start()
+        result = func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, {"seconds": elapsed, "peak_bytes": peak}
+
+
+def bench_strategies(data_manager: DataManager, users, names):
+    results = {}
+    for name in names:
+        strategy = STRATEGIES[name](data_manager)
+        latencies = []
+        for user in users:
+            for min_rating, min_year, max_results in QUERIES:
+                start = time.perf_counter()
+                strategy.get_recommendations(user, min_rating, min_year, max_results)
+                latencies.append(time.perf_counter() - start)
+        results[name] = percentiles(latencies)
+    return results
+
+
+def bench_authenticate(data_manager: DataManager, n_users: int, repeats: int):
+    rng = random.Random(3)
+    names = [f"User{rng.randint(1, n_users)}" for _ in range(repeats)]
+    start = time.perf_counter()
+    for name in names:
+        data_manager.authenticate(name, "secret")
+    return {"mean_us": (time.perf_counter() - start) / repeats * 1e6, "count": repeats}
+
+
+def run_scale(directory: str, n_ratings: int, args):
+    path = os.path.join(directory, f"suite_{n_ratings}.{args.storage}")
+    data_manager = DataManager(path)
+    start = time.perf_counter()
+    count = generate(data_manager, n_ratings, alpha=args.alpha, seed=args.seed)
+    result = {"ratings": count, "movies": len(data_manager.catalog), "users": len(data_manager.get_all_users()),
+              "generate_seconds": time.perf_counter() - start}
+
+    _, result["save"] = timed(data_manager.save_to_file, args.memory)
+    data_manager.close()
+    del data_manager
+    data_manager, result["load"] = timed(lambda: DataManager(path), args.memory)
+
+    users = random.Random(args.seed).sample(data_manager.get_all_users(), min(args.queries, result["users"]))
+    result["strategies"] = bench_strategies(data_manager, users, args.strategies)
+    result["authenticate"] = bench_authenticate(data_manager, result["users"], args.auth_repeats)
+    data_manager.close()
+    return result
+
+
+def compare(baseline: dict, current: dict):
+    #относительное изменение времени относительно прошлого прогона (> 0 - медленнее)
+    print(f"{'оценок':>10} {'метрика':>22} {'было':>10} {'стало':>10} {'изм.':>8}", file=sys.stderr)
+    for scale, result in current["scales"].items():
+        old = baseline.get("scales", {}).get(scale)
+        if old is None:
+            continue
+        metrics = [("save, с", ("save", "seconds")), ("load, с", ("load", "seconds")),
+                   ("вход, мкс", ("authenticate", "mean_us"))]
+        metrics += [(f"{name} p99, мс", ("strategies", name, "p99_ms")) for name in result["strategies"]]
+        for label, path in metrics:
+            before, after = old, result
+            for key in path:
+                before = before.get(key, {}) if isinstance(before, dict) else None
+                after = after.get(key, {}) if isinstance(after, dict) else None
+            if isinstance(before, (int, float)) and isinstance(after, (int, float)) and before:
+                print(f"{scale:>10} {label:>22} {before:>10.3f} {after:>10.3f} {(after / before - 1) * 100:>7.1f}%",
+                      file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки на синтетических данных, результат в JSON")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="число оценок в наборе (до 10^7)")
+    parser.add_argument("--alpha", type=float, default=1.0, help="показатель степенного распределения")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--storage", choices=["json", "db"], default="json")
+    parser.add_argument("--strategies", nargs="+", choices=sorted(STRATEGIES), default=["genre", "rating", "similar", "hybrid"])
+    parser.add_argument("--queries", type=int, default=50, help="пользователей-запросов на стратегию")
+    parser.add_argument("--auth-repeats", type=int, default=10000)
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="не измерять пиковую память (без второго прогона под tracemalloc)")
+    parser.add_argument("--out", help="файл для JSON (по умолчанию stdout)")
+    parser.add_argument("--compare", help="JSON прошлого прогона: напечатать изменения в stderr")
+    args = parser.parse_args()
+
+    report = {"python": platform.python_version(), "platform": platform.platform(),
+              "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "params": vars(args), "scales": {}}
+    with tempfile.TemporaryDirectory() as directory:
+        for n_ratings in args.scales:
+            print(f"оценок: {n_ratings}...", file=sys.stderr, flush=True)
+            report["scales"][str(n_ratings)] = run_scale(directory, n_ratings, args)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# Микро-бенчмарк: сколько памяти выделяет сравнение двух пользователей
+# при копировании оценок на каждое обращение и при представлениях только для чтения
+import argparse
+import time
+import tracemalloc
+
+from recomandator3000 import SimilarUserStrategy, User
+
+
+class CopyingUser(User):
+    #старое поведение: копия словаря оценок при каждом обращении к свойству
+    copies = 0
+    copied_bytes = 0
+
+    @property
+    def watched_movies(self):
+        copy = dict(self._watched_movies)
+        CopyingUser.copies += 1
+        CopyingUser.copied_bytes += copy.__sizeof__()
+        return copy
+
+
+def legacy_similarity(user1: User, user2: User):
+    #прежний цикл: свойство читается заново для каждого общего фильма
+    common = set(user1.watched_movies.keys()) & set(user2.watched_movies.keys())
+    if not common:
+        return 0.0
+    total_diff = 0.0
+    for movie_id in common:
+        total_diff += abs(user1.watched_movies[movie_id] - user2.watched_movies[movie_id])
+    return max(0.0, 1.0 - (total_diff / len(common)) / 10)
+
+
+def make_pair(user_cls, n_ratings: int):
+    user1 = user_cls(1, "a", "p")
+    user2 = user_cls(2, "b", "p")
+    for movie_id in range(n_ratings):
+        user1.add_rating(movie_id, movie_id % 11)
+        user2.add_rating(movie_id, (movie_id * 7) % 11)
+    return user1, user2
+
+
+def measure(user_cls, similarity, n_ratings: int):
+    user1, user2 = make_pair(user_cls, n_ratings)
+    CopyingUser.copies = CopyingUser.copied_bytes = 0
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    similarity(user1, user2)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, CopyingUser.copied_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Копии словарей против представлений")
+    parser.add_argument("--ratings", type=int, nargs="+", default=[1000, 2000, 5000])
+    args = parser.parse_args()
+
+    view_similarity = SimilarUserStrategy(None)._calculate_similarity
+    print(f"{'оценок':>8} {'копии, мс':>10} {'выделено копиями, МБ':>22} {'view, мс':>10} {'пик view, КБ':>13}")
+    for n in args.ratings:
+        copy_time, _, copied = measure(CopyingUser, legacy_similarity, n)
+        view_time, view_peak, _ = measure(User, view_similarity, n)
+        print(f"{n:>8} {copy_time * 1000:>10.1f} {copied / 2**20:>22.1f} "
+              f"{view_time * 1000:>10.1f} {view_peak / 1024:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
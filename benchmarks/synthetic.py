@@ -0,0 +1,78 @@
+# Генератор синтетических данных: каталог, пользователи и оценки
+# со степенным распределением (популярность фильмов и активность пользователей по закону Ципфа)
+import itertools
+import random
+
+from recomandator3000 import DataManager, Genre, Movie, User
+
+
+def zipf_weights(n: int, alpha: float):
+    #накопленные веса 1/rank^alpha для random.choices
+    return list(itertools.accumulate(1.0 / rank ** alpha for rank in range(1, n + 1)))
+
+
+def default_shape(n_ratings: int):
+    #размеры по числу оценок: в среднем ~20 оценок на пользователя и ~100 на фильм
+    return max(50, n_ratings // 100), max(10, n_ratings // 20)
+
+
+def user_activity(n_users: int, n_ratings: int, alpha: float, cap: int, rng: random.Random):
+    #число оценок каждого пользователя: степенной закон, в сумме ~n_ratings, от 1 до cap;
+    #срезанный у самых активных избыток делится между остальными
+    weights = [1.0 / rank ** alpha for rank in range(1, n_users + 1)]
+    counts = [0] * n_users
+    open_users = list(range(n_users))
+    remaining = n_ratings
+    while open_users and remaining > 0:
+        total = sum(weights[i] for i in open_users)
+        capped = [i for i in open_users if remaining * weights[i] / total >= cap]
+        if not capped:
+            for i in open_users:
+                counts[i] = round(remaining * weights[i] / total)
+            break
+        for i in capped:
+            counts[i] = cap
+        remaining -= cap * len(capped)
+        open_users = [i for i in open_users if counts[i] < cap]
+    rng.shuffle(counts)
+    return [max(1, min(cap, count)) for count in counts]
+
+
+def generate(data_manager: DataManager, n_ratings: int, n_movies: int = 0, n_users: int = 0,
+             alpha: float = 1.0, seed: int = 1):
+    #заполняет data_manager каталогом и пользователями; возвращает число оценок
+    default_movies, default_users = default_shape(n_ratings)
+    n_movies = n_movies or default_movies
+    n_users = n_users or default_users
+    rng = random.Random(seed)
+    genres = list(Genre)
+    directors = [f"Режиссёр {i}" for i in range(1, max(2, n_movies // 10))]
+
+    # у фильма "качество": от него зависят и рейтинг каталога, и оценки пользователей
+    quality = [rng.uniform(3.0, 9.5) for _ in range(n_movies)]
+    popularity = list(range(1, n_movies + 1))
+    rng.shuffle(popularity) # популярность не связана с id
+    cum_weights = zipf_weights(n_movies, alpha)
+    count = 0
+
+    with data_manager.bulk_update():
+        data_manager.clear_movies()
+        for movie_id in range(1, n_movies + 1):
+            data_manager.add_movie(Movie(movie_id, f"Фильм {movie_id}", rng.sample(genres, rng.randint(1, 3)),
+                                         rng.choice(directors), rng.randint(1950, 2024),
+                                         round(quality[movie_id - 1], 1)))
+        activity = user_activity(n_users, n_ratings, alpha, max(1, n_movies // 2), rng)
+        for user_id, n_user_ratings in enumerate(activity, start=1):
+            user = User(user_id, f"user{user_id}", "secret")
+            # выборка без повторов: добираем, пока не наберётся нужное число разных фильмов
+            chosen = set()
+            while len(chosen) < n_user_ratings:
+                chosen.update(rng.choices(popularity, cum_weights=cum_weights, k=n_user_ratings - len(chosen)))
+            for movie_id in chosen:
+                rating = round(quality[movie_id - 1] + rng.gauss(0, 1.5))
+                user.add_rating(movie_id, min(10, max(0, rating)))
+                count += 1
+            if rng.random() < 0.5:
+                user.set_preferred_genres(rng.sample(genres, rng.randint(1, 3)))
+            data_manager.add_user(user)
+    return count
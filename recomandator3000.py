@@ -1,8 +1,168 @@
 from enum import Enum
-from abc import ABC, abstractclassmethod
+from abc import ABC, abstractclassmethod, abstractmethod
 from typing import List, Dict, Optional
+from types import MappingProxyType
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from array import array
+import argparse
+import asyncio
+import atexit
+import bisect
+import concurrent.futures
+import cProfile
+import csv
+import functools
+import hashlib
+import heapq
+import itertools
 import json
+import mmap
+import multiprocessing
 import os
+import pstats
+import queue
+import random
+import re
+import secrets
+import signal
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import warnings
+
+try:
+    import numpy as np
+except ImportError: # numpy нужен только для матричной факторизации
+    np = None
+
+
+# общие часы версий: каждое изменение получает новый номер, номера не повторяются
+_version_clock = itertools.count(1)
+
+
+# Инструментирование горячих путей: таймеры, счётчики и выборочный cProfile.
+# Пока сбор выключен, обёртка стоит одну проверку флага
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self.profile_rate = 0.0 # доля вызовов, которые выполняются под cProfile
+        self._lock = threading.Lock() # замеры приходят и из потоков сервиса
+        self.reset()
+
+    def reset(self):
+        self._timers: Dict[str, List[float]] = {} # имя -> [число вызовов, сумма секунд, максимум]
+        self._counters: Dict[str, int] = {}
+        self._profile = None # накопленные pstats.Stats по выборке вызовов
+        self._profiling = False
+
+    def start(self):
+        #начало замера фазы внутри функции; при выключенном сборе - 0
+        return time.perf_counter() if self.enabled else 0.0
+
+    def stop(self, name: str, started: float):
+        if self.enabled and started:
+            self.observe(name, time.perf_counter() - started)
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            timer = self._timers.get(name)
+            if timer is None:
+                self._timers[name] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                if seconds > timer[2]:
+                    timer[2] = seconds
+
+    def count(self, name: str, value: int = 1):
+        if self.enabled:
+            with self._lock:
+                self._counters[name] = self._counters.get(name, 0) + value
+
+    def call(self, name: str, func, args, kwargs):
+        #замер одного вызова; часть вызовов (profile_rate) идёт под cProfile
+        profiler = None
+        if self.profile_rate and random.random() < self.profile_rate:
+            with self._lock: # cProfile не вкладывается: одна выборка за раз на весь процесс
+                if not self._profiling:
+                    profiler = cProfile.Profile()
+                    self._profiling = True
+        started = time.perf_counter()
+        try:
+            if profiler is not None:
+                return profiler.runcall(func, *args, **kwargs)
+            return func(*args, **kwargs)
+        finally:
+            self.observe(name, time.perf_counter() - started)
+            if profiler is not None:
+                with self._lock:
+                    self._profiling = False
+                    if self._profile is None:
+                        self._profile = pstats.Stats(profiler)
+                    else:
+                        self._profile.add(profiler)
+
+    def profile_rows(self, limit: int = 20):
+        #самые дорогие функции выборки по накопленному времени
+        if self._profile is None:
+            return []
+        rows = []
+        for (filename, line, function), (_, calls, total, cumulative, _) in self._profile.stats.items():
+            rows.append({"function": f"{os.path.basename(filename)}:{line}({function})", "calls": calls,
+                         "total_seconds": total, "cumulative_seconds": cumulative})
+        rows.sort(key=lambda row: row["cumulative_seconds"], reverse=True)
+        return rows[:limit]
+
+    def snapshot(self):
+        return {
+            "timers": {name: {"count": count, "total_seconds": total, "mean_ms": total / count * 1000,
+                              "max_ms": maximum * 1000}
+                       for name, (count, total, maximum) in sorted(self._timers.items())},
+            "counters": dict(sorted(self._counters.items())),
+            "profile": self.profile_rows(),
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self):
+        #текстовый формат экспозиции Prometheus
+        lines = ["# HELP recomandator_seconds Время вызовов инструментированных функций",
+                 "# TYPE recomandator_seconds summary"]
+        for name, (count, total, _) in sorted(self._timers.items()):
+            lines.append(f'recomandator_seconds_count{{name="{name}"}} {count}')
+            lines.append(f'recomandator_seconds_sum{{name="{name}"}} {total:.9f}')
+        lines += ["# HELP recomandator_seconds_max Самый долгий вызов", "# TYPE recomandator_seconds_max gauge"]
+        for name, (_, _, maximum) in sorted(self._timers.items()):
+            lines.append(f'recomandator_seconds_max{{name="{name}"}} {maximum:.9f}')
+        lines += ["# HELP recomandator_events_total Счётчики событий", "# TYPE recomandator_events_total counter"]
+        for name, value in sorted(self._counters.items()):
+            lines.append(f'recomandator_events_total{{name="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+        #формат по расширению: .prom/.txt - Prometheus, иначе JSON
+        text = self.to_prometheus() if path.endswith((".prom", ".txt")) else self.to_json()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+metrics = Metrics()
+
+
+def instrumented(name: str):
+    #декоратор: время каждого вызова попадает в таймер name, если сбор включён
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return func(*args, **kwargs)
+            return metrics.call(name, func, args, kwargs)
+        return wrapper
+    return decorator
 
 
 # Перечисление жанров
@@ -19,6 +179,7 @@ class Genre(Enum):
     ANIMATION = "Мультфильм"
 
 class Movie:
+    __slots__ = ("_movie_id", "_title", "_genres", "_director", "_year", "_rating")
 
     def __init__(self, movie_id: int, title: str, genres: List[Genre],
                  director: str, year: int, rating: float):
@@ -60,14 +221,150 @@ class Movie:
     def __repr__(self):
         return f"Movie(id={self._movie_id}, title='{self._title}')"
 
+# Каталог по столбцам: вместо объекта Movie на каждый фильм - массивы array
+# (id, год, рейтинг, номер набора жанров); Movie собирается только при выдаче наружу
+class MovieCatalog:
+    MAX_ID = 2 ** 31 - 1 # id хранятся в array("i") и в таблице соседей как int32
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._ids = array("i")
+        self._years = array("i")
+        self._ratings = array("d")
+        self._genre_sets = array("I") # номер в пуле наборов жанров
+        self._titles: List[str] = []
+        self._directors = array("I") # номер строки в пуле режиссёров
+        self._strings: List[str] = [] # пул интернированных строк: режиссёры повторяются
+        self._string_ids: Dict[str, int] = {}
+        # id фильма -> номер строки в столбцах: массив по id (-1 - фильма нет), пока id плотные;
+        # если массив пришлось бы растить сильно больше числа фильмов - словарь
+        self._rows = array("i")
+        self._dense = True
+        # пул наборов жанров: сочетаний немного, порядок жанров сохраняется
+        self._genre_pool: List[tuple] = []
+        self._genre_pool_ids: Dict[tuple, int] = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, movie_id: int):
+        return self._row(movie_id) >= 0
+
+    def _row(self, movie_id: int):
+        if self._dense:
+            if 0 <= movie_id < len(self._rows):
+                return self._rows[movie_id]
+            return -1
+        return self._rows.get(movie_id, -1)
+
+    def _intern(self, value: str):
+        string_id = self._string_ids.get(value)
+        if string_id is None:
+            string_id = self._string_ids[value] = len(self._strings)
+            self._strings.append(sys.intern(value))
+        return string_id
+
+    def _intern_genres(self, genres):
+        genres = tuple(genres)
+        genre_set = self._genre_pool_ids.get(genres)
+        if genre_set is None:
+            genre_set = self._genre_pool_ids[genres] = len(self._genre_pool)
+            self._genre_pool.append(genres)
+        return genre_set
+
+    def add(self, movie: Movie):
+        #добавляет или заменяет фильм; возвращает прежние (рейтинг, год, жанры) или None
+        movie_id = movie.movie_id
+        if not 0 <= movie_id <= self.MAX_ID:
+            raise ValueError(f"Некорректный id фильма: {movie_id}")
+        genre_set = self._intern_genres(movie.genres)
+        row = self._row(movie_id)
+        if row >= 0:
+            old = (self._ratings[row], self._years[row], self._genre_pool[self._genre_sets[row]])
+            self._years[row] = movie.year
+            self._ratings[row] = movie.rating
+            self._genre_sets[row] = genre_set
+            self._titles[row] = movie.title
+            self._directors[row] = self._intern(movie.director)
+            return old
+
+        if self._dense and movie_id >= len(self._rows):
+            size = max(movie_id + 1, 2 * len(self._rows))
+            if size <= 4 * len(self._ids) + 1024:
+                self._rows.extend(itertools.repeat(-1, size - len(self._rows)))
+            else:
+                self._rows = {row_id: row for row, row_id in enumerate(self._ids)}
+                self._dense = False
+        self._rows[movie_id] = len(self._ids)
+        self._ids.append(movie_id)
+        self._years.append(movie.year)
+        self._ratings.append(movie.rating)
+        self._genre_sets.append(genre_set)
+        self._titles.append(movie.title)
+        self._directors.append(self._intern(movie.director))
+        return None
+
+    def get(self, movie_id: int):
+        row = self._row(movie_id)
+        return self._movie(row) if row >= 0 else None
+
+    def _movie(self, row: int):
+        return Movie(self._ids[row], self._titles[row], list(self._genre_pool[self._genre_sets[row]]),
+                     self._strings[self._directors[row]], self._years[row], self._ratings[row])
+
+    # быстрые поля без создания Movie; для отсутствующего фильма - None
+    def rating(self, movie_id: int):
+        row = self._row(movie_id)
+        return self._ratings[row] if row >= 0 else None
+
+    def year(self, movie_id: int):
+        row = self._row(movie_id)
+        return self._years[row] if row >= 0 else None
+
+    def genres(self, movie_id: int):
+        row = self._row(movie_id)
+        return self._genre_pool[self._genre_sets[row]] if row >= 0 else None
+
+    def passes(self, movie_id: int, min_rating: float = 0.0, min_year: int = 0):
+        #фильм есть в каталоге и проходит фильтры по рейтингу и году
+        row = self._row(movie_id)
+        return row >= 0 and self._ratings[row] >= min_rating and self._years[row] >= min_year
+
+    def ids(self):
+        return iter(self._ids)
+
+    def entries(self):
+        #(id, год, рейтинг, жанры) всех фильмов в порядке добавления
+        return zip(self._ids, self._years, self._ratings, map(self._genre_pool.__getitem__, self._genre_sets))
+
+    def movies(self):
+        return (self._movie(row) for row in range(len(self._ids)))
+
+    def max_id(self):
+        return max(self._ids, default=0)
+
+    def nbytes(self):
+        #память столбцов без учёта строк (у словаря id -> строка - без самих чисел)
+        columns = (self._ids, self._years, self._ratings, self._genre_sets, self._directors)
+        size = sum(column.buffer_info()[1] * column.itemsize for column in columns)
+        if self._dense:
+            return size + self._rows.buffer_info()[1] * self._rows.itemsize
+        return size + sys.getsizeof(self._rows)
+
 # Класс Пользователь
 class User:
+    __slots__ = ("_user_id", "_name", "_password", "_watched_movies", "_preferred_genres", "_owner", "_version")
+
     def __init__(self, user_id: int, name: str, password: str):
         self._user_id = user_id
         self._name = name
         self._password = password
         self._watched_movies: Dict[int, float] = {} #словарь из id фильма и оценки
-        self._preferred_genres: List[Genre] = []
+        self._preferred_genres: tuple = ()
+        self._owner = None #DataManager, в который добавлен пользователь (нужен для индексов)
+        self._version = next(_version_clock) #меняется при каждой оценке и смене жанров
 
     @property
     def user_id(self):
@@ -77,27 +374,46 @@ class User:
     def name(self):
         return self._name
 
+    # представления только для чтения, без копирования на каждое обращение
     @property
     def watched_movies(self):
-        return self._watched_movies.copy()
+        return MappingProxyType(self._watched_movies)
 
     @property
     def preferred_genres(self):
-        return self._preferred_genres.copy()
+        return self._preferred_genres
+
+    @property
+    def version(self):
+        return self._version
 
     def check_password(self, password: str):
-        #проверка пароля
-        return self._password == password
+        #проверка пароля; с пустым паролем (импортированные пользователи) войти нельзя
+        return bool(self._password) and self._password == password
 
     def add_rating(self, movie_id: int, rating: float):
         #оценка фильма
         if 0 <= rating <= 10:
-            self._watched_movies[movie_id] = rating
+            owner = self._owner
+            if owner is None: # пользователь ещё не добавлен - блокировать нечего
+                self._watched_movies[movie_id] = rating
+                self._version = next(_version_clock)
+                return
+            # читатели не должны увидеть словарь оценок посреди изменения
+            with owner.writing():
+                old_rating = self._watched_movies.get(movie_id)
+                self._watched_movies[movie_id] = rating
+                self._version = next(_version_clock)
+                owner._on_rating(self, movie_id, rating, old_rating)
         else:
             print("Оценка должна быть от 0 до 10!")
 
     def set_preferred_genres(self, genres: List[Genre]):
-        self._preferred_genres = genres
+        with self._owner.writing() if self._owner is not None else nullcontext():
+            self._preferred_genres = tuple(genres)
+            self._version = next(_version_clock)
+            if self._owner is not None:
+                self._owner._on_preferences(self)
 
     def has_watched(self, movie_id: int):
         return movie_id in self._watched_movies
@@ -108,94 +424,1088 @@ class User:
     def __repr__(self):
         return f"User(id={self._user_id}, name='{self._name}')"
 
+def name_key(name: str):
+    #имена пользователей сравниваются без учёта регистра
+    return name.casefold()
+
+
+_GENRES_BY_VALUE = {genre.value: genre for genre in Genre}
+
+
+def parse_genres(values):
+    #названия жанров -> Genre, неизвестные пропускаем
+    return [_GENRES_BY_VALUE[g] for g in values if g in _GENRES_BY_VALUE]
+
+
+# Хранилища данных под DataManager
+class Storage(ABC):
+    lazy = False #True - пользователи читаются из хранилища по одному, по запросу
+
+    def exists(self):
+        #есть ли уже сохранённые данные
+        return True
+
+    @abstractmethod
+    def load(self, data_manager):
+        #загрузка всех пользователей в data_manager через add_user
+        pass
+
+    @abstractmethod
+    def save(self, data_manager):
+        #полный снимок всех пользователей
+        pass
+
+    @abstractmethod
+    def add_user(self, user: User):
+        pass
+
+    @abstractmethod
+    def add_rating(self, user: User, movie_id: int, rating: float):
+        pass
+
+    def add_ratings(self, records):
+        #пакет оценок [(пользователь, id фильма, оценка)]; по умолчанию - по одной
+        for user, movie_id, rating in records:
+            self.add_rating(user, movie_id, rating)
+
+    @abstractmethod
+    def set_preferences(self, user: User):
+        pass
+
+    def load_movies(self):
+        #сохранённый каталог; пустой список - каталога в хранилище нет
+        return []
+
+    def save_movies(self, movies: List[Movie]):
+        pass
+
+    # индексированные запросы ленивых хранилищ; None - хранилище так не умеет
+    def find_user_id(self, name: str):
+        return None
+
+    def load_user(self, user_id: int):
+        return None
+
+    def movie_ratings(self, movie_id: int):
+        return None
+
+    def max_user_id(self):
+        return None
+
+    def flush(self):
+        pass
+
+    def compact(self, data_manager):
+        pass
+
+    def close(self, data_manager):
+        self.flush()
+
+
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+# JSON-снимок + журнал изменений.
+# В ленивом режиме рядом со снимком лежит индекс смещений (id/имя -> байты записи в снимке):
+# пользователи читаются из снимка по одному через mmap, журнал проигрывается для каждого отдельно
+class JsonStorage(Storage):
+    JOURNAL_FSYNC_BATCH = 32 # fsync журнала раз в столько записей
+    JOURNAL_COMPACT_SIZE = 1024 * 1024 # при таком размере журнала после загрузки делаем снимок
+    INDEX_HEADER = struct.Struct("<4sQQIq") # метка, размер и mtime снимка, число пользователей, макс. id
+    INDEX_BY_ID = struct.Struct("<qQI") # id, смещение и длина записи в снимке; по возрастанию id
+    INDEX_BY_NAME = struct.Struct("<Qq") # хэш имени, id; по возрастанию хэша
+    INDEX_MAGIC = b"UIX1"
+
+    def __init__(self, filename="data.json", lazy: bool = False):
+        self.filename = filename
+        # журнал изменений: каждая строка - одна запись JSON, дописывается в конец
+        self.journal_filename = filename + ".journal"
+        # каталог фильмов (если импортирован): одна строка JSON на фильм
+        self.movies_filename = os.path.splitext(filename)[0] + ".movies.jsonl"
+        self.index_filename = filename + ".idx"
+        self._journal = None
+        self._unsynced = 0
+        self._snapshot = None # mmap снимка
+        self._index = None # mmap индекса смещений
+        self._index_count = 0
+        self._index_max_id = 0
+        self._pending: Dict[int, List[dict]] = {} # записи журнала по пользователям, ещё не применённые
+        self._pending_names: Dict[str, int] = {} # пользователи, созданные в журнале
+        self.lazy = lazy and self._open_lazy()
+
+    def exists(self):
+        return os.path.exists(self.filename) or os.path.exists(self.journal_filename)
+
+    def load_movies(self):
+        if not os.path.exists(self.movies_filename):
+            return []
+        movies = []
+        with open(self.movies_filename, "r", encoding="utf-8") as f:
+            for line in f:
+                m = json.loads(line)
+                movies.append(Movie(m["id"], m["title"], parse_genres(m["genres"]), m["director"],
+                                    m["year"], m["rating"]))
+        return movies
+
+    def save_movies(self, movies: List[Movie]):
+        tmp_filename = self.movies_filename + ".tmp"
+        with open(tmp_filename, "w", encoding="utf-8") as f:
+            for m in movies:
+                f.write(json.dumps({"id": m.movie_id, "title": m.title, "genres": [g.value for g in m.genres],
+                                    "director": m.director, "year": m.year, "rating": m.rating},
+                                   ensure_ascii=False) + "\n")
+        os.replace(tmp_filename, self.movies_filename)
+
+    @staticmethod
+    def _user_to_dict(user: User):
+        return {
+            "name": user.name,
+            "password": user._password,
+            "watched": dict(user.watched_movies),
+            "preferred_genres": [g.value for g in user.preferred_genres],
+        }
+
+    @staticmethod
+    def _user_from_dict(uid: int, u: dict):
+        user = User(uid, u.get("name", ""), u.get("password", ""))
+        watched = u.get("watched", {})
+        for movie_id_str, rating in watched.items():
+            try:
+                mid = int(movie_id_str)
+                user.add_rating(mid, rating)
+            except ValueError:
+                continue
+        user.set_preferred_genres(parse_genres(u.get("preferred_genres", [])))
+        return user
+
+    #сохранение пользователей (полный снимок)
+    def save(self, data_manager):
+        # обычный JSON, но каждый пользователь - одна строка: смещения записей сразу идут в индекс
+        entries = [] # (id, смещение, длина, имя)
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, "wb") as f:
+            offset = f.write(b'{\n    "users": {')
+            separator = b"\n"
+            for user in data_manager.get_all_users():
+                prefix = separator + f'        "{user.user_id}": '.encode("utf-8")
+                record = json.dumps(self._user_to_dict(user), ensure_ascii=False).encode("utf-8")
+                entries.append((user.user_id, offset + len(prefix), len(record), user.name))
+                offset += f.write(prefix + record)
+                separator = b",\n"
+            f.write(b"\n    }\n}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        # пишем во временный файл и атомарно подменяем, чтобы сбой не испортил снимок
+        self._unmap()
+        os.replace(tmp_filename, self.filename)
+        if self.lazy:
+            self._write_index(entries)
+            self._map()
+            self._pending.clear()
+            self._pending_names.clear()
+
+        # снимок содержит всё из журнала - журнал больше не нужен
+        self.flush()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if os.path.exists(self.journal_filename):
+            os.remove(self.journal_filename)
+
+    #загрузка: снимок + проигрывание журнала поверх него
+    def load(self, data_manager):
+        if self.lazy:
+            # все пользователи по индексу; уже загруженные по одному не трогаем
+            user_ids = [entry[0] for entry in self.INDEX_BY_ID.iter_unpack(
+                self._index[self._by_id_start:self._by_name_start])]
+            for user_id in itertools.chain(user_ids, self._pending):
+                if user_id not in data_manager._users:
+                    user = self.load_user(user_id)
+                    if user is not None:
+                        data_manager.add_user(user)
+            return
+
+        if os.path.exists(self.filename):
+            with open(self.filename, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        else:
+            data = {}
+
+        users_data = data.get("users", {})
+        for user_id_str, u in users_data.items():
+            try:
+                uid = int(user_id_str)
+            except ValueError:
+                continue
+            data_manager.add_user(self._user_from_dict(uid, u))
+
+        if os.path.exists(self.journal_filename):
+            self._replay_journal(data_manager)
+            if os.path.getsize(self.journal_filename) >= self.JOURNAL_COMPACT_SIZE:
+                self.compact(data_manager)
+
+    def _journal_records(self):
+        valid_end = 0
+        with open(self.journal_filename, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError
+                    record = json.loads(line)
+                except ValueError:
+                    break # недописанная запись после сбоя - дальше ничего нет
+                valid_end += len(line)
+                yield record
+
+        # отрезаем хвост, чтобы новые записи не склеились с обрывком
+        if valid_end < os.path.getsize(self.journal_filename):
+            with open(self.journal_filename, "r+b") as f:
+                f.truncate(valid_end)
+
+    def _replay_journal(self, data_manager):
+        for record in self._journal_records():
+            self._apply_journal_record(data_manager, record)
+
+    def _apply_journal_record(self, data_manager, record: dict):
+        if record.get("op") == "user":
+            data_manager.add_user(self._user_from_dict(record["user"], record))
+            return
+        user = data_manager.get_user(record.get("user"))
+        if user is not None:
+            self._apply_to_user(user, record)
+
+    @staticmethod
+    def _apply_to_user(user: User, record: dict):
+        op = record.get("op")
+        if op == "rate":
+            user.add_rating(record["movie"], record["rating"])
+        elif op == "prefs":
+            user.set_preferred_genres(parse_genres(record["genres"]))
+
+    # ленивый режим: индекс смещений и чтение пользователей по одному
+    @staticmethod
+    def _name_hash(name: str):
+        return int.from_bytes(hashlib.blake2b(name_key(name).encode("utf-8"), digest_size=8).digest(), "little")
+
+    def _open_lazy(self):
+        #True, если снимок можно читать по индексу; индекс строится заново, если его нет или он устарел
+        if not os.path.exists(self.filename):
+            return False
+        if (os.path.exists(self.journal_filename)
+                and os.path.getsize(self.journal_filename) >= self.JOURNAL_COMPACT_SIZE):
+            return False # большой журнал всё равно сворачивается полной загрузкой
+        try:
+            if not self._index_matches():
+                self._write_index(self._scan_snapshot())
+            self._map()
+        except (OSError, ValueError, IndexError, AttributeError, struct.error):
+            self._unmap() # снимок не разобрать по частям - читаем целиком, как обычно
+            return False
+
+        if os.path.exists(self.journal_filename):
+            for record in self._journal_records():
+                user_id = record.get("user")
+                if record.get("op") == "user": # запись пользователя целиком заменяет всё прежнее
+                    self._pending[user_id] = [record]
+                    self._pending_names[name_key(record.get("name", ""))] = user_id
+                else:
+                    self._pending.setdefault(user_id, []).append(record)
+        return True
+
+    def _index_matches(self):
+        if not os.path.exists(self.index_filename):
+            return False
+        stat = os.stat(self.filename)
+        with open(self.index_filename, "rb") as f:
+            header = f.read(self.INDEX_HEADER.size)
+        if len(header) < self.INDEX_HEADER.size:
+            return False
+        magic, size, mtime, _, _ = self.INDEX_HEADER.unpack(header)
+        return magic == self.INDEX_MAGIC and size == stat.st_size and mtime == stat.st_mtime_ns
+
+    def _scan_snapshot(self):
+        #смещения пользователей в снимке любого вида (в т.ч. с отступами) за один проход.
+        #latin-1: один символ - один байт, так что позиции в строке совпадают со смещениями в файле
+        with open(self.filename, "rb") as f:
+            text = f.read().decode("latin-1")
+        decoder = json.JSONDecoder()
+        skip = lambda pos: _JSON_WHITESPACE.match(text, pos).end()
+
+        def object_start(pos):
+            pos = skip(pos)
+            if text[pos] != "{":
+                raise ValueError("ожидался объект")
+            return skip(pos + 1)
+
+        def member_key(pos):
+            key, pos = decoder.raw_decode(text, pos)
+            pos = skip(pos)
+            if text[pos] != ":":
+                raise ValueError("ожидалось ':'")
+            return key, skip(pos + 1)
+
+        def next_member(pos):
+            #позиция следующего ключа; None - объект закончился
+            pos = skip(pos)
+            if text[pos] == ",":
+                return skip(pos + 1)
+            if text[pos] == "}":
+                return None
+            raise ValueError("ожидалось ',' или '}'")
+
+        entries = []
+        pos = object_start(0)
+        while pos is not None and text[pos] != "}":
+            key, pos = member_key(pos)
+            if key != "users":
+                pos = next_member(decoder.raw_decode(text, pos)[1])
+                continue
+            pos = object_start(pos)
+            while pos is not None and text[pos] != "}":
+                user_id, pos = member_key(pos)
+                value, end = decoder.raw_decode(text, pos)
+                name = value.get("name", "")
+                try:
+                    name = name.encode("latin-1").decode("utf-8")
+                except (UnicodeEncodeError, UnicodeDecodeError):
+                    pass # имя было записано через \u-escape и уже раскодировано
+                entries.append((int(user_id), pos, end - pos, name))
+                pos = next_member(end)
+            break
+        return entries
+
+    def _write_index(self, entries):
+        stat = os.stat(self.filename)
+        entries.sort()
+        by_name = sorted((self._name_hash(name), user_id) for user_id, _, _, name in entries)
+        tmp_filename = self.index_filename + ".tmp"
+        with open(tmp_filename, "wb") as f:
+            f.write(self.INDEX_HEADER.pack(self.INDEX_MAGIC, stat.st_size, stat.st_mtime_ns, len(entries),
+                                           max((entry[0] for entry in entries), default=0)))
+            f.write(b"".join(self.INDEX_BY_ID.pack(user_id, offset, length)
+                             for user_id, offset, length, _ in entries))
+            f.write(b"".join(self.INDEX_BY_NAME.pack(name_hash, user_id) for name_hash, user_id in by_name))
+        os.replace(tmp_filename, self.index_filename)
+
+    def _map(self):
+        with open(self.index_filename, "rb") as f:
+            self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _, _, _, self._index_count, self._index_max_id = self.INDEX_HEADER.unpack_from(self._index)
+        self._by_id_start = self.INDEX_HEADER.size
+        self._by_name_start = self._by_id_start + self._index_count * self.INDEX_BY_ID.size
+        with open(self.filename, "rb") as f:
+            self._snapshot = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _unmap(self):
+        for mapped in (self._index, self._snapshot):
+            if mapped is not None:
+                mapped.close()
+        self._index = self._snapshot = None
+
+    def _search(self, start: int, record: struct.Struct, key: int):
+        #первая запись отсортированного раздела индекса, у которой первое поле >= key
+        lo, hi = 0, self._index_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if record.unpack_from(self._index, start + mid * record.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _read_user(self, user_id: int):
+        #пользователь из снимка по индексу; None - если в снимке его нет
+        i = self._search(self._by_id_start, self.INDEX_BY_ID, user_id)
+        if i == self._index_count:
+            return None
+        found_id, offset, length = self.INDEX_BY_ID.unpack_from(
+            self._index, self._by_id_start + i * self.INDEX_BY_ID.size)
+        if found_id != user_id:
+            return None
+        return self._user_from_dict(user_id, json.loads(self._snapshot[offset:offset + length]))
+
+    def load_user(self, user_id: int):
+        if not self.lazy:
+            return None
+        records = self._pending.get(user_id, ())
+        if records and records[0]["op"] == "user":
+            user = self._user_from_dict(user_id, records[0])
+            records = records[1:]
+        else:
+            user = self._read_user(user_id)
+        if user is None:
+            return None
+        for record in records:
+            self._apply_to_user(user, record)
+        return user
+
+    def find_user_id(self, name: str):
+        if not self.lazy:
+            return None
+        key = name_key(name)
+        if key in self._pending_names:
+            return self._pending_names[key]
+        name_hash = self._name_hash(name)
+        i = self._search(self._by_name_start, self.INDEX_BY_NAME, name_hash)
+        while i < self._index_count:
+            found_hash, user_id = self.INDEX_BY_NAME.unpack_from(
+                self._index, self._by_name_start + i * self.INDEX_BY_NAME.size)
+            if found_hash != name_hash:
+                break
+            user = self._read_user(user_id) # у хэша бывают совпадения - сверяем само имя
+            if user is not None and name_key(user.name) == key:
+                return user_id
+            i += 1
+        return None
+
+    def max_user_id(self):
+        if not self.lazy:
+            return None
+        return max(self._index_max_id, max(self._pending, default=0))
+
+    def _append_journal(self, record: dict):
+        if self._journal is None:
+            self._journal = open(self.journal_filename, "a", encoding="utf-8")
+        self._journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.JOURNAL_FSYNC_BATCH:
+            self.flush()
+
+    def add_user(self, user: User):
+        self._append_journal({"op": "user", "user": user.user_id, **self._user_to_dict(user)})
+
+    def add_rating(self, user: User, movie_id: int, rating: float):
+        self._append_journal({"op": "rate", "user": user.user_id, "movie": movie_id, "rating": rating})
+
+    def add_ratings(self, records):
+        #весь пакет - одной записью в файл журнала; строки те же, что у add_rating,
+        #но собираются форматированием: в записи только числа, json.dumps на каждую не нужен
+        if self._journal is None:
+            self._journal = open(self.journal_filename, "a", encoding="utf-8")
+        self._journal.write("".join(
+            f'{{"op": "rate", "user": {user.user_id:d}, "movie": {movie_id:d}, "rating": {float(rating)!r}}}\n'
+            for user, movie_id, rating in records))
+        self._journal.flush()
+        self._unsynced += len(records)
+        if self._unsynced >= self.JOURNAL_FSYNC_BATCH:
+            self.flush()
+
+    def set_preferences(self, user: User):
+        self._append_journal({"op": "prefs", "user": user.user_id,
+                              "genres": [g.value for g in user.preferred_genres]})
+
+    def flush(self):
+        #сбрасываем накопленные записи журнала на диск
+        if self._journal is not None and self._unsynced:
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+        self._unsynced = 0
+
+    def compact(self, data_manager):
+        #сворачиваем журнал в новый снимок
+        self.save(data_manager)
+
+    def close(self, data_manager):
+        if self.lazy and not data_manager._all_users_loaded:
+            # ради снимка пришлось бы загрузить всех: журнал остаётся до следующей полной загрузки
+            self.flush()
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+        elif self._journal is not None or os.path.exists(self.journal_filename):
+            self.compact(data_manager)
+        self._unmap()
+
+
+# SQLite: индексированные запросы вместо сканирования, общий файл для нескольких процессов
+class SqliteStorage(Storage):
+    lazy = True
+    COMMIT_BATCH = 256 # коммит транзакции раз в столько изменений
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            name_key TEXT NOT NULL,
+            password TEXT NOT NULL
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS users_name_key ON users (name_key);
+        CREATE TABLE IF NOT EXISTS ratings (
+            user_id INTEGER NOT NULL,
+            movie_id INTEGER NOT NULL,
+            rating REAL NOT NULL,
+            PRIMARY KEY (user_id, movie_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS ratings_movie_id ON ratings (movie_id);
+        CREATE TABLE IF NOT EXISTS preferred_genres (
+            user_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            genre TEXT NOT NULL,
+            PRIMARY KEY (user_id, position)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS movies (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL,
+            genres TEXT NOT NULL,
+            director TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            rating REAL NOT NULL
+        );
+    """
+
+    def __init__(self, filename="data.db"):
+        self.filename = filename
+        self._conn = None
+        self._pid = None
+        self._pending = 0
+
+    @property
+    def conn(self):
+        # после fork соединение родителя использовать нельзя - открываем своё
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.filename, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL") # читатели не блокируют писателя
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self.SCHEMA)
+            self._pid = os.getpid()
+            self._pending = 0
+        return self._conn
+
+    def _written(self, count: int = 1):
+        self._pending += count
+        if self._pending >= self.COMMIT_BATCH:
+            self.flush()
+
+    def _build_users(self, rows):
+        users = {}
+        for user_id, name, password in rows:
+            users[user_id] = User(user_id, name, password)
+        return users
+
+    def _fill_users(self, users: Dict[int, User], where: str = "", params=()):
+        for user_id, movie_id, rating in self.conn.execute(
+                "SELECT user_id, movie_id, rating FROM ratings " + where, params):
+            if user_id in users:
+                users[user_id].add_rating(movie_id, rating)
+        genres: Dict[int, List[str]] = {}
+        for user_id, genre in self.conn.execute(
+                "SELECT user_id, genre FROM preferred_genres " + where + " ORDER BY user_id, position", params):
+            genres.setdefault(user_id, []).append(genre)
+        for user_id, values in genres.items():
+            if user_id in users:
+                users[user_id].set_preferred_genres(parse_genres(values))
+
+    def load(self, data_manager):
+        users = self._build_users(self.conn.execute("SELECT id, name, password FROM users"))
+        self._fill_users(users)
+        for user in users.values():
+            if user.user_id not in data_manager._users: # уже загруженные по одному не трогаем
+                data_manager.add_user(user)
+
+    def load_user(self, user_id: int):
+        users = self._build_users(self.conn.execute(
+            "SELECT id, name, password FROM users WHERE id = ?", (user_id,)))
+        if not users:
+            return None
+        self._fill_users(users, "WHERE user_id = ?", (user_id,))
+        return users[user_id]
+
+    def find_user_id(self, name: str):
+        row = self.conn.execute("SELECT id FROM users WHERE name_key = ?", (name_key(name),)).fetchone()
+        return row[0] if row else None
+
+    def movie_ratings(self, movie_id: int):
+        return dict(self.conn.execute("SELECT user_id, rating FROM ratings WHERE movie_id = ?", (movie_id,)))
+
+    def max_user_id(self):
+        return self.conn.execute("SELECT MAX(id) FROM users").fetchone()[0]
+
+    def save(self, data_manager):
+        for user in data_manager.get_all_users():
+            self.add_user(user)
+        self.flush()
+
+    def add_user(self, user: User):
+        conn = self.conn
+        conn.execute("INSERT OR REPLACE INTO users (id, name, name_key, password) VALUES (?, ?, ?, ?)",
+                     (user.user_id, user.name, name_key(user.name), user._password))
+        conn.execute("DELETE FROM ratings WHERE user_id = ?", (user.user_id,))
+        conn.executemany("INSERT INTO ratings (user_id, movie_id, rating) VALUES (?, ?, ?)",
+                         [(user.user_id, movie_id, rating) for movie_id, rating in user.watched_movies.items()])
+        self.set_preferences(user)
+
+    def add_rating(self, user: User, movie_id: int, rating: float):
+        self.conn.execute("INSERT OR REPLACE INTO ratings (user_id, movie_id, rating) VALUES (?, ?, ?)",
+                          (user.user_id, movie_id, rating))
+        self._written()
+
+    def add_ratings(self, records):
+        self.conn.executemany("INSERT OR REPLACE INTO ratings (user_id, movie_id, rating) VALUES (?, ?, ?)",
+                              [(user.user_id, movie_id, rating) for user, movie_id, rating in records])
+        self._written(len(records))
+
+    def set_preferences(self, user: User):
+        conn = self.conn
+        conn.execute("DELETE FROM preferred_genres WHERE user_id = ?", (user.user_id,))
+        conn.executemany("INSERT INTO preferred_genres (user_id, position, genre) VALUES (?, ?, ?)",
+                         [(user.user_id, i, g.value) for i, g in enumerate(user.preferred_genres)])
+        self._written()
+
+    def load_movies(self):
+        return [Movie(movie_id, title, parse_genres(genres.split("|")) if genres else [], director, year, rating)
+                for movie_id, title, genres, director, year, rating in self.conn.execute(
+                    "SELECT id, title, genres, director, year, rating FROM movies ORDER BY id")]
+
+    def save_movies(self, movies: List[Movie]):
+        #каталог сохраняется целиком: удалённые из него фильмы не должны остаться в таблице
+        self.conn.execute("DELETE FROM movies")
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO movies (id, title, genres, director, year, rating) VALUES (?, ?, ?, ?, ?, ?)",
+            [(m.movie_id, m.title, "|".join(g.value for g in m.genres), m.director, m.year, m.rating)
+             for m in movies])
+        self.flush()
+
+    def flush(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.commit()
+        self._pending = 0
+
+    def close(self, data_manager):
+        self.flush()
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+
+def open_storage(filename: str, lazy: bool = False):
+    #хранилище по расширению файла; lazy - JSON читается по индексу смещений (SQLite ленив всегда)
+    if filename.endswith((".db", ".sqlite", ".sqlite3")):
+        return SqliteStorage(filename)
+    return JsonStorage(filename, lazy=lazy)
+
+
+# Блокировка чтения-записи: много читателей одновременно или один писатель.
+# Ждущий писатель не пускает новых читателей, но после каждой записи проходят все читатели,
+# ждавшие её конца - поток оценок не морит чтение голодом; писатель может повторно брать обе блокировки
+class ReadWriteLock:
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None # ident потока-писателя
+        self._write_depth = 0
+        self._waiting_writers = 0
+        self._waiting_readers = 0
+        self._read_pass = 0 # столько ждавших читателей пройдут вперёд ждущих писателей
+        self._local = threading.local() # глубина чтения в текущем потоке
+        self.reader = _Acquired(self.acquire_read, self.release_read)
+        self.writer = _Acquired(self.acquire_write, self.release_write)
+
+    def acquire_read(self):
+        local = self._local
+        depth = getattr(local, "depth", 0)
+        if depth == 0:
+            # под своей же записью читаем без ожидания и без учёта в числе читателей
+            local.counted = self._writer != threading.get_ident()
+            if local.counted:
+                with self._cond:
+                    self._waiting_readers += 1
+                    while self._writer is not None or (self._waiting_writers and not self._read_pass):
+                        self._cond.wait()
+                    self._waiting_readers -= 1
+                    if self._read_pass:
+                        self._read_pass -= 1
+                    self._readers += 1
+        local.depth = depth + 1
+
+    def release_read(self):
+        local = self._local
+        local.depth -= 1
+        if local.depth == 0 and local.counted:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        if self._writer == me:
+            self._write_depth += 1
+            return
+        if getattr(self._local, "depth", 0) and self._local.counted:
+            raise RuntimeError("Нельзя взять запись, удерживая чтение")
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer is not None or self._readers or self._read_pass:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = me
+        self._write_depth = 1
+
+    def release_write(self):
+        self._write_depth -= 1
+        if self._write_depth == 0:
+            with self._cond:
+                self._writer = None
+                self._read_pass = self._waiting_readers
+                self._cond.notify_all()
+
+
+class _Acquired:
+    #контекстный менеджер над парой acquire/release (дешевле генератора @contextmanager)
+    __slots__ = ("_acquire", "_release")
+
+    def __init__(self, acquire, release):
+        self._acquire = acquire
+        self._release = release
+
+    def __enter__(self):
+        self._acquire()
+
+    def __exit__(self, *exc_info):
+        self._release()
+
+
+def _write_locked(method):
+    #метод DataManager целиком под блокировкой записи
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock.writer:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 # Менеджер данных
 class DataManager:
 
-    def __init__(self, filename="data.json"):
+    def __init__(self, filename="data.json", storage: Optional[Storage] = None, lazy: bool = False):
         self.filename = filename
-        self._movies: Dict[int, Movie] = {}
+        self._storage = storage if storage is not None else open_storage(filename, lazy)
+        self._loading = False # во время загрузки изменения не записываются обратно в хранилище
+        self._bulk = False # массовый импорт: индексы перестраиваются один раз в конце
+        self._lock = ReadWriteLock() # изменения под записью, чтение рекомендаций - под reading()
+        self._all_users_loaded = not self._storage.lazy
+        self._movies = MovieCatalog()
         self._users: Dict[int, User] = {}
+        self._user_ids_by_name: Dict[str, int] = {} # имя в casefold -> id пользователя
+        # разреженная матрица оценок по столбцам: id фильма -> {id пользователя: оценка}
+        # строки матрицы - это сами словари User._watched_movies
+        self._ratings_by_movie: Dict[int, Dict[int, float]] = {}
+        # версии для кэша рекомендаций: каталога целиком и каждого столбца матрицы оценок
+        self._catalog_version = next(_version_clock)
+        self._column_versions: Dict[int, int] = {}
+        self._rating_listeners = [] # производные индексы, которым нужны новые оценки
+        self._version_sources = {} # вид зависимости кэша -> функция версии (индексы стратегий)
+        # инвертированный индекс: жанр -> [(-рейтинг, id фильма)], по убыванию рейтинга
+        self._genre_index: Dict[Genre, List[tuple]] = {genre: [] for genre in Genre}
+        # вторичные отсортированные индексы для фильтров min_rating / min_year
+        self._rating_index: List[tuple] = [] # [(-рейтинг, id фильма)], по убыванию рейтинга
+        self._year_index: List[tuple] = [] # [(год, id фильма)], по возрастанию года
         self._next_movie_id = 1
         self._next_user_id = 1
 
-        self.load_test_data()
+        movies = self._storage.load_movies()
+        if movies:
+            #сохраненный каталог грузится массово: индексы строятся один раз, а не insort на каждый фильм
+            with self._lock.writer: # одна блокировка на весь каталог, а не на каждый фильм
+                self._bulk = True
+                try:
+                    for movie in movies:
+                        self.add_movie(movie)
+                finally:
+                    self._bulk = False
+                self._rebuild_indexes()
+        else:
+            self.load_test_data() # встроенный каталог не сохраняется - он и так есть в коде
 
     #загружаем данные если файл существует
-        if os.path.exists(self.filename):
+        if self._storage.exists():
             self.load_from_file()
         else:
             self.save_to_file()
 
-    #сохранение пользователя
+    #сохранение пользователей (полный снимок)
+    @instrumented("data.save_to_file")
     def save_to_file(self):
-        data = {
-            "users": {},
-        }
+        self._storage.save(self)
 
-        for user_id, user in self._users.items():
-            data["users"][user_id] = {
-                "name": user.name,
-                "password": user._password,
-                "watched": user.watched_movies,
-                "preferred_genres": [g.value for g in user.preferred_genres],
-            }
-
-        with open(self.filename, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
-    #загрузка
-    def load_from_file(self):
-        with open(self.filename, "r", encoding="utf-8") as f:
-            data = json.load(f)
+    @contextmanager
+    def _reading_storage(self):
+        #пока читаем из хранилища, изменения не записываются в него обратно
+        was_loading = self._loading
+        self._loading = True
+        try:
+            yield
+        finally:
+            self._loading = was_loading
 
-        users_data = data.get("users", {})
-        self.load_test_data()
-        for user_id_str, u in users_data.items():
-            try:
-                uid = int(user_id_str)
-            except ValueError:
-                continue
-            user = User(uid, u.get("name", ""), u.get("password", ""))
-            watched = u.get("watched", {})
-            for movie_id_str, rating in watched.items():
-                try:
-                    mid = int(movie_id_str)
-                    user.add_rating(mid, rating)
-                except ValueError:
-                    continue
-            pref = u.get("preferred_genres", [])
-            genres = []
-            for g in pref:
-                for genre in Genre:
-                    if genre.value == g:
-                        genres.append(genre)
-                        break
-            user.set_preferred_genres(genres)
-            self._users[user.user_id] = user
+    #загрузка пользователей из хранилища
+    @instrumented("data.load_from_file")
+    @_write_locked
+    def load_from_file(self):
+        if not self._storage.lazy:
+            with self._reading_storage():
+                self._storage.load(self)
 
         # пересчитываем следующий ID
-        if self._users:
-            self._next_user_id = max(self._users.keys()) + 1
-        else:
-            self._next_user_id = 1
-
+        max_id = max(self._storage.max_user_id() or 0, max(self._users.keys(), default=0))
+        self._next_user_id = max_id + 1
 
+    def _ensure_all_users(self):
+        #ленивое хранилище: подгружаем всех пользователей, когда они нужны целиком
+        if self._all_users_loaded:
+            return
+        with self._lock.writer:
+            if not self._all_users_loaded:
+                with self._reading_storage():
+                    self._storage.load(self)
+                self._all_users_loaded = True
+
+    @contextmanager
+    def bulk_update(self):
+        #массовая загрузка каталога и оценок: индексы строятся один раз в конце,
+        #хранилище получает один полный снимок вместо записи на каждую строку;
+        #производные индексы стратегий (слушатели оценок) после импорта нужно пересобрать
+        with self._lock.writer:
+            self._ensure_all_users()
+            self._bulk = True
+            try:
+                with self._reading_storage():
+                    yield self
+            finally:
+                self._bulk = False
+                self._rebuild_indexes()
+            self._storage.save_movies(self._movies.movies())
+            self._storage.save(self)
+            self._storage.flush()
+
+    # блокировки для конкурентного доступа (режим сервиса): рекомендации считаются под reading(),
+    # а все изменения - оценки, жанры, пользователи, фильмы - сами берут запись
+    def reading(self):
+        return self._lock.reader
+
+    def writing(self):
+        return self._lock.writer
+
+    def _rebuild_indexes(self):
+        catalog = self._movies
+        self._rating_index = sorted((-rating, movie_id) for movie_id, _, rating, _ in catalog.entries())
+        self._year_index = sorted((year, movie_id) for movie_id, year, _, _ in catalog.entries())
+        self._genre_index = {genre: [] for genre in Genre}
+        for entry in self._rating_index: # уже по убыванию рейтинга - списки жанров сразу отсортированы
+            for genre in catalog.genres(entry[1]):
+                self._genre_index[genre].append(entry)
+
+        self._ratings_by_movie = {}
+        for user in self._users.values():
+            for movie_id, rating in user._watched_movies.items():
+                self._ratings_by_movie.setdefault(movie_id, {})[user.user_id] = rating
+        version = next(_version_clock)
+        self._catalog_version = version
+        self._column_versions = dict.fromkeys(self._ratings_by_movie, version)
+        if len(catalog):
+            self._next_movie_id = max(self._next_movie_id, catalog.max_id() + 1)
+        self._next_user_id = max(self._next_user_id, max(self._users, default=0) + 1)
+
+    @_write_locked
+    def clear_movies(self):
+        #удаление всего каталога (перед импортом нового)
+        self._movies.clear()
+        self._rebuild_indexes()
+
+    @instrumented("data.flush")
+    def flush(self):
+        #сбрасываем накопленные изменения в хранилище
+        self._storage.flush()
+
+    @instrumented("data.compact")
+    def compact(self):
+        self._storage.compact(self)
+
+    def close(self):
+        self._storage.close(self)
+
+    @_write_locked
     def add_movie(self, movie: Movie):
         #добавление фильма
-        self._movies[movie.movie_id] = movie
-
+        old = self._movies.add(movie)
+        if self._bulk:
+            return
+        if old is not None:
+            old_rating, old_year, old_genres = old
+            for postings in [self._genre_index[g] for g in old_genres] + [self._rating_index]:
+                postings.pop(bisect.bisect_left(postings, (-old_rating, movie.movie_id)))
+            self._year_index.pop(bisect.bisect_left(self._year_index, (old_year, movie.movie_id)))
+        self._catalog_version = next(_version_clock)
+        for genre in movie.genres:
+            bisect.insort(self._genre_index[genre], (-movie.rating, movie.movie_id))
+        bisect.insort(self._rating_index, (-movie.rating, movie.movie_id))
+        bisect.insort(self._year_index, (movie.year, movie.movie_id))
+
+    def get_genre_postings(self, genre: Genre):
+        #фильмы жанра в порядке убывания рейтинга: [(-рейтинг, id фильма)]
+        return self._genre_index[genre]
+
+    # диапазоны индексов отдаются итератором без копирования и числом элементов в них
+    def get_rating_index(self, min_rating: float = 0.0):
+        #фильмы с рейтингом >= min_rating по убыванию рейтинга: (-рейтинг, id фильма)
+        end = bisect.bisect_right(self._rating_index, (-min_rating, float("inf")))
+        return itertools.islice(self._rating_index, end), end
+
+    def get_year_index(self, min_year: int = 0):
+        #фильмы не старше min_year по возрастанию года: (год, id фильма)
+        start = bisect.bisect_left(self._year_index, (min_year, float("-inf")))
+        return itertools.islice(self._year_index, start, None), len(self._year_index) - start
+
+    def filter_movie_scores(self, movie_scores: Dict[int, float], min_rating: float = 0.0, min_year: int = 0):
+        #очки только фильмов, проходящих фильтры; проверяется каждый кандидат, а не строится
+        #множество всех подходящих фильмов каталога. Без фильтров - как есть (и фильмы не из каталога)
+        if min_rating <= 0 and min_year <= 0:
+            return movie_scores
+        passes = self._movies.passes
+        return {movie_id: score for movie_id, score in movie_scores.items()
+                if passes(movie_id, min_rating, min_year)}
+
+    @_write_locked
     def add_user(self, user: User):
         #добавление пользователя
+        key = name_key(user.name)
+        owner_id = self._user_ids_by_name.get(key)
+        if owner_id is None and not self._all_users_loaded and not self._loading:
+            owner_id = self._storage.find_user_id(user.name) # имя может быть у ещё не загруженного
+        old = self._users.get(user.user_id)
+        clash = owner_id is not None and owner_id != user.user_id
+        if clash and not (old is not None and name_key(old.name) == key):
+            if not self._loading:
+                raise ValueError(f"Пользователь с именем '{user.name}' уже существует")
+            # старые данные сравнивали имена через lower(): такие пользователи загружаются,
+            # но по имени находится первый из них - запуск не должен падать
+            warnings.warn(f"Имя '{user.name}' (id {user.user_id}) совпадает с именем пользователя {owner_id} "
+                          f"без учёта регистра - вход по нему ведёт к пользователю {owner_id}", stacklevel=2)
+        if old is not None:
+            if self._user_ids_by_name.get(name_key(old.name)) == old.user_id:
+                del self._user_ids_by_name[name_key(old.name)]
+            for movie_id, rating in old._watched_movies.items():
+                self._ratings_by_movie[movie_id].pop(old.user_id, None)
+                self._column_versions[movie_id] = next(_version_clock)
+                for listener in self._rating_listeners:
+                    listener(old, movie_id, None, rating)
+            old._owner = None
         self._users[user.user_id] = user
+        if not clash:
+            self._user_ids_by_name[key] = user.user_id
+        user._owner = self
+        if self._bulk:
+            return
+        for movie_id, rating in user._watched_movies.items():
+            self._ratings_by_movie.setdefault(movie_id, {})[user.user_id] = rating
+            self._column_versions[movie_id] = next(_version_clock)
+            for listener in self._rating_listeners:
+                listener(user, movie_id, rating, None)
+        if not self._loading:
+            self._storage.add_user(user)
+
+    def _on_rating(self, user: User, movie_id: int, rating: float, old_rating: Optional[float] = None):
+        #пользователь поставил или изменил оценку - обновляем столбец матрицы
+        if self._bulk:
+            return
+        self._ratings_by_movie.setdefault(movie_id, {})[user.user_id] = rating
+        self._column_versions[movie_id] = next(_version_clock)
+        for listener in self._rating_listeners:
+            listener(user, movie_id, rating, old_rating)
+        if not self._loading:
+            self._storage.add_rating(user, movie_id, rating)
+
+    @instrumented("data.apply_ratings")
+    @_write_locked
+    def apply_ratings(self, updates):
+        #пакет оценок [(пользователь, id фильма, оценка)] разом: одна версия на весь пакет для
+        #пользователей и столбцов (кэш сбрасывается один раз), одна запись в хранилище и один flush;
+        #возвращает число изменившихся оценок
+        version = next(_version_clock)
+        columns = set()
+        records = []
+        for user, movie_id, rating in updates:
+            old_rating = user._watched_movies.get(movie_id)
+            if old_rating == rating:
+                continue
+            user._watched_movies[movie_id] = rating
+            user._version = version
+            columns.add(movie_id)
+            records.append((user, movie_id, rating))
+            if not self._bulk:
+                self._ratings_by_movie.setdefault(movie_id, {})[user.user_id] = rating
+                for listener in self._rating_listeners:
+                    listener(user, movie_id, rating, old_rating)
+        if self._bulk:
+            return len(records)
+        for movie_id in columns:
+            self._column_versions[movie_id] = version
+        if records and not self._loading:
+            self._storage.add_ratings(records)
+            self.flush()
+        return len(records)
+
+    def add_rating_listener(self, listener):
+        #listener(user, movie_id, rating, old_rating) вызывается на каждое изменение оценки;
+        #old_rating - None для новой оценки, rating - None, если оценка убрана (пользователь заменён)
+        self._rating_listeners.append(listener)
+
+    def _on_preferences(self, user: User):
+        if not self._loading:
+            self._storage.set_preferences(user)
+
+    def get_movie_ratings(self, movie_id: int):
+        #все оценки фильма: {id пользователя: оценка}
+        if not self._all_users_loaded:
+            ratings = self._storage.movie_ratings(movie_id) # индексированный запрос
+            if ratings is not None:
+                return ratings
+            self._ensure_all_users() # хранилище так не умеет - нужны все пользователи
+        return self._ratings_by_movie.get(movie_id, {})
+
+    @property
+    def catalog_version(self):
+        return self._catalog_version
+
+    def get_version(self, kind: str, key: int):
+        #текущая версия зависимости кэша: "user" - пользователь, "movie" - оценки фильма,
+        #остальные виды - из add_version_source
+        if kind == "user":
+            user = self._users.get(key)
+            return user.version if user is not None else None
+        if kind == "movie":
+            return self._column_versions.get(key, 0)
+        return self._version_sources[kind](key)
+
+    def add_version_source(self, kind: str, source):
+        #source(key) - текущая версия части производного индекса; None - версия неизвестна (запись устарела)
+        self._version_sources[kind] = source
+
+    @property
+    def catalog(self):
+        #столбцы каталога: поля фильма без создания объекта Movie
+        return self._movies
 
     def get_movie(self, movie_id: int):
         return self._movies.get(movie_id)
 
+    def get_user(self, user_id: int):
+        user = self._users.get(user_id)
+        if user is None and not self._all_users_loaded:
+            with self._reading_storage():
+                user = self._storage.load_user(user_id)
+                if user is not None:
+                    self.add_user(user)
+        return user
+
     def get_user_by_name(self, name: str):
-        for user in self._users.values():
-            if user.name.lower() == name.lower():
-                return user
-        return None
+        user_id = self._user_ids_by_name.get(name_key(name))
+        if user_id is None and not self._all_users_loaded:
+            user_id = self._storage.find_user_id(name) # индексированный запрос
+        return self.get_user(user_id) if user_id is not None else None
 
+    @instrumented("data.authenticate")
     def authenticate(self, name: str, password: str):
         #проверка логина и пароля
         user = self.get_user_by_name(name)
@@ -204,9 +1514,10 @@ class DataManager:
         return None
 
     def get_all_movies(self):
-        return list(self._movies.values())
+        return list(self._movies.movies())
 
     def get_all_users(self):
+        self._ensure_all_users()
         return list(self._users.values())
 
     def get_next_movie_id(self):
@@ -255,135 +1566,1659 @@ class DataManager:
             self.add_movie(movie)
 
 
+# Потоковый импорт каталога и оценок в формате MovieLens (CSV/TSV/.dat)
+class BulkImporter:
+    # жанры MovieLens -> Genre; русские названия тоже понимаем
+    GENRE_NAMES = {
+        "action": Genre.ACTION, "comedy": Genre.COMEDY, "drama": Genre.DRAMA, "horror": Genre.HORROR,
+        "sci-fi": Genre.SCI_FI, "romance": Genre.ROMANCE, "thriller": Genre.THRILLER,
+        "fantasy": Genre.FANTASY, "adventure": Genre.ADVENTURE, "animation": Genre.ANIMATION,
+        **{genre.value.lower(): genre for genre in Genre},
+    }
+    USER_PREFIX = "ml_" # имена импортированных пользователей: ml_<id из файла>
+
+    def __init__(self, data_manager: DataManager, chunk_size: int = 100000, rating_scale: float = 2.0,
+                 progress=None):
+        self._data_manager = data_manager
+        self.chunk_size = chunk_size # строк файла в памяти одновременно
+        self.rating_scale = rating_scale # MovieLens 0.5-5 -> 1-10
+        self.progress = progress
+        self._users: Dict[str, User] = {}
+        self._rating_sums: Dict[int, List[float]] = {} # id фильма -> [сумма, число] для среднего рейтинга
+
+    @staticmethod
+    def _rows(path: str):
+        #строки файла как списки полей; заголовок пропускается
+        if path.endswith(".dat"):
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    yield line.rstrip("\n").split("::")
+            return
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f, delimiter="\t" if path.endswith(".tsv") else ",")
+            first = next(reader, None)
+            if first and first[0].strip().isdigit():
+                yield first
+            yield from reader
+
+    def _chunks(self, path: str):
+        rows = self._rows(path)
+        while True:
+            chunk = list(itertools.islice(rows, self.chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def _report(self, what: str, rows: int, start: float):
+        if self.progress is not None:
+            elapsed = time.perf_counter() - start
+            print(f"{what}: {rows} строк, {rows / elapsed if elapsed else 0:.0f} строк/с",
+                  file=self.progress, flush=True)
+
+    def _parse_movie(self, row):
+        #movieId, "Название (год)", "Жанр1|Жанр2"
+        movie_id, title, genres = int(row[0]), row[1].strip(), row[2]
+        year = 0
+        if title.endswith(")") and title[-6:-5] == "(" and title[-5:-1].isdigit():
+            year = int(title[-5:-1])
+            title = title[:-6].strip()
+        parsed = []
+        for name in genres.split("|"):
+            genre = self.GENRE_NAMES.get(name.strip().lower())
+            if genre is not None and genre not in parsed:
+                parsed.append(genre)
+        return Movie(movie_id, title, parsed, "", year, 0.0)
+
+    def import_movies(self, path: str):
+        start = time.perf_counter()
+        count = 0
+        for chunk in self._chunks(path):
+            for row in chunk:
+                try:
+                    self._data_manager.add_movie(self._parse_movie(row))
+                except (ValueError, IndexError):
+                    continue
+                count += 1
+            self._report("фильмы", count, start)
+        return count
+
+    def _user(self, external_id: str):
+        user = self._users.get(external_id)
+        if user is None:
+            name = self.USER_PREFIX + external_id
+            user = self._data_manager.get_user_by_name(name)
+            if user is None:
+                # пароль пустой - под импортированным пользователем войти нельзя
+                user = User(self._data_manager.get_next_user_id(), name, "")
+                self._data_manager.add_user(user)
+            self._users[external_id] = user
+        return user
+
+    def import_ratings(self, path: str):
+        #userId, movieId, rating[, timestamp]
+        start = time.perf_counter()
+        count = 0
+        for chunk in self._chunks(path):
+            for row in chunk:
+                try:
+                    movie_id = int(row[1])
+                    rating = round(float(row[2]) * self.rating_scale, 2)
+                except (ValueError, IndexError):
+                    continue
+                if not 0 <= rating <= 10 or movie_id not in self._data_manager.catalog:
+                    continue
+                self._user(row[0].strip()).add_rating(movie_id, rating)
+                totals = self._rating_sums.setdefault(movie_id, [0.0, 0])
+                totals[0] += rating
+                totals[1] += 1
+                count += 1
+            self._report("оценки", count, start)
+        return count
+
+    def apply_average_ratings(self):
+        #рейтинг фильма без своего рейтинга - средняя импортированная оценка
+        for movie_id, (total, count) in self._rating_sums.items():
+            movie = self._data_manager.get_movie(movie_id)
+            if movie is not None and not movie.rating:
+                self._data_manager.add_movie(Movie(movie_id, movie.title, movie.genres, movie.director,
+                                                   movie.year, round(total / count, 1)))
+
+
+# Потоковый приём событий оценок (пользователь, фильм, оценка, время) из JSONL или CSV.
+# События читаются и проверяются в отдельном потоке и порциями кладутся в ограниченную очередь:
+# если применение не успевает, чтение ждёт (обратное давление). Повторные оценки одной пары
+# (пользователь, фильм) внутри порции схлопываются - остаётся последняя по времени
+class RatingIngestor:
+    def __init__(self, data_manager: DataManager, batch_size: int = 10000, queue_size: int = 4,
+                 progress=None):
+        self._data_manager = data_manager
+        self.batch_size = batch_size # событий в порции
+        self.queue_size = queue_size # готовых порций в очереди, дальше чтение останавливается
+        self.progress = progress
+        self.stats = {"events": 0, "applied": 0, "coalesced": 0, "rejected": 0, "batches": 0}
+
+    @classmethod
+    def read_events(cls, path: str):
+        #события файла как кортежи (user, movie, rating, timestamp) без проверки;
+        #"-" - JSONL из stdin, .jsonl/.json - JSONL, иначе CSV/TSV с необязательным заголовком
+        if path == "-" or path.endswith((".jsonl", ".json")):
+            f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+            try:
+                while True:
+                    lines = [line for line in itertools.islice(f, 1000) if line.strip()]
+                    if not lines:
+                        break
+                    # тысяча строк - одним вызовом json.loads как массив; если в ней есть
+                    # испорченная строка - разбираем по одной
+                    try:
+                        parsed = json.loads("[" + ",".join(lines) + "]")
+                    except ValueError:
+                        parsed = None
+                    if parsed is None or len(parsed) != len(lines):
+                        parsed = []
+                        for line in lines:
+                            try:
+                                parsed.append(json.loads(line))
+                            except ValueError:
+                                parsed.append(None)
+                    for event in parsed:
+                        if isinstance(event, dict):
+                            yield event.get("user"), event.get("movie"), event.get("rating"), event.get("timestamp")
+                        else:
+                            yield None
+            finally:
+                if f is not sys.stdin:
+                    f.close()
+            return
+        for row in BulkImporter._rows(path):
+            yield tuple(row[:4]) + (None,) * (4 - len(row))
+
+    def _parse(self, event):
+        #(id пользователя, id фильма, оценка, время) или None для неверного события
+        try:
+            user, movie, rating, timestamp = event
+            user_id, movie_id, rating = int(user), int(movie), float(rating)
+            timestamp = float(timestamp) if timestamp not in (None, "") else None
+        except (TypeError, ValueError):
+            return None
+        if not 0 <= rating <= 10 or movie_id not in self._data_manager.catalog:
+            return None
+        return user_id, movie_id, rating, timestamp
+
+    def _produce(self, events, batches: queue.Queue, stop: threading.Event):
+        #поток чтения: порции {(пользователь, фильм): (время, оценка)}, число событий и отклонённых
+        def put(item):
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        try:
+            batch, count, rejected = {}, 0, 0
+            for event in events:
+                count += 1
+                parsed = self._parse(event)
+                if parsed is None:
+                    rejected += 1
+                else:
+                    user_id, movie_id, rating, timestamp = parsed
+                    key = (user_id, movie_id)
+                    previous = batch.get(key)
+                    # без времени или при равном времени побеждает пришедшее позже
+                    if previous is None or previous[0] is None or timestamp is None or timestamp >= previous[0]:
+                        batch[key] = (timestamp, rating)
+                if count >= self.batch_size:
+                    put((batch, count, rejected))
+                    batch, count, rejected = {}, 0, 0
+                if stop.is_set():
+                    return
+            if count:
+                put((batch, count, rejected))
+            put(None)
+        except Exception as e: # ошибка чтения файла - отдаём её основному потоку
+            put(e)
+
+    def _apply(self, batch: dict, count: int, rejected: int):
+        updates = []
+        for (user_id, movie_id), (_, rating) in batch.items():
+            user = self._data_manager.get_user(user_id)
+            if user is None:
+                rejected += 1
+                continue
+            updates.append((user, movie_id, rating))
+        stats = self.stats
+        stats["applied"] += self._data_manager.apply_ratings(updates)
+        stats["events"] += count
+        stats["rejected"] += rejected
+        stats["coalesced"] += count - rejected - len(updates)
+        stats["batches"] += 1
+
+    def ingest(self, events):
+        #применяет поток событий порциями; возвращает статистику
+        batches: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        reader = threading.Thread(target=self._produce, args=(events, batches, stop), daemon=True)
+        start = time.perf_counter()
+        reader.start()
+        try:
+            while True:
+                item = batches.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                self._apply(*item)
+                if self.progress is not None:
+                    elapsed = time.perf_counter() - start
+                    print(f"события: {self.stats['events']}, "
+                          f"{self.stats['events'] / elapsed if elapsed else 0:.0f} событий/с",
+                          file=self.progress, flush=True)
+            reader.join()
+        finally:
+            stop.set() # при ошибке применения поток чтения бросает порцию и выходит
+        self.stats["seconds"] = time.perf_counter() - start
+        return self.stats
+
+    def ingest_file(self, path: str):
+        return self.ingest(self.read_events(path))
+
+
 #- Создать абстрактный базовый класс для стратегий рекомендаций
 class RecommendationStrategy(ABC):
+    MAX_CURSORS = 1024 # незавершённых постраничных выдач в памяти, старые вытесняются
+
     def __init__(self, data_manager: DataManager):
         self._data_manager = data_manager
+        # курсор -> (ключ, генератор): следующая страница продолжает тот же генератор
+        self._pages: "OrderedDict[str, tuple]" = OrderedDict()
+        self._pages_lock = threading.Lock()
+
+    def __init_subclass__(cls, **kwargs):
+        #каждая стратегия замеряется под своим именем: оборачиваем метод, который считает
+        #рекомендации (get_recommendations_with_dependencies, если он свой, иначе get_recommendations)
+        super().__init_subclass__(**kwargs)
+        for method in ("get_recommendations_with_dependencies", "get_recommendations"):
+            if method in cls.__dict__:
+                setattr(cls, method, instrumented(f"strategy.{cls.__name__}")(cls.__dict__[method]))
+                break
 
     #@abstractclassmethod
     @classmethod
     def get_reccomendations(self, user:User, min_rating: float = 0.0, min_year: int = 0, max_results:int = 10):
         pass
 
+    def get_recommendations_with_dependencies(self, user: User, min_rating: float = 0.0, min_year: int = 0,
+                                              max_results: int = 10):
+        #рекомендации и то, от чего они зависят кроме самого пользователя и каталога:
+        #список (вид, id, версия), вид - "user" или "movie" (см. DataManager.get_version)
+        return self.get_recommendations(user, min_rating, min_year, max_results), ()
+
+    def iter_recommendations(self, user: User, min_rating: float = 0.0, min_year: int = 0):
+        #фильмы по убыванию оценки, по одному и без заранее заданного max_results.
+        #Стратегии без своего ленивого перебора запрашиваются заново с удвоением max_results
+        size, yielded = 10, 0
+        while True:
+            movies = self.get_recommendations(user, min_rating, min_year, size)
+            yield from movies[yielded:]
+            if len(movies) < size:
+                return
+            yielded, size = len(movies), size * 2
+
+    def iter_recommendations_with_dependencies(self, user: User, min_rating: float = 0.0, min_year: int = 0):
+        #ленивый перебор и его зависимости для кэша (см. get_recommendations_with_dependencies)
+        return self.iter_recommendations(user, min_rating, min_year), ()
+
+    def _page_source(self, user: User, min_rating: float, min_year: int, offset: int):
+        #перебор с фильма номер offset
+        movies = self.iter_recommendations(user, min_rating, min_year)
+        for _ in itertools.islice(movies, offset):
+            pass
+        return movies
+
+    @instrumented("strategy.page")
+    def get_page(self, user: User, min_rating: float = 0.0, min_year: int = 0, page_size: int = 10,
+                 cursor: Optional[str] = None):
+        #страница рекомендаций и курсор следующей (None - дальше ничего нет). Курсор непрозрачный:
+        #по нему продолжается сохранённый генератор; если его уже нет или данные изменились,
+        #перебор начинается заново и пропускает столько фильмов, сколько уже отдано
+        if page_size < 1:
+            raise ValueError(f"Размер страницы должен быть не меньше 1: {page_size}")
+        offset, state = 0, None
+        if cursor is not None:
+            try:
+                offset = int(cursor.split(".", 1)[0])
+            except ValueError:
+                raise ValueError(f"Неверный курсор: {cursor}")
+            with self._pages_lock:
+                state = self._pages.pop(cursor, None)
+
+        key = (user.user_id, user.version, self._data_manager.catalog_version, min_rating, min_year, offset)
+        if state is not None and state[0] == key:
+            movies = state[1]
+        else:
+            movies = self._page_source(user, min_rating, min_year, offset)
+
+        page = list(itertools.islice(movies, page_size + 1)) # лишний фильм - есть ли следующая страница
+        if len(page) <= page_size:
+            return page, None
+        offset += page_size
+        next_cursor = f"{offset}.{secrets.token_hex(8)}"
+        with self._pages_lock:
+            self._pages[next_cursor] = (key[:-1] + (offset,), itertools.chain(page[page_size:], movies))
+            while len(self._pages) > self.MAX_CURSORS:
+                self._pages.popitem(last=False)
+        return page[:page_size], next_cursor
+
+
+# Ранжированный список, который дополняется из ленивого перебора по мере надобности;
+# каждый курсор читает его со своей позиции
+class RankedMovies:
+    def __init__(self, movies):
+        self._source = iter(movies)
+        self._movies: List[Movie] = []
+        self._lock = threading.Lock() # генератор нельзя продвигать из двух потоков сразу
+
+    def iter_from(self, offset: int):
+        position = offset
+        while True:
+            with self._lock:
+                while len(self._movies) <= position and self._source is not None:
+                    try:
+                        self._movies.append(next(self._source))
+                    except StopIteration:
+                        self._source = None
+                if position >= len(self._movies):
+                    return
+                movie = self._movies[position]
+            yield movie
+            position += 1
+
+
+# Кэш рекомендаций с LRU/TTL и точной инвалидацией по версиям
+class RecommendationCache:
+    def __init__(self, data_manager: DataManager, maxsize: int = 1024, ttl: Optional[float] = None):
+        self._data_manager = data_manager
+        self.maxsize = maxsize
+        self.ttl = ttl # время жизни записи в секундах, None - без ограничения
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock() # сами расчёты идут без неё, под ней - только операции со словарём
+        self.hits = 0
+        self.misses = 0
+
+    def _is_fresh(self, entry, user: User):
+        created, user_version, catalog_version, dependencies, _ = entry
+        if self.ttl is not None and time.monotonic() - created > self.ttl:
+            return False
+        if user_version != user.version or catalog_version != self._data_manager.catalog_version:
+            return False
+        return all(self._data_manager.get_version(kind, key) == version
+                   for kind, key, version in dependencies)
+
+    def _lookup(self, key: tuple, user: User):
+        #значение свежей записи или None (промах)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_fresh(entry, user):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[4]
+            self.misses += 1
+        return None
+
+    def _store(self, key: tuple, user_version: int, catalog_version: int, dependencies, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), user_version, catalog_version, tuple(dependencies), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_recommendations(self, strategy: RecommendationStrategy, user: User, min_rating: float = 0.0,
+                            min_year: int = 0, max_results: int = 10):
+        key = (id(strategy), user.user_id, min_rating, min_year, max_results)
+        cached = self._lookup(key, user)
+        if cached is not None:
+            return list(cached)
+
+        # версии запоминаем до расчёта: если данные поменяются по ходу, запись просто устареет
+        user_version = user.version
+        catalog_version = self._data_manager.catalog_version
+        result, dependencies = strategy.get_recommendations_with_dependencies(
+            user, min_rating, min_year, max_results)
+        self._store(key, user_version, catalog_version, dependencies, tuple(result))
+        return result
+
+    def get_ranking(self, strategy: RecommendationStrategy, user: User, min_rating: float = 0.0,
+                    min_year: int = 0):
+        #весь ранжированный список для постраничной выдачи: общий для всех страниц и курсоров,
+        #фильмы достаются из перебора стратегии по мере того, как их просят
+        key = (id(strategy), user.user_id, min_rating, min_year, None)
+        cached = self._lookup(key, user)
+        if cached is not None:
+            return cached
+
+        user_version = user.version
+        catalog_version = self._data_manager.catalog_version
+        movies, dependencies = strategy.iter_recommendations_with_dependencies(user, min_rating, min_year)
+        ranking = RankedMovies(movies)
+        self._store(key, user_version, catalog_version, dependencies, ranking)
+        return ranking
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class CachedStrategy(RecommendationStrategy):
+    #обёртка над любой стратегией: те же вызовы, но через общий кэш
+    def __init__(self, strategy: RecommendationStrategy, cache: RecommendationCache):
+        super().__init__(strategy._data_manager)
+        self.strategy = strategy
+        self.cache = cache
+
+    def get_recommendations(self, user: User, min_rating: float = 0.0, min_year: int = 0, max_results: int = 10):
+        return self.cache.get_recommendations(self.strategy, user, min_rating, min_year, max_results)
+
+    def iter_recommendations(self, user: User, min_rating: float = 0.0, min_year: int = 0):
+        return self.strategy.iter_recommendations(user, min_rating, min_year)
+
+    def _page_source(self, user: User, min_rating: float, min_year: int, offset: int):
+        #страницы читают общий ранжированный список из кэша: перебор стратегии идёт один раз,
+        #следующая страница и устаревший курсор продолжают его, а не считают заново
+        return self.cache.get_ranking(self.strategy, user, min_rating, min_year).iter_from(offset)
+
 
 # На основе жанров - рекомендует фильмы любимых жанров пользователя
 class GenreBasedStrategy(RecommendationStrategy):
-    def get_recommendations(self, user: User, min_rating: float = 0.0,min_year: int = 0, max_results: int = 10):
-        
-        reccomendations = []
-        watched_ids = set(user.watched_movies.keys())
-
+    def preferred_genres(self, user: User):
+        watched_ids = user.watched_movies.keys()
         preffered_genres = set(user.preferred_genres)
         if not preffered_genres: #угадывает любимые жанры пользователя по уже просмотренным фильмам
             genre_counts = {} #создаётся словарь: жанр - сколько раз он встретился.
             
             for movie_id in watched_ids:
-                movie = self._data_manager.get_movie(movie_id)
-                if not movie:
+                genres = self._data_manager.catalog.genres(movie_id)
+                if not genres:
                     continue
 
-                for genre in genre_counts:
+                for genre in genres:
                     if genre in genre_counts:
                         genre_counts[genre] += 1
                     else:
-                        genre_counts = 1 #тоесть если фильм с таким жанром еще не встречался он становится 1
+                        genre_counts[genre] = 1 #тоесть если фильм с таким жанром еще не встречался он становится 1
 
             if genre_counts: #берем 3 самых частых жанра
                 sorted_genres = sorted(genre_counts.items(), key = lambda item: item[1], reverse= True) #reverse = True сортировка по убыванию
                 preffered_genres = [genre for genre, count in sorted_genres[:3]]
+        return preffered_genres
 
-        for movie in self._data_manager.get_all_movies():
-            if movie.movie_id not in watched_ids:
-                if movie.rating >= min_rating and movie.year > min_year:
-                    for genre in preffered_genres:
-                        if genre in movie.genres:
-                            reccomendations.append(movie)
-                            break
-
-        reccomendations.sort(key = lambda x: x.rating, reverse=True)
-        return reccomendations[:max_results]
+    def get_recommendations(self, user: User, min_rating: float = 0.0,min_year: int = 0, max_results: int = 10):
+        return list(itertools.islice(self.iter_recommendations(user, min_rating, min_year), max_results))
+
+    def iter_recommendations(self, user: User, min_rating: float = 0.0, min_year: int = 0):
+        watched_ids = user.watched_movies.keys()
+        preffered_genres = self.preferred_genres(user)
+
+        # сливаем отсортированные списки жанров: фильмы идут по убыванию рейтинга, по мере надобности
+        postings = [self._data_manager.get_genre_postings(genre) for genre in preffered_genres]
+        year = self._data_manager.catalog.year
+        last_id = None
+        for neg_rating, movie_id in heapq.merge(*postings):
+            if -neg_rating < min_rating:
+                return
+            if movie_id == last_id: # фильм из нескольких любимых жанров
+                continue
+            last_id = movie_id
+            if movie_id in watched_ids:
+                continue
+            if year(movie_id) > min_year: # год строго больше min_year
+                yield self._data_manager.get_movie(movie_id)
     
 
 class RatingBasedStrategy(RecommendationStrategy):
     
     def get_recommendations(self, user: User, min_rating: float = 0.0, min_year: int = 0, max_results: int = 10) :
-        watched_ids = set(user.watched_movies.keys())
-        recommendations = []
+        return list(itertools.islice(self.iter_recommendations(user, min_rating, min_year), max_results))
+
+    def iter_recommendations(self, user: User, min_rating: float = 0.0, min_year: int = 0):
+        watched_ids = user.watched_movies.keys()
+        catalog = self._data_manager.catalog
+        by_rating, rating_count = self._data_manager.get_rating_index(min_rating)
+        by_year, year_count = self._data_manager.get_year_index(min_year)
+
+        if year_count < rating_count:
+            # строгий фильтр по году: куча из подходящих по году, лучшие достаются по одному
+            candidates = [entry for entry in (
+                (-catalog.rating(movie_id), movie_id) for _, movie_id in by_year)
+                if entry[0] <= -min_rating and entry[1] not in watched_ids]
+            heapq.heapify(candidates)
+            while candidates:
+                yield self._data_manager.get_movie(heapq.heappop(candidates)[1])
+        else:
+            # идём по индексу рейтинга сверху вниз, пока просят
+            for entry in by_rating:
+                movie_id = entry[1]
+                if movie_id not in watched_ids and catalog.year(movie_id) >= min_year:
+                    yield self._data_manager.get_movie(movie_id)
+    
+# Приближённый поиск похожих пользователей: LSH случайными гиперплоскостями
+# по центрированным векторам оценок; обновляется на каждой новой оценке
+class UserLSHIndex:
+    CENTER = 5.0 # середина шкалы: оценки выше - "плюс", ниже - "минус"
+
+    def __init__(self, data_manager: DataManager, n_tables: int = 8, n_bits: int = 10,
+                 multi_probe: bool = True, seed: int = 0):
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.multi_probe = multi_probe # смотреть и соседние корзины (сигнатура с одним другим битом)
+        self.seed = seed
+        self._planes: Dict[int, List[float]] = {} # id фильма -> компоненты ±1 всех гиперплоскостей
+        self._sums: Dict[int, List[float]] = {} # id пользователя -> скалярные произведения с гиперплоскостями
+        self._signatures: Dict[int, List[int]] = {}
+        self._buckets: List[Dict[int, set]] = [{} for _ in range(n_tables)]
+        # версии корзин (таблица, сигнатура) для кэша: меняются, когда в корзину входят или выходят
+        self._bucket_versions: Dict[tuple, int] = {}
+        self._version_kind = f"lsh_buckets.{id(self)}"
+        data_manager.add_version_source(self._version_kind, lambda bucket: self._bucket_versions.get(bucket, 0))
+
+        # начальная сборка: сначала суммы по всем оценкам пользователя, потом одна сигнатура
+        for user in data_manager.get_all_users():
+            sums = [0.0] * (n_tables * n_bits)
+            for movie_id, rating in user.watched_movies.items():
+                delta = rating - self.CENTER
+                sums = [s + delta * p for s, p in zip(sums, self._movie_planes(movie_id))]
+            if user.watched_movies:
+                self._sums[user.user_id] = sums
+                self._rehash(user.user_id)
+        data_manager.add_rating_listener(self._on_rating)
+
+    def _movie_planes(self, movie_id: int):
+        planes = self._planes.get(movie_id)
+        if planes is None:
+            rng = random.Random(self.seed * 1000003 + movie_id)
+            planes = [1.0 if rng.random() < 0.5 else -1.0 for _ in range(self.n_tables * self.n_bits)]
+            self._planes[movie_id] = planes
+        return planes
+
+    def _rehash(self, user_id: int):
+        #пересчёт сигнатур пользователя и перенос между корзинами
+        sums = self._sums[user_id]
+        signatures = self._signatures.setdefault(user_id, [None] * self.n_tables)
+        for table in range(self.n_tables):
+            base = table * self.n_bits
+            signature = 0
+            for bit in range(self.n_bits):
+                if sums[base + bit] > 0:
+                    signature |= 1 << bit
+            if signature != signatures[table]:
+                buckets = self._buckets[table]
+                version = next(_version_clock)
+                if signatures[table] is not None:
+                    buckets[signatures[table]].discard(user_id)
+                    self._bucket_versions[(table, signatures[table])] = version
+                buckets.setdefault(signature, set()).add(user_id)
+                self._bucket_versions[(table, signature)] = version
+                signatures[table] = signature
+
+    def _on_rating(self, user: User, movie_id: int, rating, old_rating):
+        delta = (rating - self.CENTER if rating is not None else 0.0) - \
+                (old_rating - self.CENTER if old_rating is not None else 0.0)
+        sums = self._sums.get(user.user_id, [0.0] * (self.n_tables * self.n_bits))
+        self._sums[user.user_id] = [s + delta * p for s, p in zip(sums, self._movie_planes(movie_id))]
+        self._rehash(user.user_id)
+
+    def _probed(self, user: User):
+        #корзины (таблица, сигнатура), которые просматриваются для пользователя
+        signatures = self._signatures.get(user.user_id)
+        if signatures is None:
+            return []
+        probed = []
+        for table, signature in enumerate(signatures):
+            probed.append((table, signature))
+            if self.multi_probe:
+                probed.extend((table, signature ^ (1 << bit)) for bit in range(self.n_bits))
+        return probed
+
+    def candidates(self, user: User):
+        #кандидаты в похожие: все, кто попал в те же корзины хотя бы в одной таблице
+        found = set()
+        for table, signature in self._probed(user):
+            found.update(self._buckets[table].get(signature, ()))
+        found.discard(user.user_id)
+        return found
+
+    def dependencies(self, user: User):
+        #зависимости кэша: состав просмотренных корзин (свои сигнатуры пользователя - в его версии)
+        return [(self._version_kind, bucket, self._bucket_versions.get(bucket, 0)) for bucket in self._probed(user)]
+
+
+# Готовые списки похожих пользователей. Для каждого пользователя хранятся лучшие соседи со сходством
+# >= min_similarity вместе с состоянием пары: сумма модулей разниц оценок и число общих фильмов.
+# Новая оценка меняет только пары с теми, кто оценил тот же фильм
+class UserNeighborIndex:
+    def __init__(self, data_manager: DataManager, max_neighbors: Optional[int] = 100,
+                 min_similarity: float = 0.3, repair_every: int = 1000):
+        self._data_manager = data_manager
+        self.max_neighbors = max_neighbors # соседей в ответе, None - без ограничения
+        # в списке держим вдвое больше: соседи могут опуститься, а замену им не найти без пересчёта
+        self.capacity = 2 * max_neighbors if max_neighbors is not None else None
+        self.min_similarity = min_similarity
+        self.repair_every = repair_every # после стольких приращений список считается заново
+        # id пользователя -> {id соседа: [сумма разниц, общих фильмов]}; списка нет - посчитается при запросе
+        self._lists: Dict[int, Dict[int, list]] = {}
+        # для неполных списков: порядок лучшей из подходящих пар, которые в список не попали
+        # (выше него никто вне списка не поднимется - все изменения пар проходят через _on_rating)
+        self._floors: Dict[int, tuple] = {}
+        self._worst: Dict[int, tuple] = {} # худший сосед в заполненном списке: (порядок, id)
+        self._updates: Dict[int, int] = {}
+        self.rebuilds = 0
+        data_manager._ensure_all_users() # списки строятся по полным столбцам матрицы
+        data_manager.add_rating_listener(self._on_rating)
+
+    @staticmethod
+    def _similarity(state):
+        return max(0.0, 1.0 - (state[0] / state[1]) / 10)
+
+    def _rank(self, other_id: int, state):
+        #порядок соседей: по сходству, при равенстве - больше общих фильмов, затем меньший id
+        return self._similarity(state), state[1], -other_id
+
+    def _qualifies(self, state):
+        return state[1] > 0 and self._similarity(state) >= self.min_similarity
+
+    def _raise_floor(self, user_id: int, rank: tuple):
+        floor = self._floors.get(user_id)
+        if floor is None or rank > floor:
+            self._floors[user_id] = rank
+
+    @instrumented("neighbors.build")
+    def _build(self, user: User):
+        #точный расчёт списка за один проход по столбцам матрицы (как SimilarUserStrategy._similarities)
+        diff_sums: Dict[int, float] = {}
+        counts: Dict[int, int] = {}
+        for movie_id, rating in user.watched_movies.items():
+            for other_id, other_rating in self._data_manager.get_movie_ratings(movie_id).items():
+                if other_id == user.user_id:
+                    continue
+                diff_sums[other_id] = diff_sums.get(other_id, 0.0) + abs(rating - other_rating)
+                counts[other_id] = counts.get(other_id, 0) + 1
+
+        states = {other_id: [diff_sums[other_id], count] for other_id, count in counts.items()
+                  if self._qualifies([diff_sums[other_id], count])}
+        self._floors.pop(user.user_id, None)
+        self._worst.pop(user.user_id, None)
+        if self.capacity is not None and len(states) > self.capacity:
+            best = heapq.nlargest(self.capacity + 1, states,
+                                  key=lambda other_id: self._rank(other_id, states[other_id]))
+            self._floors[user.user_id] = self._rank(best[-1], states[best[-1]])
+            states = {other_id: states[other_id] for other_id in best[:-1]}
+        self._updates[user.user_id] = 0
+        self._lists[user.user_id] = states
+        self.rebuilds += 1
+        return states
+
+    def _pair_state(self, user: User, other_id: int):
+        #состояние пары, которой нет ни в одном списке: по общим фильмам, уже попавшим в столбцы матрицы
+        #(при замене пользователя строка и столбцы обновляются не одновременно)
+        rows = [user.watched_movies, self._data_manager.get_user(other_id).watched_movies]
+        small, large = sorted(rows, key=len)
+        diff, count = 0.0, 0
+        for movie_id in small:
+            if movie_id in large:
+                column = self._data_manager.get_movie_ratings(movie_id)
+                rating, other_rating = column.get(user.user_id), column.get(other_id)
+                if rating is not None and other_rating is not None:
+                    diff += abs(rating - other_rating)
+                    count += 1
+        return [diff, count]
+
+    def _update(self, owner_id: int, neighbors: Dict[int, list], other_id: int, state, tracked: bool):
+        #новое состояние пары в списке owner_id; tracked - пара уже была в списке
+        worst = self._worst.get(owner_id)
+        if tracked:
+            if self._qualifies(state):
+                neighbors[other_id] = state
+                if worst is not None:
+                    rank = self._rank(other_id, state)
+                    if rank < worst[0]:
+                        self._worst[owner_id] = (rank, other_id)
+                    elif worst[1] == other_id:
+                        del self._worst[owner_id] # худший поднялся - найдём заново, когда понадобится
+            else:
+                del neighbors[other_id]
+                if worst is not None and worst[1] == other_id:
+                    del self._worst[owner_id]
+        elif self._qualifies(state):
+            if self.capacity is None or len(neighbors) < self.capacity:
+                neighbors[other_id] = state
+                if worst is not None and self._rank(other_id, state) < worst[0]:
+                    self._worst[owner_id] = (self._rank(other_id, state), other_id)
+            else:
+                if worst is None:
+                    worst = min((self._rank(neighbor_id, neighbor_state), neighbor_id)
+                                for neighbor_id, neighbor_state in neighbors.items())
+                rank = self._rank(other_id, state)
+                if rank > worst[0]:
+                    del neighbors[worst[1]]
+                    neighbors[other_id] = state
+                    rank = worst[0]
+                    self._worst.pop(owner_id, None)
+                else:
+                    self._worst[owner_id] = worst
+                self._raise_floor(owner_id, rank)
+        else:
+            return
+
+        # периодическая починка: накопленные приращения сбрасываются точным пересчётом
+        self._updates[owner_id] += 1
+        if self._updates[owner_id] >= self.repair_every:
+            del self._lists[owner_id]
+
+    def _on_rating(self, user: User, movie_id: int, rating, old_rating):
+        if not self._lists:
+            return
+        count = (rating is not None) - (old_rating is not None)
+        for other_id, other_rating in self._data_manager.get_movie_ratings(movie_id).items():
+            if other_id == user.user_id:
+                continue
+            own = self._lists.get(user.user_id)
+            theirs = self._lists.get(other_id)
+            if own is None and theirs is None:
+                continue
+            own_state = own.get(other_id) if own is not None else None
+            their_state = theirs.get(user.user_id) if theirs is not None else None
+
+            # состояние пары общее для обеих сторон: приращение к известному или расчёт с нуля
+            known = own_state if own_state is not None else their_state
+            if known is not None:
+                diff = (abs(rating - other_rating) if rating is not None else 0.0) - \
+                       (abs(old_rating - other_rating) if old_rating is not None else 0.0)
+                state = [known[0] + diff, known[1] + count]
+            else:
+                state = self._pair_state(user, other_id)
+
+            if own is not None:
+                self._update(user.user_id, own, other_id, list(state), own_state is not None)
+            if theirs is not None:
+                self._update(other_id, theirs, user.user_id, list(state), their_state is not None)
+
+    def neighbors(self, user: User):
+        #{id соседа: сходство} - не больше max_neighbors лучших соседей со сходством не ниже порога
+        neighbors = self._lists.get(user.user_id)
+        if neighbors is None:
+            neighbors = self._build(user)
+        if self.max_neighbors is not None and (len(neighbors) > self.max_neighbors or user.user_id in self._floors):
+            best = heapq.nlargest(self.max_neighbors, neighbors,
+                                  key=lambda other_id: self._rank(other_id, neighbors[other_id]))
+            floor = self._floors.get(user.user_id)
+            if floor is not None and (len(best) < self.max_neighbors or
+                                      self._rank(best[-1], neighbors[best[-1]]) < floor):
+                # соседи из списка опустились ниже тех, кто в него не попал - считаем заново
+                neighbors = self._build(user)
+                best = heapq.nlargest(self.max_neighbors, neighbors,
+                                      key=lambda other_id: self._rank(other_id, neighbors[other_id]))
+            neighbors = {other_id: neighbors[other_id] for other_id in best}
+        return {other_id: self._similarity(state) for other_id, state in neighbors.items()}
 
-        for movie in self._data_manager.get_all_movies():
-            if movie.movie_id not in watched_ids:
-                if movie.rating >= min_rating and movie.year >= min_year:
-                    recommendations.append(movie)
 
-        recommendations.sort(key = lambda x: x.rating, reverse=True)
-        return recommendations[:max_results]
-    
 class SimilarUserStrategy(RecommendationStrategy):
+    MIN_SIMILARITY = 0.3 # менее похожие пользователи не учитываются
+
+    def __init__(self, data_manager: DataManager, ann_index: Optional[UserLSHIndex] = None,
+                 neighbor_index: Optional[UserNeighborIndex] = None):
+        super().__init__(data_manager)
+        self.ann_index = ann_index # если задан - точный счёт только по кандидатам из индекса
+        self.neighbor_index = neighbor_index # если задан - готовые списки соседей вместо расчёта
+
     def _calculate_similarity(self, user1: User, user2:User):
-        watched1 = set(user1.watched_movies.keys()) # получаем id
-        watched2 = set(user2.watched_movies.keys())
-        common = watched1 & watched2 
+        ratings1 = user1.watched_movies
+        ratings2 = user2.watched_movies
+        common = ratings1.keys() & ratings2.keys() # общие id
 
         if not common:
             return 0.0
         
         total_diff = 0.0 #сумма разниц
         for movie_id in common:
-            diff = abs(user1.watched_movies[movie_id] - user2.watched_movies[movie_id]) #разница в оценке фильма
+            diff = abs(ratings1[movie_id] - ratings2[movie_id]) #разница в оценке фильма
             total_diff += diff
 
         avg_diff = total_diff/ len(common) #если вкусы почти совпадают то число близко к 0, если сильно расходятся то ближе к 10
         #чтобы из макс 10 сделать 0 или 1. делим на 10. (avg_diff/10) - насколько они разные, нам надо наоборот, поэтому вычитаем из 1
         return max(0.0, 1.0 - (avg_diff/10)) #чем ближе к 1 тем более похожи
     
-    def get_recommendations(self, user: User, min_rating: float = 0.0, min_year: int = 0, max_results : int = 10):
+    @instrumented("similar.similarities")
+    def _similarities(self, user: User):
+        # сходство пользователя со всеми остальными за один проход по столбцам матрицы:
+        # пользователи без общих фильмов в столбцах не встречаются, их сходство и так 0
+        diff_sums: Dict[int, float] = {}
+        counts: Dict[int, int] = {}
+        for movie_id, rating in user.watched_movies.items():
+            for other_id, other_rating in self._data_manager.get_movie_ratings(movie_id).items():
+                if other_id == user.user_id:
+                    continue
+                diff_sums[other_id] = diff_sums.get(other_id, 0.0) + abs(rating - other_rating)
+                counts[other_id] = counts.get(other_id, 0) + 1
+
+        metrics.count("similar.pairs", len(counts))
+        return {other_id: max(0.0, 1.0 - (diff_sums[other_id] / counts[other_id]) / 10)
+                for other_id in counts}
+
+    @instrumented("similar.similarities")
+    def _indexed_similarities(self, user: User):
+        similarities = self.neighbor_index.neighbors(user)
+        metrics.count("similar.pairs", len(similarities))
+        return similarities
+
+    @instrumented("similar.similarities")
+    def _candidate_similarities(self, user: User):
+        # кандидаты из приближённого индекса переранжируются точной формулой
+        similarities = {}
+        candidates = self.ann_index.candidates(user)
+        metrics.count("similar.pairs", len(candidates))
+        for other_id in candidates:
+            similarity = self._calculate_similarity(user, self._data_manager.get_user(other_id))
+            if similarity > 0.0:
+                similarities[other_id] = similarity
+        return similarities
+
+    def user_similarities(self, user: User):
+        #{id пользователя: сходство} - из готовых списков, по кандидатам LSH или со всеми
+        if self.neighbor_index is not None:
+            return self._indexed_similarities(user)
+        if self.ann_index is not None:
+            return self._candidate_similarities(user)
+        return self._similarities(user)
 
-        watched_ids = set(user.watched_movies.keys())
+    def get_recommendations(self, user: User, min_rating: float = 0.0, min_year: int = 0, max_results : int = 10):
+        return self.get_recommendations_with_dependencies(user, min_rating, min_year, max_results)[0]
+
+    def _scores(self, user: User, min_rating: float, min_year: int):
+        #очки фильмов {id: очки} и зависимости для кэша
+        # сходство зависит от оценок фильмов пользователя (столбцы матрицы),
+        # а очки - ещё и от всех оценок похожих пользователей
+        dependencies = [("movie", movie_id, self._data_manager.get_version("movie", movie_id))
+                        for movie_id in user.watched_movies]
+        if self.neighbor_index is None and self.ann_index is not None:
+            # кандидаты LSH меняются, когда другие пользователи переходят между корзинами
+            dependencies.extend(self.ann_index.dependencies(user))
+
+        watched_ids = user.watched_movies.keys()
         movie_scores: Dict[int, float] = {}
 
-        for other_user in self._data_manager.get_all_users():
-            if other_user.user_id == user.user_id:
-                continue
-
-            similarity = self._calculate_similarity(user, other_user)
-            if similarity <  0.3:
+        similarities = self.user_similarities(user)
+        started = metrics.start()
+        for other_id in sorted(similarities): # порядок как в get_all_users
+            similarity = similarities[other_id]
+            if similarity < self.MIN_SIMILARITY:
                 continue # слишком не похожий пользователь
 
+            other_user = self._data_manager.get_user(other_id)
+            dependencies.append(("user", other_id, other_user.version))
             for movie_id, rating in other_user.watched_movies.items():
                 if movie_id not in watched_ids:
                     score = similarity * rating
                     #складываются все score для каждого фильма от разных пользователе
                     movie_scores[movie_id] = movie_scores.get(movie_id, 0.0) + score
+        metrics.stop("similar.scoring", started)
+        # фильтры - по набравшим очки кандидатам, каждый проверяется один раз
+        return self._data_manager.filter_movie_scores(movie_scores, min_rating, min_year), dependencies
+
+    def _ranked(self, movie_scores: Dict[int, float]):
+        # куча вместо полной сортировки: каждый следующий фильм - за log n;
+        # при равных очках выше тот, кто раньше набрал очки (как при устойчивой сортировке)
+        heap = [(-score, order, movie_id) for order, (movie_id, score) in enumerate(movie_scores.items())]
+        heapq.heapify(heap)
+        while heap:
+            movie = self._data_manager.get_movie(heapq.heappop(heap)[2])
+            if movie: # фильтры уже применены до подсчёта очков
+                yield movie
+
+    def get_recommendations_with_dependencies(self, user: User, min_rating: float = 0.0, min_year: int = 0,
+                                              max_results: int = 10):
+        movie_scores, dependencies = self._scores(user, min_rating, min_year)
+        started = metrics.start()
+        recommendations = list(itertools.islice(self._ranked(movie_scores), max_results))
+        metrics.stop("similar.sorting", started)
+        return recommendations, dependencies
+
+    def iter_recommendations(self, user: User, min_rating: float = 0.0, min_year: int = 0):
+        yield from self._ranked(self._scores(user, min_rating, min_year)[0])
+
+    def iter_recommendations_with_dependencies(self, user: User, min_rating: float = 0.0, min_year: int = 0):
+        movie_scores, dependencies = self._scores(user, min_rating, min_year)
+        return self._ranked(movie_scores), dependencies
+
+
+# Смешанная стратегия: жанры, рейтинг каталога и похожие пользователи за один проход.
+# Кандидаты (не просмотренные фильмы, прошедшие фильтры) отбираются один раз, очки всех
+# составляющих с весами складываются в один массив, лучшие выбираются кучей без полной сортировки
+class HybridStrategy(RecommendationStrategy):
+    WEIGHTS = {"genre": 1.0, "rating": 1.0, "similar": 1.0}
+
+    def __init__(self, data_manager: DataManager, weights: Optional[Dict[str, float]] = None,
+                 similar: Optional[SimilarUserStrategy] = None):
+        super().__init__(data_manager)
+        unknown = set(weights or {}) - self.WEIGHTS.keys()
+        if unknown:
+            raise ValueError(f"Неизвестные составляющие смешанной стратегии: {', '.join(sorted(unknown))}")
+        self.weights = {**self.WEIGHTS, **(weights or {})}
+        self._genre = GenreBasedStrategy(data_manager)
+        # поиск похожих пользователей (и его индексы) общий с обычной стратегией
+        self._similar = similar if similar is not None else SimilarUserStrategy(data_manager)
+
+    def get_recommendations(self, user: User, min_rating: float = 0.0, min_year: int = 0, max_results: int = 10):
+        return self.get_recommendations_with_dependencies(user, min_rating, min_year, max_results)[0]
+
+    def _scores(self, user: User, min_rating: float, min_year: int):
+        #кандидаты, их очки (списки одной длины) и зависимости для кэша;
+        # каждая составляющая приведена к шкале 0..1 и умножена на свой вес:
+        # жанр - 1, если у фильма есть любимый жанр; рейтинг - рейтинг каталога / 10;
+        # похожие - сумма сходство * оценка по соседям, делённая на 10 * сумму сходств
+        weights = self.weights
+        watched_ids = user.watched_movies.keys()
+        preferred = set(self._genre.preferred_genres(user)) if weights["genre"] else set()
+
+        started = metrics.start()
+        movie_ids: List[int] = []
+        positions: Dict[int, int] = {}
+        scores: List[float] = [] # список, а не array: в горячем цикле не нужно упаковывать float
+        genre_weight, rating_weight = weights["genre"], weights["rating"] / 10
+        for movie_id, year, rating, genres in self._data_manager.catalog.entries():
+            if rating < min_rating or year < min_year or movie_id in watched_ids:
+                continue
+            score = rating * rating_weight
+            if preferred and not preferred.isdisjoint(genres):
+                score += genre_weight
+            positions[movie_id] = len(movie_ids)
+            movie_ids.append(movie_id)
+            scores.append(score)
+        metrics.stop("hybrid.candidates", started)
+
+        dependencies = []
+        if weights["similar"] and positions:
+            dependencies = [("movie", movie_id, self._data_manager.get_version("movie", movie_id))
+                            for movie_id in watched_ids]
+            similarities = {other_id: similarity
+                            for other_id, similarity in self._similar.user_similarities(user).items()
+                            if similarity >= SimilarUserStrategy.MIN_SIMILARITY}
+            total = sum(similarities.values())
+            started = metrics.start()
+            get_position = positions.get
+            for other_id in sorted(similarities):
+                other_user = self._data_manager.get_user(other_id)
+                dependencies.append(("user", other_id, other_user.version))
+                weight = weights["similar"] * similarities[other_id] / (10 * total)
+                for movie_id, rating in other_user.watched_movies.items():
+                    position = get_position(movie_id)
+                    if position is not None:
+                        scores[position] += weight * rating
+            metrics.stop("hybrid.neighbors", started)
+        return movie_ids, scores, dependencies
+
+    def _ranked(self, movie_ids: List[int], scores: List[float]):
+        # куча по всем кандидатам, лучшие достаются по одному;
+        # при равных очках выше фильм, добавленный в каталог раньше
+        heap = [(-score, position) for position, score in enumerate(scores)]
+        heapq.heapify(heap)
+        while heap:
+            yield self._data_manager.get_movie(movie_ids[heapq.heappop(heap)[1]])
+
+    def get_recommendations_with_dependencies(self, user: User, min_rating: float = 0.0, min_year: int = 0,
+                                              max_results: int = 10):
+        movie_ids, scores, dependencies = self._scores(user, min_rating, min_year)
+        started = metrics.start()
+        recommendations = list(itertools.islice(self._ranked(movie_ids, scores), max_results))
+        metrics.stop("hybrid.select", started)
+        return recommendations, dependencies
+
+    def iter_recommendations(self, user: User, min_rating: float = 0.0, min_year: int = 0):
+        movie_ids, scores, _ = self._scores(user, min_rating, min_year)
+        yield from self._ranked(movie_ids, scores)
+
+    def iter_recommendations_with_dependencies(self, user: User, min_rating: float = 0.0, min_year: int = 0):
+        movie_ids, scores, dependencies = self._scores(user, min_rating, min_year)
+        return self._ranked(movie_ids, scores), dependencies
+
+
+# Данные для параллельной сборки таблицы соседей: при fork процессы-работники
+# получают их от родителя без копирования и сериализации
+_item_build_rows: Dict[int, Dict[int, float]] = {}
+_item_build_columns: Dict[int, Dict[int, float]] = {}
+
+
+def _item_similarities(movie_id: int, rows, columns, min_similarity: float):
+    #все фильмы, похожие на movie_id по оценкам общих зрителей: [(сходство, число общих зрителей, -id)]
+    diff_sums: Dict[int, float] = {}
+    counts: Dict[int, int] = {}
+    for user_id, rating in columns.get(movie_id, {}).items():
+        for other_id, other_rating in rows[user_id].items():
+            if other_id == movie_id:
+                continue
+            diff_sums[other_id] = diff_sums.get(other_id, 0.0) + abs(rating - other_rating)
+            counts[other_id] = counts.get(other_id, 0) + 1
 
-        sorted_movies = sorted(movie_scores.items(), key = lambda x: x[1], reverse = True)  
+    # та же формула, что и у похожих пользователей; при равенстве выше те, у кого больше общих зрителей
+    scored = []
+    for other_id, count in counts.items():
+        similarity = max(0.0, 1.0 - (diff_sums[other_id] / count) / 10)
+        if similarity >= min_similarity:
+            scored.append((similarity, count, -other_id))
+    return scored
 
-        recommendations = []                  
-        for movie_id, score in sorted_movies:
-            movie = self._data_manager.get_movie(movie_id)
-            if movie and movie.rating >= min_rating and movie.year >= min_year:
-                recommendations.append(movie)
-                if len(recommendations) >= max_results:
-                    break
 
-        return recommendations
+def _item_neighbors(movie_id: int, rows, columns, top_n: int, min_similarity: float):
+    #top_n фильмов, похожих на movie_id: [(id, сходство)]
+    scored = _item_similarities(movie_id, rows, columns, min_similarity)
+    return [(-neg_id, similarity) for similarity, _, neg_id in heapq.nlargest(top_n, scored)]
+
+
+def _item_neighbors_chunk(args):
+    movie_ids, top_n, min_similarity = args
+    return [(movie_id, _item_neighbors(movie_id, _item_build_rows, _item_build_columns, top_n, min_similarity))
+            for movie_id in movie_ids]
+
+
+# Таблица соседей фильмов: компактный двоичный файл, читается через mmap
+class ItemNeighborTable:
+    MAGIC = b"RIN1"
+    HEADER = struct.Struct("<4sII") # сигнатура, число фильмов, top_n
+    INDEX_ENTRY = struct.Struct("<iII") # id фильма, номер первого соседа, число соседей
+    NEIGHBOR = struct.Struct("<if") # id соседа, сходство
+
+    def __init__(self, neighbors: Optional[Dict[int, List[tuple]]] = None, top_n: int = 20):
+        self.top_n = top_n
+        self._overlay: Dict[int, List[tuple]] = dict(neighbors or {}) # списки в памяти поверх файла
+        self._mmap = None
+        self._count = 0
+
+    @classmethod
+    def build(cls, data_manager: DataManager, top_n: int = 20, min_similarity: float = 0.3,
+              processes: Optional[int] = None, chunk_size: int = 256):
+        #офлайн-сборка по всем оценкам; processes > 1 - параллельно в пуле процессов
+        global _item_build_rows, _item_build_columns
+        _item_build_rows = {user.user_id: dict(user.watched_movies) for user in data_manager.get_all_users()}
+        _item_build_columns = {}
+        for user_id, ratings in _item_build_rows.items():
+            for movie_id, rating in ratings.items():
+                _item_build_columns.setdefault(movie_id, {})[user_id] = rating
+
+        movie_ids = sorted(_item_build_columns)
+        chunks = [(movie_ids[i:i + chunk_size], top_n, min_similarity)
+                  for i in range(0, len(movie_ids), chunk_size)]
+        neighbors = {}
+        try:
+            if processes == 1 or len(chunks) <= 1:
+                results = map(_item_neighbors_chunk, chunks)
+                for chunk in results:
+                    neighbors.update(chunk)
+            else:
+                if "fork" not in multiprocessing.get_all_start_methods():
+                    raise RuntimeError("Параллельная сборка требует fork; используйте processes=1")
+                with multiprocessing.get_context("fork").Pool(processes) as pool:
+                    for chunk in pool.imap_unordered(_item_neighbors_chunk, chunks):
+                        neighbors.update(chunk)
+        finally:
+            _item_build_rows, _item_build_columns = {}, {}
+        return cls(neighbors, top_n)
+
+    def save(self, path: str):
+        movie_ids = sorted(set(self._overlay) | set(self._file_movie_ids()))
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, len(movie_ids), self.top_n))
+            position = 0
+            lists = []
+            for movie_id in movie_ids:
+                neighbors = self.get(movie_id)
+                f.write(self.INDEX_ENTRY.pack(movie_id, position, len(neighbors)))
+                position += len(neighbors)
+                lists.append(neighbors)
+            for neighbors in lists:
+                for neighbor_id, similarity in neighbors:
+                    f.write(self.NEIGHBOR.pack(neighbor_id, similarity))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def open(cls, path: str):
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, top_n = cls.HEADER.unpack_from(data, 0)
+        if magic != cls.MAGIC:
+            raise ValueError(f"{path}: не таблица соседей фильмов")
+        table = cls(top_n=top_n)
+        table._mmap = data
+        table._count = count
+        return table
+
+    def _file_entry(self, i: int):
+        return self.INDEX_ENTRY.unpack_from(self._mmap, self.HEADER.size + i * self.INDEX_ENTRY.size)
+
+    def _file_movie_ids(self):
+        return [self._file_entry(i)[0] for i in range(self._count)]
+
+    def _file_get(self, movie_id: int):
+        # двоичный поиск по отсортированному индексу прямо в отображённом файле
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry_id, start, count = self._file_entry(mid)
+            if entry_id == movie_id:
+                base = self.HEADER.size + self._count * self.INDEX_ENTRY.size + start * self.NEIGHBOR.size
+                return [self.NEIGHBOR.unpack_from(self._mmap, base + k * self.NEIGHBOR.size) for k in range(count)]
+            if entry_id < movie_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        return []
+
+    def get(self, movie_id: int):
+        #соседи фильма: [(id, сходство)] по убыванию сходства
+        neighbors = self._overlay.get(movie_id)
+        if neighbors is not None:
+            return neighbors
+        return self._file_get(movie_id) if self._mmap is not None else []
+
+    def set(self, movie_id: int, neighbors: List[tuple]):
+        self._overlay[movie_id] = neighbors
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+
+# Похожие фильмы (item-item): соседи просмотренных фильмов считаются заранее
+class ItemSimilarityStrategy(RecommendationStrategy):
+    def __init__(self, data_manager: DataManager, table: Optional[ItemNeighborTable] = None,
+                 table_path: Optional[str] = None, top_n: int = 20, min_similarity: float = 0.3):
+        super().__init__(data_manager)
+        self.table_path = table_path
+        self.top_n = top_n
+        self.min_similarity = min_similarity
+        self._table = table
+        self._dirty = set() # фильмы с новыми оценками, чьи списки соседей устарели
+        self._related = set() # фильмы, потерявшие общих зрителей с изменёнными (пользователь заменён)
+        self._refresh_lock = threading.RLock() # пересчёт соседей из нескольких читающих потоков
+        # версии списков соседей для кэша: меняются, когда обновление меняет список
+        self._list_versions: Dict[int, int] = {}
+        self._version_kind = f"item_neighbors.{id(self)}"
+        data_manager.add_rating_listener(self._on_rating)
+        data_manager.add_version_source(self._version_kind, self._list_version)
+
+    def _list_version(self, movie_id: int):
+        # пока новые оценки не учтены, любой список мог измениться
+        return None if self._dirty else self._list_versions.get(movie_id, 0)
+
+    def _on_rating(self, user: User, movie_id: int, rating, old_rating):
+        self._dirty.add(movie_id)
+        if rating is None: # оценка убрана: у остальных фильмов пользователя сходство с этим изменилось
+            self._related.update(user.watched_movies.keys())
+
+    @property
+    def table(self):
+        if self._table is None:
+            with self._refresh_lock:
+                if self._table is None:
+                    if self.table_path and os.path.exists(self.table_path):
+                        table = ItemNeighborTable.open(self.table_path)
+                    else:
+                        table = ItemNeighborTable.build(self._data_manager, self.top_n, self.min_similarity,
+                                                        processes=1)
+                    self._dirty.clear()
+                    self._related.clear()
+                    self._table = table
+        return self._table
+
+    def refresh(self):
+        #инкрементальное обновление: пересчитываем соседей только у фильмов с новыми оценками
+        table = self.table
+        if not self._dirty:
+            return
+        with self._refresh_lock:
+            self._refresh(table)
+
+    def _refresh(self, table):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        related, self._related = self._related, set()
+        rows, columns = {}, {}
+
+        def load(movie_id):
+            columns[movie_id] = self._data_manager.get_movie_ratings(movie_id)
+            for user_id in columns[movie_id]:
+                if user_id not in rows:
+                    rows[user_id] = self._data_manager.get_user(user_id).watched_movies
+
+        def pair_key(movie_id, other_id):
+            #(сходство, число общих зрителей, -id) одной пары - как в _item_similarities, тем же порядком сложения
+            column = columns.get(movie_id) or self._data_manager.get_movie_ratings(movie_id)
+            other = columns.get(other_id) or self._data_manager.get_movie_ratings(other_id)
+            diff_sum, count = 0.0, 0
+            for user_id, rating in column.items():
+                other_rating = other.get(user_id)
+                if other_rating is not None:
+                    diff_sum += abs(rating - other_rating)
+                    count += 1
+            return (max(0.0, 1.0 - (diff_sum / count) / 10) if count else 0.0), count, -other_id
+
+        def update(movie_id, neighbors):
+            if neighbors != table.get(movie_id):
+                table.set(movie_id, neighbors)
+                self._list_versions[movie_id] = next(_version_clock)
+
+        def rebuild(movie_id, scored):
+            update(movie_id, [(-neg_id, similarity) for similarity, _, neg_id in heapq.nlargest(table.top_n, scored)])
+
+        # новые сходства изменённых фильмов со всеми, у кого есть общие зрители
+        added = {} # фильм -> [(сходство, число общих зрителей, -id изменённого фильма)]
+        for movie_id in dirty:
+            load(movie_id)
+        for movie_id in dirty:
+            scored = _item_similarities(movie_id, rows, columns, self.min_similarity)
+            for similarity, count, neg_id in scored:
+                added.setdefault(-neg_id, []).append((similarity, count, -movie_id))
+            rebuild(movie_id, scored)
+
+        # у остальных фильмов меняются только пары с изменёнными: список правится на месте,
+        # а если так нельзя - пересчитывается целиком
+        candidates = set(related)
+        for movie_id in dirty:
+            for user_id in columns[movie_id]:
+                candidates.update(rows[user_id].keys())
+        candidates -= dirty
+        for movie_id in candidates:
+            neighbors = table.get(movie_id)
+            if movie_id not in added and not any(neighbor_id in dirty for neighbor_id, _ in neighbors):
+                continue
+            patched = self._patch(movie_id, neighbors, added.get(movie_id, []), dirty, table.top_n, pair_key)
+            if patched is not None:
+                update(movie_id, patched)
+                continue
+            if movie_id not in columns:
+                load(movie_id)
+            rebuild(movie_id, _item_similarities(movie_id, rows, columns, self.min_similarity))
+
+    @staticmethod
+    def _patch(movie_id: int, neighbors, added, dirty, top_n: int, pair_key):
+        #список соседей с новыми сходствами изменённых фильмов; None - если без пересчёта нельзя:
+        #на место выпавшего из полного списка может претендовать фильм, которого в старом списке не было.
+        #При равном сходстве порядок решает число общих зрителей, его для такой пары считает pair_key
+        eps = 1e-6 # запас на округление сходства до float32 в файле таблицы
+        kept = [entry for entry in neighbors if entry[0] not in dirty]
+        above = sorted(added, reverse=True)
+        if len(neighbors) >= top_n:
+            # фильмы вне полного списка не выше его последнего
+            floor_id, floor_similarity = neighbors[-1]
+            if floor_id in dirty and any(abs(entry[0] - floor_similarity) <= eps for entry in above):
+                return None # прежнее число общих зрителей с последним неизвестно
+            above = [entry for entry in above
+                     if (entry[0] > floor_similarity if abs(entry[0] - floor_similarity) > eps
+                         else entry > pair_key(movie_id, floor_id))]
+            if len(kept) + len(above) < top_n:
+                return None
+
+        merged, i = [], 0
+        for entry in above:
+            while i < len(kept) and (entry[0] < kept[i][1] - eps or (abs(entry[0] - kept[i][1]) <= eps and
+                                                                     entry < pair_key(movie_id, kept[i][0]))):
+                merged.append(kept[i])
+                i += 1
+            merged.append((-entry[2], entry[0]))
+        merged.extend(kept[i:])
+        return merged[:top_n]
+
+    def get_recommendations(self, user: User, min_rating: float = 0.0, min_year: int = 0, max_results: int = 10):
+        return self.get_recommendations_with_dependencies(user, min_rating, min_year, max_results)[0]
+
+    def _scores(self, user: User, min_rating: float, min_year: int):
+        #очки фильмов {id: очки} и зависимости для кэша
+        self.refresh()
+        watched_ids = user.watched_movies.keys()
+        movie_scores: Dict[int, float] = {}
+        # очки зависят от оценок пользователя и списков соседей его фильмов: у каждого списка своя
+        # версия, она меняется и тогда, когда в список входит фильм с новыми оценками
+        dependencies = []
+
+        for movie_id, rating in user.watched_movies.items():
+            dependencies.append((self._version_kind, movie_id, self._list_version(movie_id)))
+            for neighbor_id, similarity in self.table.get(movie_id):
+                if neighbor_id not in watched_ids:
+                    movie_scores[neighbor_id] = movie_scores.get(neighbor_id, 0.0) + similarity * rating
+        return self._data_manager.filter_movie_scores(movie_scores, min_rating, min_year), dependencies
+
+    def _ranked(self, movie_scores: Dict[int, float]):
+        # куча: лучшие по одному, при равных очках - меньший id
+        heap = [(-score, movie_id) for movie_id, score in movie_scores.items()]
+        heapq.heapify(heap)
+        while heap:
+            movie = self._data_manager.get_movie(heapq.heappop(heap)[1])
+            if movie:
+                yield movie
+
+    def get_recommendations_with_dependencies(self, user: User, min_rating: float = 0.0, min_year: int = 0,
+                                              max_results: int = 10):
+        movie_scores, dependencies = self._scores(user, min_rating, min_year)
+        return list(itertools.islice(self._ranked(movie_scores), max_results)), dependencies
+
+    def iter_recommendations(self, user: User, min_rating: float = 0.0, min_year: int = 0):
+        yield from self._ranked(self._scores(user, min_rating, min_year)[0])
+
+    def iter_recommendations_with_dependencies(self, user: User, min_rating: float = 0.0, min_year: int = 0):
+        movie_scores, dependencies = self._scores(user, min_rating, min_year)
+        return self._ranked(movie_scores), dependencies
+
+
+# Латентные факторы: модель обучается отдельной командой и хранится версиями в каталоге
+class FactorModel:
+    def __init__(self, user_ids, movie_ids, user_factors, item_factors, global_mean: float, reg: float,
+                 version: Optional[str] = None):
+        self.user_ids = user_ids # отсортированные id пользователей, строки user_factors
+        self.movie_ids = movie_ids # отсортированные id фильмов, строки item_factors
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+        self.global_mean = global_mean
+        self.reg = reg
+        self.version = version
+
+    @staticmethod
+    def _require_numpy():
+        if np is None:
+            raise RuntimeError("Для матричной факторизации нужен пакет numpy")
+
+    @staticmethod
+    def _als_step(fixed, indptr, indices, values, reg: float):
+        #одна половина ALS: каждая строка - гребневая регрессия по факторам второй стороны
+        k = fixed.shape[1]
+        out = np.zeros((len(indptr) - 1, k))
+        eye = np.eye(k)
+        for row in range(len(indptr) - 1):
+            start, end = indptr[row], indptr[row + 1]
+            if start == end:
+                continue
+            factors = fixed[indices[start:end]]
+            a = factors.T @ factors + reg * (end - start) * eye
+            out[row] = np.linalg.solve(a, factors.T @ values[start:end])
+        return out
+
+    @staticmethod
+    def _compress(keys, indices, values, n_rows: int):
+        #CSR по keys: указатели строк, индексы столбцов, значения
+        order = np.argsort(keys, kind="stable")
+        indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys, minlength=n_rows), out=indptr[1:])
+        return indptr, indices[order], values[order]
+
+    @classmethod
+    def train(cls, data_manager: DataManager, factors: int = 32, iterations: int = 10, reg: float = 0.1,
+              seed: int = 0):
+        cls._require_numpy()
+        users = [user for user in data_manager.get_all_users() if user.watched_movies]
+        user_ids = np.array(sorted(user.user_id for user in users), dtype=np.int64)
+        movie_ids = np.array(sorted({movie_id for user in users for movie_id in user.watched_movies}),
+                             dtype=np.int64)
+
+        n_ratings = sum(len(user.watched_movies) for user in users)
+        rows = np.empty(n_ratings, dtype=np.int64)
+        cols = np.empty(n_ratings, dtype=np.int64)
+        values = np.empty(n_ratings)
+        position = 0
+        for user in users:
+            ratings = user.watched_movies
+            end = position + len(ratings)
+            rows[position:end] = np.searchsorted(user_ids, user.user_id)
+            cols[position:end] = np.searchsorted(movie_ids, np.fromiter(ratings.keys(), dtype=np.int64))
+            values[position:end] = np.fromiter(ratings.values(), dtype=float)
+            position = end
+
+        global_mean = float(values.mean()) if n_ratings else 0.0
+        values -= global_mean
+        by_user = cls._compress(rows, cols, values, len(user_ids))
+        by_movie = cls._compress(cols, rows, values, len(movie_ids))
+
+        rng = np.random.default_rng(seed)
+        user_factors = rng.normal(0.0, 0.1, (len(user_ids), factors))
+        item_factors = rng.normal(0.0, 0.1, (len(movie_ids), factors))
+        for _ in range(iterations):
+            user_factors = cls._als_step(item_factors, *by_user, reg)
+            item_factors = cls._als_step(user_factors, *by_movie, reg)
+        return cls(user_ids, movie_ids, user_factors, item_factors, global_mean, reg)
+
+    def save(self, directory: str):
+        #новая версия в отдельном подкаталоге, затем атомарно переключаем LATEST
+        os.makedirs(directory, exist_ok=True)
+        versions = [name for name in os.listdir(directory) if name.startswith("v") and name[1:].isdigit()]
+        version = f"v{max((int(name[1:]) for name in versions), default=0) + 1:04d}"
+        path = os.path.join(directory, version)
+        os.makedirs(path)
+        for name in ("user_ids", "movie_ids", "user_factors", "item_factors"):
+            np.save(os.path.join(path, name + ".npy"), getattr(self, name))
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"global_mean": self.global_mean, "reg": self.reg,
+                       "factors": int(self.item_factors.shape[1])}, f)
+
+        latest = os.path.join(directory, "LATEST")
+        with open(latest + ".tmp", "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(latest + ".tmp", latest)
+        self.version = version
+        return version
+
+    @classmethod
+    def load(cls, directory: str, version: Optional[str] = None):
+        cls._require_numpy()
+        if version is None:
+            with open(os.path.join(directory, "LATEST"), encoding="utf-8") as f:
+                version = f.read().strip()
+        path = os.path.join(directory, version)
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        # массивы отображаются в память, а не читаются целиком
+        arrays = [np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+                  for name in ("user_ids", "movie_ids", "user_factors", "item_factors")]
+        return cls(*arrays, meta["global_mean"], meta["reg"], version)
+
+    def user_vector(self, user_id: int):
+        row = np.searchsorted(self.user_ids, user_id)
+        if row < len(self.user_ids) and self.user_ids[row] == user_id:
+            return np.asarray(self.user_factors[row])
+        return None
+
+    def movie_rows(self, movie_ids):
+        #строки модели для id фильмов и маска тех id, что есть в модели
+        movie_ids = np.fromiter(movie_ids, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.movie_ids, movie_ids), max(len(self.movie_ids) - 1, 0))
+        known = self.movie_ids[rows] == movie_ids if len(self.movie_ids) else np.zeros(len(movie_ids), bool)
+        return rows[known], known
+
+    def fold_in(self, ratings):
+        #вектор нового пользователя по его оценкам без переобучения модели
+        rows, known = self.movie_rows(ratings.keys())
+        if not len(rows):
+            return None
+        values = np.fromiter(ratings.values(), dtype=float, count=len(ratings))[known]
+        factors = np.asarray(self.item_factors[rows])
+        a = factors.T @ factors + self.reg * len(rows) * np.eye(factors.shape[1])
+        return np.linalg.solve(a, factors.T @ (values - self.global_mean))
+
+
+class MatrixFactorizationStrategy(RecommendationStrategy):
+    def __init__(self, data_manager: DataManager, model_dir: str = "factors", model: Optional[FactorModel] = None):
+        super().__init__(data_manager)
+        self.model_dir = model_dir
+        self._model = model
+        self._changed_users = set() # у этих пользователей оценки новее модели - считаем fold-in
+        self._catalog = None # (версия каталога, рейтинги, годы) в порядке строк модели
+        data_manager.add_rating_listener(self._on_rating)
+
+    def _on_rating(self, user: User, movie_id: int, rating, old_rating):
+        self._changed_users.add(user.user_id)
+
+    @property
+    def model(self):
+        if self._model is None:
+            if not os.path.exists(os.path.join(self.model_dir, "LATEST")):
+                raise RuntimeError("Модель не обучена: python recomandator3000.py train-factors")
+            self._model = FactorModel.load(self.model_dir)
+        return self._model
+
+    def _catalog_arrays(self):
+        version = self._data_manager.catalog_version
+        if self._catalog is None or self._catalog[0] != version:
+            catalog = self._data_manager.catalog
+            movie_ids = [int(movie_id) for movie_id in self.model.movie_ids]
+            ratings = np.array([catalog.rating(movie_id) if movie_id in catalog else -np.inf for movie_id in movie_ids])
+            years = np.array([catalog.year(movie_id) if movie_id in catalog else -1 for movie_id in movie_ids])
+            self._catalog = (version, ratings, years)
+        return self._catalog[1], self._catalog[2]
+
+    def _scores(self, user: User, min_rating: float, min_year: int):
+        #очки всех фильмов модели (по строкам), отфильтрованные -inf; None - вектора пользователя нет
+        model = self.model
+        vector = None
+        if user.user_id not in self._changed_users:
+            vector = model.user_vector(user.user_id)
+        if vector is None and user.watched_movies:
+            vector = model.fold_in(user.watched_movies)
+        if vector is None:
+            return None
+
+        # одно умножение матрицы на вектор, фильтры - маской
+        scores = np.asarray(model.item_factors) @ vector
+        ratings, years = self._catalog_arrays()
+        scores[(ratings < min_rating) | (years < min_year)] = -np.inf
+        scores[model.movie_rows(user.watched_movies.keys())[0]] = -np.inf
+        return scores
+
+    def iter_recommendations(self, user: User, min_rating: float = 0.0, min_year: int = 0):
+        # все очки уже в массиве numpy: одна сортировка в C дешевле кучи на Python
+        scores = self._scores(user, min_rating, min_year)
+        if scores is None:
+            return
+        model = self.model
+        for row in np.argsort(-scores, kind="stable"):
+            if not np.isfinite(scores[row]):
+                return
+            yield self._data_manager.get_movie(int(model.movie_ids[row]))
+
+    def get_recommendations(self, user: User, min_rating: float = 0.0, min_year: int = 0, max_results: int = 10):
+        scores = self._scores(user, min_rating, min_year) if max_results > 0 else None
+        if scores is None:
+            return []
+        model = self.model
+
+        k = min(max_results, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [self._data_manager.get_movie(int(model.movie_ids[row])) for row in top if np.isfinite(scores[row])]
+
+
+def create_strategies(data_manager: DataManager, item_index: str = "item_neighbors.bin",
+                      factors_dir: str = "factors", use_ann: bool = False, max_neighbors: int = 0,
+                      hybrid_weights: Optional[Dict[str, float]] = None):
+    #все стратегии по именам, в порядке пунктов меню
+    similar = SimilarUserStrategy(data_manager, UserLSHIndex(data_manager) if use_ann else None,
+                                  UserNeighborIndex(data_manager, max_neighbors) if max_neighbors else None)
+    return {
+        "genre": GenreBasedStrategy(data_manager),
+        "rating": RatingBasedStrategy(data_manager),
+        "similar": similar,
+        "item": ItemSimilarityStrategy(data_manager, table_path=item_index),
+        "factors": MatrixFactorizationStrategy(data_manager, factors_dir),
+        "hybrid": HybridStrategy(data_manager, hybrid_weights, similar),
+    }
+
+
+def parse_weights(text: str):
+    #"genre=1,rating=0.5,similar=2" -> {"genre": 1.0, ...}
+    weights = {}
+    for part in text.split(","):
+        name, sep, value = part.partition("=")
+        if not sep or name.strip() not in HybridStrategy.WEIGHTS:
+            raise argparse.ArgumentTypeError(f"ожидается список вида genre=1,rating=1,similar=1: {text}")
+        try:
+            weights[name.strip()] = float(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"вес должен быть числом: {part}")
+    return weights
+
+
+# Пакетный расчёт рекомендаций для всех пользователей в пуле процессов.
+# Стратегия и данные задаются до fork, работники читают их из памяти родителя.
+_batch_strategy: Optional[RecommendationStrategy] = None
+_batch_args: tuple = ()
+
+
+def _batch_chunk(user_ids: List[int]):
+    data_manager = _batch_strategy._data_manager
+    lines = []
+    for user_id in user_ids:
+        movies = _batch_strategy.get_recommendations(data_manager.get_user(user_id), *_batch_args)
+        lines.append(f"{user_id}\t{','.join(str(movie.movie_id) for movie in movies)}\n")
+    return len(user_ids), "".join(lines)
+
+
+def run_batch(strategy: RecommendationStrategy, out, min_rating: float = 0.0, min_year: int = 0,
+              max_results: int = 10, processes: Optional[int] = None, chunk_size: int = 500,
+              progress=None, progress_every: float = 5.0):
+    #пишет в out строки "id пользователя<TAB>id фильмов через запятую", возвращает (число, пользователей/с)
+    global _batch_strategy, _batch_args
+    users = strategy._data_manager.get_all_users()
+    if users:
+        strategy.get_recommendations(users[0], min_rating, min_year, max_results) # прогрев ленивых индексов до fork
+    user_ids = [user.user_id for user in users]
+    chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+
+    _batch_strategy, _batch_args = strategy, (min_rating, min_year, max_results)
+    start = last_report = time.perf_counter()
+    done = 0
+    try:
+        if processes == 1 or len(chunks) <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+            pool, imap = nullcontext(), map
+        else:
+            pool = multiprocessing.get_context("fork").Pool(processes)
+            imap = pool.imap_unordered
+        with pool: # выход из with завершает процессы пула, в том числе при ошибке записи в out
+            for count, lines in imap(_batch_chunk, chunks):
+                out.write(lines)
+                done += count
+                now = time.perf_counter()
+                if progress is not None and now - last_report >= progress_every:
+                    print(f"{done}/{len(user_ids)} пользователей, {done / (now - start):.0f} польз./с",
+                          file=progress, flush=True)
+                    last_report = now
+    finally:
+        _batch_strategy, _batch_args = None, ()
+    elapsed = time.perf_counter() - start
+    return done, done / elapsed if elapsed > 0 else 0.0
 
 
-        
-    
-        
-        
 # Блок 3: Расширение системы и интерфейс
 class MovieRecommendationApp:
 
-    def __init__(self):
-        self.data_manager = DataManager()
+    def __init__(self, data_file: str = "data.json", item_index: str = "item_neighbors.bin",
+                 factors_dir: str = "factors", use_ann: bool = False, lazy: bool = False,
+                 max_neighbors: int = 0, hybrid_weights: Optional[Dict[str, float]] = None):
+        self.data_manager = DataManager(data_file, lazy=lazy)
         self.current_user: Optional[User] = None
+        self.cache = RecommendationCache(self.data_manager)
 
-        self.strategies = {
-            1: GenreBasedStrategy(self.data_manager),
-            2: RatingBasedStrategy(self.data_manager),
-            3: SimilarUserStrategy(self.data_manager)
-        }
+        strategies = create_strategies(self.data_manager, item_index, factors_dir, use_ann, max_neighbors,
+                                       hybrid_weights)
+        self.strategies = {i: CachedStrategy(strategy, self.cache)
+                           for i, strategy in enumerate(strategies.values(), 1)}
 
 # Главное меню
     def show_main_menu(self):                                               
@@ -398,7 +3233,8 @@ class MovieRecommendationApp:
         print("4. Оценить фильм")
         print("5. Получить рекомендации")
         print("6. Настроить предпочтения")
-        print("7. Выход")
+        print("7. Статистика производительности")
+        print("8. Выход")
         print("="*50)
 
 # Регистрация
@@ -425,7 +3261,6 @@ class MovieRecommendationApp:
         user = User(user_id, name, password)
         self.data_manager.add_user(user)
         self.current_user = user
-        self.data_manager.save_to_file()
         print(f"\nПользователь '{name}' успешно зарегистрирован!")
 
 # Вход
@@ -473,8 +3308,6 @@ class MovieRecommendationApp:
         except ValueError:
             print("Ошибка ввода!")
 
-        self.data_manager.save_to_file()
-
 # Получение рекомендаций
     def get_recommendations(self):
         if not self.current_user:
@@ -485,6 +3318,9 @@ class MovieRecommendationApp:
         print("1. По жанрам")
         print("2. По рейтингу")
         print("3. По похожим пользователям")
+        print("4. По похожим фильмам")
+        print("5. Матричная факторизация")
+        print("6. Смешанная (жанры, рейтинг и похожие пользователи)")
 
         try:
             strategy_num = int(input("Ваш выбор: "))
@@ -496,8 +3332,9 @@ class MovieRecommendationApp:
             min_year = int(input("Мин. год (по умолч. 0): ") or 0)
             max_results = int(input("Макс. результатов (по умолч. 10): ") or 10)
 
+            # страницы по max_results фильмов: следующая продолжает расчёт, а не повторяет его
             strategy = self.strategies[strategy_num]
-            recommendations = strategy.get_recommendations(
+            recommendations, cursor = strategy.get_page(
                 self.current_user, min_rating, min_year, max_results
             )
 
@@ -505,12 +3342,21 @@ class MovieRecommendationApp:
             print("-"*50)
             if not recommendations:
                 print("Нет подходящих фильмов!")
-            else:
-                for i, movie in enumerate(recommendations, 1):
+            shown = 0
+            while recommendations:
+                for i, movie in enumerate(recommendations, shown + 1):
                     print(f"{i}. {movie}")
+                shown += len(recommendations)
+                if cursor is None or input("Следующая страница? (д/н): ").strip().lower() not in ("д", "да", "y"):
+                    break
+                recommendations, cursor = strategy.get_page(
+                    self.current_user, min_rating, min_year, max_results, cursor
+                )
 
         except ValueError:
             print("Ошибка ввода!")
+        except RuntimeError as e: # стратегия не готова: нет модели или зависимостей
+            print(f"Ошибка: {e}")
 
 
 # Фильтр, препочитаемые жанры
@@ -536,7 +3382,6 @@ class MovieRecommendationApp:
 
             if selected_genres:
                 self.current_user.set_preferred_genres(selected_genres)
-                self.data_manager.save_to_file()
                 print("Предпочтения обновлены!")
             else:
                 print("Вы не выбрали жанры!")
@@ -544,8 +3389,43 @@ class MovieRecommendationApp:
         except ValueError:
             print("Ошибка ввода!")
 
+# Статистика производительности
+    def show_metrics(self):
+        print("\n" + "="*50)
+        print("СТАТИСТИКА ПРОИЗВОДИТЕЛЬНОСТИ")
+        print("="*50)
+        if not metrics.enabled:
+            answer = input("Сбор статистики выключен. Включить? (д/н): ").strip().lower()
+            if answer in ("д", "y"):
+                metrics.enabled = True
+                print("Сбор включён - статистика появится после следующих действий.")
+            return
+
+        snapshot = metrics.snapshot()
+        print(f"{'таймер':<40} {'вызовов':>8} {'среднее, мс':>12} {'макс, мс':>10}")
+        for name, timer in snapshot["timers"].items():
+            print(f"{name:<40} {timer['count']:>8} {timer['mean_ms']:>12.3f} {timer['max_ms']:>10.3f}")
+        for name, value in snapshot["counters"].items():
+            print(f"{name}: {value}")
+        cache = self.cache.stats()
+        print(f"Кэш рекомендаций: {cache['hits']} попаданий, {cache['misses']} промахов "
+              f"({cache['hit_rate']:.0%}), записей {cache['size']}/{cache['maxsize']}")
+        for row in snapshot["profile"][:10]:
+            print(f"{row['cumulative_seconds'] * 1000:>10.2f} мс  {row['calls']:>8}  {row['function']}")
+
+        path = input("\nСохранить в файл (.json или .prom, пусто - не сохранять): ").strip()
+        if path:
+            metrics.dump(path)
+            print(f"Статистика сохранена в {path}")
+
 
     def run(self):
+        try:
+            self._run_menu()
+        finally:
+            self.data_manager.close() # сворачиваем журнал в снимок при выходе
+
+    def _run_menu(self):
         while True:
             self.show_main_menu()
             choice = input("\nВыберите действие: ").strip()
@@ -563,12 +3443,327 @@ class MovieRecommendationApp:
             elif choice == "6":
                 self.set_preferences()
             elif choice == "7":
+                self.show_metrics()
+            elif choice == "8":
                 print("До свидания!")
                 break
             else:
                 print("Неверный выбор!")
 
 
+# HTTP-сервис с JSON: много клиентов на одном asyncio-цикле.
+# Работа с данными и расчёт рекомендаций выполняются в пуле потоков, чтобы не блокировать цикл;
+# согласованность даёт блокировка чтения-записи DataManager
+class RecommendationService:
+    STATUS_TEXT = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 409: "Conflict",
+                   500: "Internal Server Error"}
+
+    def __init__(self, data_manager: DataManager, strategies: Dict[str, RecommendationStrategy],
+                 workers: Optional[int] = None):
+        self.data_manager = data_manager
+        self.cache = RecommendationCache(data_manager)
+        self.strategies = {name: CachedStrategy(strategy, self.cache) for name, strategy in strategies.items()}
+        self._sessions: Dict[str, int] = {} # токен -> id пользователя
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self._routes = {
+            ("POST", "/register"): self.register,
+            ("POST", "/login"): self.login,
+            ("POST", "/rate"): self.rate,
+            ("POST", "/preferences"): self.set_preferences,
+            ("POST", "/recommend"): self.recommend,
+            ("GET", "/metrics"): self.metrics,
+        }
+        # ленивая подгрузка пользователей меняет данные и несовместима с чтением под блокировкой
+        data_manager._ensure_all_users()
+
+    # обработчики: получают разобранный JSON, возвращают (код, ответ)
+    def _session_user(self, data: dict):
+        user_id = self._sessions.get(str(data.get("token", "")))
+        return self.data_manager.get_user(user_id) if user_id is not None else None
+
+    def _new_session(self, user: User):
+        token = secrets.token_hex(16)
+        self._sessions[token] = user.user_id
+        return {"user_id": user.user_id, "token": token}
+
+    def register(self, data: dict):
+        name = str(data.get("name", "")).strip()
+        password = str(data.get("password", "")).strip()
+        if not name or not password:
+            return 400, {"error": "Имя и пароль не могут быть пустыми"}
+        with self.data_manager.writing():
+            if self.data_manager.get_user_by_name(name):
+                return 409, {"error": "Пользователь с таким именем уже существует"}
+            user = User(self.data_manager.get_next_user_id(), name, password)
+            self.data_manager.add_user(user)
+        return 200, self._new_session(user)
+
+    def login(self, data: dict):
+        with self.data_manager.reading():
+            user = self.data_manager.authenticate(str(data.get("name", "")), str(data.get("password", "")))
+        if user is None:
+            return 401, {"error": "Неправильное имя или пароль"}
+        return 200, self._new_session(user)
+
+    def rate(self, data: dict):
+        user = self._session_user(data)
+        if user is None:
+            return 401, {"error": "Нужен вход"}
+        movie_id = int(data["movie_id"])
+        rating = float(data["rating"])
+        if not 0 <= rating <= 10:
+            return 400, {"error": "Оценка должна быть от 0 до 10"}
+        if self.data_manager.get_movie(movie_id) is None:
+            return 404, {"error": "Фильм не найден"}
+        user.add_rating(movie_id, rating)
+        return 200, {"movie_id": movie_id, "rating": rating}
+
+    def set_preferences(self, data: dict):
+        user = self._session_user(data)
+        if user is None:
+            return 401, {"error": "Нужен вход"}
+        genres = parse_genres(data.get("genres", []))
+        if not genres:
+            return 400, {"error": "Не выбрано ни одного известного жанра"}
+        user.set_preferred_genres(genres)
+        return 200, {"genres": [genre.value for genre in genres]}
+
+    def recommend(self, data: dict):
+        user = self._session_user(data)
+        if user is None:
+            return 401, {"error": "Нужен вход"}
+        strategy = self.strategies.get(str(data.get("strategy", "rating")))
+        if strategy is None:
+            return 400, {"error": f"Стратегии: {', '.join(self.strategies)}"}
+        with self.data_manager.reading():
+            movies, cursor = strategy.get_page(user, float(data.get("min_rating", 0.0)), int(data.get("min_year", 0)),
+                                               int(data.get("max_results", 10)),
+                                               str(data["cursor"]) if data.get("cursor") is not None else None)
+        return 200, {"movies": [{"id": m.movie_id, "title": m.title, "year": m.year, "rating": m.rating,
+                                 "genres": [g.value for g in m.genres], "director": m.director} for m in movies],
+                     "cursor": cursor}
+
+    def metrics(self, data: dict):
+        return 200, metrics.to_prometheus()
+
+    def handle(self, method: str, path: str, body: bytes):
+        #синхронная обработка одного запроса (выполняется в пуле потоков)
+        handler = self._routes.get((method, path))
+        if handler is None:
+            return 404, {"error": "Нет такого метода"}
+        try:
+            data = json.loads(body) if body else {}
+            if not isinstance(data, dict):
+                raise ValueError("ожидается JSON-объект")
+            return handler(data)
+        except (KeyError, TypeError, ValueError) as e:
+            return 400, {"error": f"Некорректный запрос: {e}"}
+        except RuntimeError as e:
+            return 409, {"error": str(e)}
+        except Exception as e: # любая другая ошибка обработчика - ответ 500, а не оборванное соединение
+            metrics.count("service.errors")
+            return 500, {"error": f"{self.STATUS_TEXT[500]}: {type(e).__name__}"}
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        #HTTP/1.1 с keep-alive: запросы одного соединения обрабатываются по очереди
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                parts = request_line.decode("latin-1").split()
+                body = await reader.readexactly(int(headers.get("content-length") or 0))
+
+                if len(parts) != 3:
+                    status, payload = 400, {"error": "Некорректная строка запроса"}
+                else:
+                    status, payload = await loop.run_in_executor(
+                        self._executor, self.handle, parts[0], parts[1].split("?", 1)[0], body)
+
+                if isinstance(payload, str):
+                    content, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+                else:
+                    content, content_type = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json"
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(f"HTTP/1.1 {status} {self.STATUS_TEXT.get(status, '')}\r\n"
+                             f"Content-Type: {content_type}; charset=utf-8\r\n"
+                             f"Content-Length: {len(content)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1")
+                             + content)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8080, ready=None):
+        #работает до SIGINT/SIGTERM; ready(port) вызывается, когда сокет уже слушает
+        server = await asyncio.start_server(self._serve_connection, host, port)
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                asyncio.get_running_loop().add_signal_handler(signum, stop.set)
+            except (NotImplementedError, RuntimeError): # Windows или не главный поток: остаётся KeyboardInterrupt
+                pass
+        if ready is not None:
+            ready(server.sockets[0].getsockname()[1])
+        async with server:
+            await stop.wait()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self.data_manager.writing():
+            self.data_manager.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Рекомендательная система фильмов")
+    parser.add_argument("--data", default="data.json",
+                        help="файл данных: .json - снимок с журналом, .db/.sqlite - база SQLite")
+    parser.add_argument("--item-index", default="item_neighbors.bin", help="таблица соседей фильмов")
+    parser.add_argument("--factors-dir", default="factors", help="каталог версий модели факторизации")
+    parser.add_argument("--ann", action="store_true",
+                        help="искать похожих пользователей через приближённый индекс (LSH)")
+    parser.add_argument("--neighbors", type=int, default=0, metavar="M",
+                        help="хранить до M похожих пользователей на каждого и обновлять их на новых оценках")
+    parser.add_argument("--hybrid-weights", type=parse_weights, default=None, metavar="genre=1,rating=1,similar=1",
+                        help="веса составляющих смешанной стратегии")
+    parser.add_argument("--lazy", action="store_true",
+                        help="быстрый старт: пользователи data.json читаются по одному через индекс смещений")
+    parser.add_argument("--metrics", action="store_true", help="собирать статистику производительности")
+    parser.add_argument("--metrics-out",
+                        help="при выходе сохранить статистику в файл (.prom/.txt - Prometheus, иначе JSON)")
+    parser.add_argument("--profile-rate", type=float, default=0.0,
+                        help="доля инструментированных вызовов, выполняемых под cProfile (0..1)")
+    commands = parser.add_subparsers(dest="command")
+
+    build_items = commands.add_parser("build-item-index", help="офлайн-сборка таблицы похожих фильмов")
+    build_items.add_argument("--top-n", type=int, default=20, help="соседей на фильм")
+    build_items.add_argument("--processes", type=int, default=None, help="число процессов (по умолч. все ядра)")
+
+    train = commands.add_parser("train-factors", help="обучение матричной факторизации (ALS, нужен numpy)")
+    train.add_argument("--factors", type=int, default=32, help="размерность векторов")
+    train.add_argument("--iterations", type=int, default=10)
+    train.add_argument("--reg", type=float, default=0.1, help="регуляризация")
+
+    importer = commands.add_parser("import", help="потоковый импорт каталога и оценок (MovieLens CSV/TSV/.dat)")
+    importer.add_argument("--movies", help="файл фильмов: movieId, title, genres")
+    importer.add_argument("--ratings", help="файл оценок: userId, movieId, rating[, timestamp]")
+    importer.add_argument("--rating-scale", type=float, default=2.0, help="множитель оценок (MovieLens 5 -> 10)")
+    importer.add_argument("--chunk-size", type=int, default=100000, help="строк в памяти одновременно")
+    importer.add_argument("--keep-catalog", action="store_true", help="добавить к каталогу, а не заменить его")
+
+    ingest = commands.add_parser("ingest", help="потоковый приём событий оценок порциями (JSONL/CSV)")
+    ingest.add_argument("--events", required=True,
+                        help="файл событий user, movie, rating[, timestamp]: .jsonl или CSV/TSV; - для stdin")
+    ingest.add_argument("--batch-size", type=int, default=10000, help="событий в порции")
+    ingest.add_argument("--queue-size", type=int, default=4, help="порций в очереди до остановки чтения")
+
+    serve = commands.add_parser("serve", help="HTTP-сервис с JSON для многих клиентов")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8080)
+    serve.add_argument("--workers", type=int, default=None, help="потоков для запросов (по умолч. по числу ядер)")
+
+    batch = commands.add_parser("batch-recommend", help="рекомендации для всех пользователей в файл")
+    batch.add_argument("--strategy", default="rating",
+                       choices=["genre", "rating", "similar", "item", "factors", "hybrid"])
+    batch.add_argument("--out", default="recommendations.tsv")
+    batch.add_argument("--min-rating", type=float, default=0.0)
+    batch.add_argument("--min-year", type=int, default=0)
+    batch.add_argument("--max-results", type=int, default=10)
+    batch.add_argument("--processes", type=int, default=None, help="число процессов (по умолч. все ядра)")
+    batch.add_argument("--chunk-size", type=int, default=500, help="пользователей в одной задаче")
+    args = parser.parse_args(argv)
+
+    if args.metrics or args.metrics_out or args.profile_rate:
+        metrics.enabled = True
+        metrics.profile_rate = args.profile_rate
+    if args.metrics_out:
+        atexit.register(metrics.dump, args.metrics_out) # процессы пула выходят через os._exit и не пишут
+
+    if args.command == "import":
+        data_manager = DataManager(args.data)
+        start = time.perf_counter()
+        with data_manager.bulk_update():
+            bulk = BulkImporter(data_manager, args.chunk_size, args.rating_scale, progress=sys.stderr)
+            movies = ratings = 0
+            if args.movies:
+                if not args.keep_catalog:
+                    data_manager.clear_movies()
+                movies = bulk.import_movies(args.movies)
+            if args.ratings:
+                ratings = bulk.import_ratings(args.ratings)
+                bulk.apply_average_ratings()
+        elapsed = time.perf_counter() - start
+        print(f"Импортировано фильмов: {movies}, оценок: {ratings} за {elapsed:.1f} с "
+              f"({(movies + ratings) / elapsed if elapsed else 0:.0f} строк/с)")
+        return
+
+    if args.command == "ingest":
+        data_manager = DataManager(args.data)
+        ingestor = RatingIngestor(data_manager, args.batch_size, args.queue_size, progress=sys.stderr)
+        stats = ingestor.ingest_file(args.events)
+        data_manager.close()
+        print(f"Событий: {stats['events']}, применено оценок: {stats['applied']}, "
+              f"схлопнуто повторов: {stats['coalesced']}, отклонено: {stats['rejected']} "
+              f"за {stats['seconds']:.1f} с ({stats['events'] / stats['seconds'] if stats['seconds'] else 0:.0f} "
+              f"событий/с)")
+        return
+
+    if args.command == "serve":
+        data_manager = DataManager(args.data)
+        strategies = create_strategies(data_manager, args.item_index, args.factors_dir, args.ann, args.neighbors,
+                                       args.hybrid_weights)
+        service = RecommendationService(data_manager, strategies, args.workers)
+        ready = lambda port: print(f"Сервис слушает http://{args.host}:{port}", flush=True)
+        try:
+            asyncio.run(service.serve(args.host, args.port, ready))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            service.close()
+        return
+
+    if args.command == "batch-recommend":
+        data_manager = DataManager(args.data)
+        strategy = create_strategies(data_manager, args.item_index, args.factors_dir, args.ann, args.neighbors,
+                                     args.hybrid_weights)[args.strategy]
+        with open(args.out, "w", encoding="utf-8") as out:
+            count, rate = run_batch(strategy, out, args.min_rating, args.min_year, args.max_results,
+                                    args.processes, args.chunk_size, progress=sys.stderr)
+        print(f"Рекомендации для {count} пользователей сохранены в {args.out} ({rate:.0f} польз./с)")
+        return
+
+    if args.command == "train-factors":
+        data_manager = DataManager(args.data)
+        start = time.perf_counter()
+        model = FactorModel.train(data_manager, args.factors, args.iterations, args.reg)
+        version = model.save(args.factors_dir)
+        print(f"Модель {version} сохранена в {args.factors_dir} за {time.perf_counter() - start:.1f} с")
+        return
+
+    if args.command == "build-item-index":
+        data_manager = DataManager(args.data)
+        start = time.perf_counter()
+        table = ItemNeighborTable.build(data_manager, args.top_n, processes=args.processes)
+        table.save(args.item_index)
+        print(f"Таблица соседей сохранена в {args.item_index} за {time.perf_counter() - start:.1f} с")
+        return
+
+    app = MovieRecommendationApp(args.data, args.item_index, args.factors_dir, args.ann, args.lazy, args.neighbors,
+                                 args.hybrid_weights)
+    app.run()
+
+
 if __name__ == "__main__":
-    app = MovieRecommendationApp()
-    app.run()         
\ No newline at end of file
+    main()         
\ No newline at end of file
@@ -0,0 +1,73 @@
+# Общее для тестов: временный каталог с DataManager и небольшими данными - каталог фильмов
+# и пользователи с оценками (популярность фильмов неравномерная), плюс случайные записи оценок
+import os
+import random
+import tempfile
+import unittest
+
+from recomandator3000 import DataManager, Genre, Movie, User
+
+
+def fill(data_manager: DataManager, n_movies: int, n_users: int, ratings_per_user: int, seed: int):
+    #каталог 1..n_movies и пользователи user1..userN с паролем "secret"
+    rng = random.Random(seed)
+    genres = list(Genre)
+    quality = [rng.uniform(3.0, 9.5) for _ in range(n_movies)]
+    weights = [1.0 / rank for rank in range(1, n_movies + 1)]
+    with data_manager.bulk_update():
+        data_manager.clear_movies()
+        for movie_id in range(1, n_movies + 1):
+            data_manager.add_movie(Movie(movie_id, f"Фильм {movie_id}", rng.sample(genres, rng.randint(1, 3)),
+                                         f"Режиссёр {movie_id % 7}", rng.randint(1950, 2024),
+                                         round(quality[movie_id - 1], 1)))
+        for user_id in range(1, n_users + 1):
+            user = User(user_id, f"user{user_id}", "secret")
+            n_ratings = rng.randint(1, 2 * ratings_per_user)
+            chosen = set()
+            while len(chosen) < min(n_ratings, n_movies // 2):
+                chosen.add(rng.choices(range(1, n_movies + 1), weights)[0])
+            for movie_id in chosen:
+                user.add_rating(movie_id, min(10, max(0, round(quality[movie_id - 1] + rng.gauss(0, 1.5)))))
+            if rng.random() < 0.5:
+                user.set_preferred_genres(rng.sample(genres, rng.randint(1, 3)))
+            data_manager.add_user(user)
+
+
+class DataTestCase(unittest.TestCase):
+    N_MOVIES = 80
+    N_USERS = 150
+    RATINGS_PER_USER = 20
+    SEED = 1
+    FILE_NAME = "data.json" # расширение выбирает хранилище: .json или .db
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, self.FILE_NAME)
+        self.data_manager = DataManager(self.path)
+        fill(self.data_manager, self.N_MOVIES, self.N_USERS, self.RATINGS_PER_USER, self.SEED)
+        self.rng = random.Random(self.SEED)
+
+    def tearDown(self):
+        self.data_manager.close()
+        self.directory.cleanup()
+
+    def replace_user(self, user: User, n_ratings: int):
+        #пользователь с тем же id и новыми оценками: старые оценки убираются
+        replacement = User(user.user_id, user.name, "secret")
+        for movie_id in self.rng.sample(range(1, self.N_MOVIES + 1), n_ratings):
+            replacement.add_rating(movie_id, self.rng.randint(0, 10))
+        self.data_manager.add_user(replacement)
+        return replacement
+
+    def random_writes(self, n_writes: int, change_share: float = 0.3, replace_share: float = 0.0):
+        #новые оценки, изменения уже поставленных и (с долей replace_share) замена пользователя целиком
+        users = self.data_manager.get_all_users()
+        for _ in range(n_writes):
+            i = self.rng.randrange(len(users))
+            user = users[i]
+            if self.rng.random() < replace_share:
+                users[i] = self.replace_user(user, self.rng.randint(1, 30))
+            elif user.watched_movies and self.rng.random() < change_share:
+                user.add_rating(self.rng.choice(list(user.watched_movies)), self.rng.randint(0, 10))
+            else:
+                user.add_rating(self.rng.randint(1, self.N_MOVIES), self.rng.randint(0, 10))
@@ -0,0 +1,32 @@
+# Пакетные рекомендации для всех пользователей: процессы пула и совпадение с последовательным расчётом
+import io
+import multiprocessing
+import unittest
+
+from recomandator3000 import RatingBasedStrategy, run_batch
+from tests.support import DataTestCase
+
+
+class FailingOut(io.StringIO):
+    def write(self, text):
+        raise OSError("диск заполнен")
+
+
+@unittest.skipUnless("fork" in multiprocessing.get_all_start_methods(), "пул run_batch требует fork")
+class RunBatchTest(DataTestCase):
+    def test_pool_matches_serial(self):
+        strategy = RatingBasedStrategy(self.data_manager)
+        serial, parallel = io.StringIO(), io.StringIO()
+        self.assertEqual(run_batch(strategy, serial, processes=1, chunk_size=20)[0], self.N_USERS)
+        self.assertEqual(run_batch(strategy, parallel, processes=2, chunk_size=20)[0], self.N_USERS)
+        self.assertEqual(sorted(parallel.getvalue().splitlines()), sorted(serial.getvalue().splitlines()))
+        self.assertEqual(multiprocessing.active_children(), [])
+
+    def test_pool_closed_on_error(self):
+        with self.assertRaises(OSError):
+            run_batch(RatingBasedStrategy(self.data_manager), FailingOut(), processes=2, chunk_size=20)
+        self.assertEqual(multiprocessing.active_children(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+# Кэш рекомендаций: после случайных изменений данных ответ из кэша совпадает с расчётом заново
+import unittest
+
+from recomandator3000 import (CachedStrategy, FactorModel, Movie, GenreBasedStrategy, HybridStrategy,
+                              ItemSimilarityStrategy, MatrixFactorizationStrategy, RatingBasedStrategy,
+                              RecommendationCache, SimilarUserStrategy, UserLSHIndex, UserNeighborIndex, np)
+from tests.support import DataTestCase
+
+
+class CacheInvalidationTest(DataTestCase):
+    N_MOVIES = 120
+    RATINGS_PER_USER = 10
+
+    def check(self, strategies, rounds: int = 40):
+        #strategies: {имя: стратегия}; в каждом раунде - несколько записей,
+        #затем запросы всех стратегий для всех пользователей из выборки
+        cache = RecommendationCache(self.data_manager)
+        cached = {name: CachedStrategy(strategy, cache) for name, strategy in strategies.items()}
+        users = [user.user_id for user in self.data_manager.get_all_users()[:20]]
+        queries = [(0.0, 0), (6.0, 0)]
+        for round_number in range(rounds):
+            self.random_writes(3, replace_share=0.01)
+            if self.rng.random() < 0.2: # изредка меняется рейтинг фильма в каталоге
+                movie = self.data_manager.get_movie(self.rng.randint(1, self.N_MOVIES))
+                self.data_manager.add_movie(Movie(movie.movie_id, movie.title, movie.genres, movie.director,
+                                                  movie.year, round(self.rng.uniform(1, 10), 1)))
+            for user_id in users:
+                user = self.data_manager.get_user(user_id)
+                min_rating, min_year = self.rng.choice(queries)
+                for name, strategy in strategies.items():
+                    expected = [movie.movie_id for movie in strategy.get_recommendations(user, min_rating, min_year)]
+                    # из кэша - вторым: стратегия уже учла новые оценки, и расхождение - только в кэше
+                    result = [movie.movie_id for movie in
+                              cached[name].get_recommendations(user, min_rating, min_year)]
+                    self.assertEqual(result, expected, f"раунд {round_number}, {name}, пользователь {user_id}")
+                    page, _ = cached[name].get_page(user, min_rating, min_year, page_size=5)
+                    self.assertEqual([movie.movie_id for movie in page], expected[:5],
+                                     f"раунд {round_number}, {name}, страница")
+        self.assertGreater(cache.hits, cache.misses // 10) # кэш действительно отвечает
+
+    def test_all_strategies(self):
+        similar = SimilarUserStrategy(self.data_manager)
+        self.check({
+            "genre": GenreBasedStrategy(self.data_manager),
+            "rating": RatingBasedStrategy(self.data_manager),
+            "similar": similar,
+            "similar-lists": SimilarUserStrategy(self.data_manager,
+                                                 neighbor_index=UserNeighborIndex(self.data_manager, 10)),
+            "item": ItemSimilarityStrategy(self.data_manager, top_n=5),
+            "hybrid": HybridStrategy(self.data_manager, similar=similar),
+        })
+
+    @unittest.skipIf(np is None, "нужен numpy")
+    def test_factors(self):
+        model = FactorModel.train(self.data_manager, factors=4, iterations=3)
+        self.check({"factors": MatrixFactorizationStrategy(self.data_manager, model=model)})
+
+    def test_similar_lsh(self):
+        self.check({"similar-lsh": SimilarUserStrategy(self.data_manager, UserLSHIndex(self.data_manager))})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+# Каталог по столбцам: разреженные и слишком большие id фильмов
+import unittest
+
+from recomandator3000 import DataManager, Genre, MovieCatalog, Movie
+
+from tests.support import DataTestCase
+
+
+def movie(movie_id: int, rating: float = 5.0):
+    return Movie(movie_id, f"Фильм {movie_id}", [Genre.DRAMA], "Режиссёр", 2000, rating)
+
+
+class MovieCatalogTest(unittest.TestCase):
+    def test_dense_ids(self):
+        catalog = MovieCatalog()
+        for movie_id in range(1, 101):
+            catalog.add(movie(movie_id, movie_id / 10))
+        self.assertEqual(len(catalog), 100)
+        self.assertEqual(catalog.rating(42), 4.2)
+        self.assertNotIn(0, catalog)
+        self.assertNotIn(101, catalog)
+
+    def test_sparse_ids(self):
+        # один большой id не должен раздувать таблицу id -> строка
+        catalog = MovieCatalog()
+        catalog.add(movie(1))
+        catalog.add(movie(5 * 10 ** 7, 7.5))
+        catalog.add(movie(3))
+        self.assertLess(catalog.nbytes(), 10 ** 5)
+        self.assertEqual(catalog.rating(5 * 10 ** 7), 7.5)
+        self.assertEqual([m.movie_id for m in catalog.movies()], [1, 5 * 10 ** 7, 3])
+        self.assertIsNone(catalog.get(2))
+
+    def test_replace_after_sparse(self):
+        catalog = MovieCatalog()
+        catalog.add(movie(10 ** 9))
+        self.assertEqual(catalog.add(movie(10 ** 9, 9.0)), (5.0, 2000, (Genre.DRAMA,)))
+        self.assertEqual(catalog.rating(10 ** 9), 9.0)
+        self.assertEqual(len(catalog), 1)
+
+    def test_id_out_of_range(self):
+        catalog = MovieCatalog()
+        for movie_id in (-1, MovieCatalog.MAX_ID + 1, 3 * 10 ** 9):
+            with self.assertRaises(ValueError):
+                catalog.add(movie(movie_id))
+        self.assertEqual(len(catalog), 0)
+
+
+class StoredCatalogTest(DataTestCase):
+    def test_reload_builds_indexes(self):
+        # сохранённый каталог грузится массово: индексы те же, что и до перезапуска
+        before = self.data_manager
+        before.close()
+        self.data_manager = DataManager(self.path)
+        after = self.data_manager
+        self.assertEqual(after._rating_index, before._rating_index)
+        self.assertEqual(after._year_index, before._year_index)
+        self.assertEqual(after._genre_index, before._genre_index)
+
+        movie_id = after.get_next_movie_id()
+        self.assertEqual(movie_id, self.N_MOVIES + 1)
+        after.add_movie(Movie(movie_id, "Новый", [Genre.COMEDY], "Режиссёр", 2030, 9.9))
+        self.assertEqual(after.get_genre_postings(Genre.COMEDY)[0], (-9.9, movie_id))
+        self.assertEqual(next(after.get_year_index(2025)[0]), (2030, movie_id))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+# Потоковый приём оценок: схлопывание повторов внутри порции, отклонённые события, ошибки чтения и записи
+import os
+import threading
+import unittest
+from unittest import mock
+
+from recomandator3000 import RatingIngestor
+from tests.support import DataTestCase
+
+
+class RatingIngestorTest(DataTestCase):
+    N_USERS = 30
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.data_manager.get_user(1)
+        self.unseen = [movie_id for movie_id in range(1, self.N_MOVIES + 1)
+                       if movie_id not in self.user.watched_movies]
+
+    def test_last_by_time_wins(self):
+        a, b, c, d = self.unseen[:4]
+        events = [(1, a, 3, 10), (1, a, 4, 30), (1, a, 5, 20), # по времени последняя - 4, хоть пришла раньше
+                  (1, b, 6, None), (1, b, 7, None), # без времени - последняя пришедшая
+                  (1, c, 8, 5), (1, c, 9, "5"), # равное время - последняя пришедшая
+                  (1, d, 2, 7), (1, d, 1, None)]
+        stats = RatingIngestor(self.data_manager).ingest(events)
+        self.assertEqual({movie_id: self.user.watched_movies[movie_id] for movie_id in (a, b, c, d)},
+                         {a: 4, b: 7, c: 9, d: 1})
+        self.assertEqual((stats["events"], stats["applied"], stats["coalesced"], stats["rejected"], stats["batches"]),
+                         (9, 4, 5, 0, 1))
+
+    def test_batches_not_merged(self):
+        # схлопывание - только внутри порции: следующая порция применяется поверх, даже с ранним временем
+        movie_id = self.unseen[0]
+        stats = RatingIngestor(self.data_manager, batch_size=2).ingest(
+            [(1, movie_id, 3, 10), (1, movie_id, 4, 30), (1, movie_id, 5, 20)])
+        self.assertEqual(self.user.watched_movies[movie_id], 5)
+        self.assertEqual((stats["batches"], stats["applied"], stats["coalesced"]), (2, 2, 1))
+
+    def test_rejected(self):
+        movie_id = self.unseen[0]
+        events = [(1, movie_id, 11, None), (1, movie_id, -1, None), (1, 10 ** 6, 5, None), ("x", movie_id, 5, None),
+                  (1, movie_id, "плохо", None), (10 ** 6, movie_id, 5, None), None, (1, movie_id, 6, None)]
+        stats = RatingIngestor(self.data_manager).ingest(events)
+        self.assertEqual(self.user.watched_movies[movie_id], 6)
+        self.assertEqual((stats["events"], stats["applied"], stats["coalesced"], stats["rejected"]), (8, 1, 0, 7))
+
+    def test_unchanged_rating_not_applied(self):
+        movie_id, rating = next(iter(self.user.watched_movies.items()))
+        stats = RatingIngestor(self.data_manager).ingest([(1, movie_id, rating, None)])
+        self.assertEqual(stats["applied"], 0)
+
+    def test_matches_sequential(self):
+        # порции любого размера дают то же, что применение событий по одному в порядке времени
+        events = []
+        for timestamp in range(2000):
+            events.append((self.rng.randint(1, self.N_USERS), self.rng.randint(1, self.N_MOVIES),
+                           self.rng.randint(0, 10), timestamp))
+        self.rng.shuffle(events)
+        latest = {}
+        for user_id, movie_id, rating, timestamp in events:
+            if (user_id, movie_id) not in latest or timestamp > latest[user_id, movie_id][0]:
+                latest[user_id, movie_id] = (timestamp, rating)
+        expected = {user.user_id: dict(user.watched_movies) for user in self.data_manager.get_all_users()}
+        for (user_id, movie_id), (_, rating) in latest.items():
+            expected[user_id][movie_id] = rating
+
+        stats = RatingIngestor(self.data_manager, batch_size=len(events)).ingest(events)
+        self.assertEqual({user.user_id: dict(user.watched_movies) for user in self.data_manager.get_all_users()},
+                         expected)
+        self.assertEqual(stats["coalesced"], len(events) - len(latest))
+        # матрица оценок по столбцам обновлена вместе со строками
+        for (user_id, movie_id), (_, rating) in latest.items():
+            self.assertEqual(self.data_manager._ratings_by_movie[movie_id][user_id], rating)
+
+    def test_read_events(self):
+        a, b = self.unseen[:2]
+        jsonl = os.path.join(self.directory.name, "events.jsonl")
+        with open(jsonl, "w", encoding="utf-8") as f:
+            f.write(f'{{"user": 1, "movie": {a}, "rating": 3, "timestamp": 2}}\n\n'
+                    f'{{"user": 1, "movie": {a}, "rat\n'
+                    f'[1, 2]\n'
+                    f'{{"user": 1, "movie": {a}, "rating": 7, "timestamp": 1}}\n')
+        csv_path = os.path.join(self.directory.name, "events.csv")
+        with open(csv_path, "w", encoding="utf-8") as f:
+            f.write(f"userId,movieId,rating,timestamp\n1,{b},8,5\n1,{b},9\n")
+        stats = RatingIngestor(self.data_manager).ingest_file(jsonl)
+        self.assertEqual(self.user.watched_movies[a], 3)
+        self.assertEqual((stats["events"], stats["rejected"], stats["coalesced"]), (4, 2, 1))
+        RatingIngestor(self.data_manager).ingest_file(csv_path)
+        self.assertEqual(self.user.watched_movies[b], 9)
+
+    def test_read_error_raised(self):
+        def events():
+            yield 1, self.unseen[0], 5, None
+            raise OSError("файл пропал")
+
+        with self.assertRaises(OSError):
+            RatingIngestor(self.data_manager, batch_size=1).ingest(events())
+
+    def test_apply_error_stops_reader(self):
+        # ошибка записи не оставляет поток чтения висеть на полной очереди
+        ingestor = RatingIngestor(self.data_manager, batch_size=1, queue_size=1)
+        events = ((1, self.unseen[0], i % 11, None) for i in range(10 ** 6))
+        before = set(threading.enumerate())
+        with mock.patch.object(self.data_manager, "apply_ratings", side_effect=OSError("диск заполнен")):
+            with self.assertRaises(OSError):
+                ingestor.ingest(events)
+        self.assertEqual(ingestor.stats["batches"], 0)
+        for thread in set(threading.enumerate()) - before:
+            thread.join(timeout=5)
+            self.assertFalse(thread.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+# Таблица соседей фильмов: инкрементальное обновление после новых оценок совпадает с полной сборкой
+import unittest
+
+from recomandator3000 import CachedStrategy, ItemNeighborTable, ItemSimilarityStrategy, RecommendationCache
+from tests.support import DataTestCase
+
+
+class ItemRefreshTest(DataTestCase):
+    N_MOVIES = 60
+    SEED = 3
+
+    def assert_matches_build(self, strategy: ItemSimilarityStrategy):
+        strategy.refresh()
+        expected = ItemNeighborTable.build(self.data_manager, strategy.top_n, strategy.min_similarity,
+                                           processes=1)
+        for movie_id in self.data_manager.catalog.ids():
+            self.assertEqual(strategy.table.get(movie_id), expected.get(movie_id), f"фильм {movie_id}")
+
+    def test_refresh_after_ratings(self):
+        for top_n in (3, 20):
+            strategy = ItemSimilarityStrategy(self.data_manager, top_n=top_n)
+            strategy.table # сборка до изменений
+            for _ in range(30):
+                self.random_writes(3, change_share=0.5)
+                self.assert_matches_build(strategy)
+
+    def test_refresh_after_user_replaced(self):
+        # у заменённого пользователя оценки убираются: фильмы теряют общих зрителей
+        strategy = ItemSimilarityStrategy(self.data_manager, top_n=5)
+        strategy.table
+        for _ in range(10):
+            self.replace_user(self.rng.choice(self.data_manager.get_all_users()), 5)
+            self.assert_matches_build(strategy)
+
+
+
+class ItemCacheTest(DataTestCase):
+    # фильмов больше и оценки реже: списки соседей чаще меняются от одной оценки
+    N_MOVIES = 200
+    RATINGS_PER_USER = 10
+
+    def test_cache_follows_lists(self):
+        # фильм с новой оценкой может войти в список соседей просмотренного фильма - кэш должен это заметить
+        strategy = ItemSimilarityStrategy(self.data_manager, top_n=5)
+        cached = CachedStrategy(strategy, RecommendationCache(self.data_manager))
+        users = self.data_manager.get_all_users()[:60]
+        for user in users:
+            cached.get_recommendations(user)
+        for _ in range(40):
+            self.random_writes(3)
+            for user in users:
+                user = self.data_manager.get_user(user.user_id)
+                self.assertEqual([movie.movie_id for movie in cached.get_recommendations(user)],
+                                 [movie.movie_id for movie in strategy.get_recommendations(user)])
+
+
+if __name__ == "__main__":
+    unittest.main()
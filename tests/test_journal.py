@@ -0,0 +1,106 @@
+# Журнал изменений JSON-хранилища: проигрывание после сбоя и недописанная последняя запись
+import os
+import unittest
+from unittest import mock
+
+from recomandator3000 import DataManager, Genre, JsonStorage, User
+from tests.support import DataTestCase
+
+
+def state(data_manager: DataManager):
+    return {user.user_id: (user.name, dict(user.watched_movies), [genre.value for genre in user.preferred_genres])
+            for user in data_manager.get_all_users()}
+
+
+class JournalTest(DataTestCase):
+    N_USERS = 40
+
+    def crash(self):
+        #процесс упал: журнал дописан и сброшен на диск, но не свернут в снимок
+        storage = self.data_manager._storage
+        storage.flush()
+        if storage._journal is not None:
+            storage._journal.close()
+            storage._journal = None
+        storage._unmap()
+
+    def reopen(self):
+        self.data_manager = DataManager(self.path)
+        return self.data_manager
+
+    def write_changes(self):
+        self.random_writes(30, replace_share=0.1)
+        data_manager = self.data_manager
+        user = data_manager.get_user(1)
+        user.add_rating(1, 3)
+        user.add_rating(2, 9)
+        user.set_preferred_genres([Genre.COMEDY, Genre.DRAMA])
+        data_manager.add_user(User(data_manager.get_next_user_id(), "новый", "pw"))
+        data_manager.get_user(2).add_rating(5, 10)
+        data_manager.apply_ratings([(data_manager.get_user(3), 7, 4), (data_manager.get_user(4), 7, 6)])
+        data_manager.add_user(User(5, "user5", "secret")) # замена: прежние оценки пропадают
+
+    @property
+    def journal_filename(self):
+        return self.data_manager._storage.journal_filename
+
+    def test_replay_after_crash(self):
+        self.write_changes()
+        expected = state(self.data_manager)
+        columns = self.data_manager._ratings_by_movie
+        self.crash()
+        self.assertGreater(os.path.getsize(self.journal_filename), 0)
+
+        data_manager = self.reopen()
+        self.assertEqual(state(data_manager), expected)
+        self.assertEqual(data_manager._ratings_by_movie, columns)
+        self.assertEqual(data_manager.get_user(5).watched_movies, {})
+        self.assertEqual(data_manager.get_next_user_id(), self.N_USERS + 2)
+
+    def test_torn_tail(self):
+        self.write_changes()
+        expected = state(self.data_manager)
+        self.crash()
+        valid_size = os.path.getsize(self.journal_filename)
+        with open(self.journal_filename, "ab") as f:
+            f.write(b'{"op": "rate", "user": 1, "mov') # сбой посреди записи
+
+        data_manager = self.reopen()
+        self.assertEqual(state(data_manager), expected)
+        self.assertEqual(os.path.getsize(self.journal_filename), valid_size) # обрывок отрезан
+
+        # новые записи ложатся с начала строки и тоже переживают сбой
+        data_manager.get_user(1).add_rating(3, 1)
+        expected = state(data_manager)
+        self.crash()
+        self.assertEqual(state(self.reopen()), expected)
+
+    def test_broken_line_stops_replay(self):
+        self.data_manager.get_user(1).add_rating(1, 3)
+        expected = state(self.data_manager)
+        self.crash()
+        with open(self.journal_filename, "ab") as f:
+            f.write(b'{"op": "rate", "user": 1, "movie": 1, "rat\n')
+            f.write(b'{"op": "rate", "user": 2, "movie": 2, "rating": 0.5}\n')
+        # после испорченной строки записям верить нельзя
+        self.assertEqual(state(self.reopen()), expected)
+
+    def test_close_compacts(self):
+        self.write_changes()
+        expected = state(self.data_manager)
+        self.data_manager.close()
+        self.assertFalse(os.path.exists(self.journal_filename))
+        self.assertEqual(state(self.reopen()), expected)
+
+    def test_large_journal_compacted_on_load(self):
+        self.write_changes()
+        expected = state(self.data_manager)
+        self.crash()
+        with mock.patch.object(JsonStorage, "JOURNAL_COMPACT_SIZE", 1):
+            data_manager = self.reopen()
+        self.assertFalse(os.path.exists(self.journal_filename))
+        self.assertEqual(state(data_manager), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
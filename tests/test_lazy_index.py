@@ -0,0 +1,131 @@
+# Ленивое чтение data.json: индекс смещений пользователей в снимке, его пересборка и журнал поверх него
+import json
+import os
+import unittest
+from unittest import mock
+
+from recomandator3000 import DataManager, JsonStorage, User
+from tests.support import DataTestCase
+
+
+def state(data_manager: DataManager):
+    return {user.user_id: (user.name, dict(user.watched_movies), user.preferred_genres)
+            for user in data_manager.get_all_users()}
+
+
+class LazyIndexTest(DataTestCase):
+    N_USERS = 60
+
+    def setUp(self):
+        super().setUp()
+        self.expected = state(self.data_manager)
+        self.data_manager.close()
+        self.data_manager = DataManager(self.path, lazy=True)
+
+    def reopen(self, lazy: bool = True):
+        self.data_manager.close()
+        self.data_manager = DataManager(self.path, lazy=lazy)
+        return self.data_manager
+
+    @property
+    def index_filename(self):
+        return self.data_manager._storage.index_filename
+
+    def test_users_read_one_by_one(self):
+        data_manager = self.data_manager
+        self.assertTrue(data_manager._storage.lazy)
+        self.assertTrue(os.path.exists(self.index_filename))
+        self.assertEqual(data_manager._users, {})
+        self.assertEqual(data_manager.get_next_user_id(), self.N_USERS + 1)
+
+        user = data_manager.get_user(17)
+        self.assertEqual((user.name, dict(user.watched_movies), user.preferred_genres), self.expected[17])
+        self.assertEqual(data_manager.get_user_by_name("USER23").user_id, 23)
+        self.assertIsNone(data_manager.get_user_by_name("user0"))
+        self.assertIsNone(data_manager.get_user(10 ** 6))
+        self.assertEqual(sorted(data_manager._users), [17, 23])
+        self.assertEqual(state(data_manager), self.expected)
+
+    def test_stale_index_rebuilt(self):
+        # снимок переписан без ленивого режима - индекс с прежними размером и mtime не подходит
+        data_manager = self.reopen(lazy=False)
+        data_manager.add_user(User(data_manager.get_next_user_id(), "поздний", "pw"))
+        data_manager.get_user(3).add_rating(1, 10)
+        expected = state(data_manager)
+        data_manager = self.reopen()
+        self.assertTrue(data_manager._storage.lazy)
+        self.assertEqual(data_manager.get_user_by_name("Поздний").user_id, self.N_USERS + 1)
+        self.assertEqual(data_manager.get_user(3).watched_movies[1], 10)
+        self.assertEqual(state(data_manager), expected)
+
+    def test_broken_index_rebuilt(self):
+        self.data_manager.close()
+        with open(self.index_filename, "r+b") as f:
+            f.write(b"\0" * 64)
+        data_manager = self.reopen()
+        self.assertTrue(data_manager._storage.lazy)
+        self.assertEqual(data_manager.get_user_by_name("user5").user_id, 5)
+
+    def test_other_layouts(self):
+        # снимок, записанный не нами: отступы, \u-экранирование и имена не в ASCII
+        users = {str(user_id): {"name": name, "password": "pw", "watched": {"1": user_id}, "preferred_genres": []}
+                 for user_id, name in ((3, "Ёжик"), (10, "café"), (7, "plain"))}
+        for ensure_ascii in (False, True):
+            with self.subTest(ensure_ascii=ensure_ascii):
+                self.data_manager.close()
+                with open(self.path, "w", encoding="utf-8") as f:
+                    json.dump({"version": 1, "users": users, "extra": [1, {"users": 2}]}, f,
+                              indent=4, ensure_ascii=ensure_ascii)
+                data_manager = self.reopen()
+                self.assertTrue(data_manager._storage.lazy)
+                self.assertEqual(data_manager.get_user_by_name("ёжик").user_id, 3)
+                self.assertEqual(data_manager.get_user_by_name("CAFÉ").user_id, 10)
+                self.assertEqual(data_manager.get_user(7).watched_movies, {1: 7})
+                self.assertEqual(data_manager.get_next_user_id(), 11)
+
+    def test_unindexable_snapshot_loads_fully(self):
+        # ключ не id: такой снимок не разобрать по индексу, полная загрузка его просто пропускает
+        self.data_manager.close()
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"users": {"2": {"name": "Анна", "password": "pw"}, "meta": {"name": "служебная запись"}}}, f)
+        data_manager = self.reopen()
+        self.assertFalse(data_manager._storage.lazy)
+        self.assertEqual([user.name for user in data_manager.get_all_users()], ["Анна"])
+
+    def test_hash_collisions(self):
+        # все имена с одним хэшем: поиск по имени сверяет само имя
+        self.data_manager.close()
+        os.remove(self.index_filename)
+        with mock.patch.object(JsonStorage, "_name_hash", staticmethod(lambda name: 0)):
+            data_manager = self.reopen()
+            for user_id in (1, 30, self.N_USERS):
+                self.assertEqual(data_manager.get_user_by_name(f"User{user_id}").user_id, user_id)
+            self.assertIsNone(data_manager.get_user_by_name("никто"))
+
+    def test_journal_over_index(self):
+        # изменения ленивого запуска остаются в журнале и применяются к пользователям при чтении
+        data_manager = self.data_manager
+        new_id = data_manager.get_next_user_id()
+        data_manager.add_user(User(new_id, "новый", "pw"))
+        data_manager.get_user(new_id).add_rating(2, 8)
+        data_manager.get_user(4).add_rating(1, 0)
+        data_manager.add_user(User(9, "user9", "secret")) # замена: оценки из снимка не возвращаются
+        self.assertFalse(data_manager._all_users_loaded)
+        data_manager = self.reopen()
+        self.assertTrue(os.path.exists(data_manager._storage.journal_filename))
+
+        self.assertEqual(data_manager.get_user_by_name("НОВЫЙ").watched_movies, {2: 8})
+        self.assertEqual(data_manager.get_user(4).watched_movies[1], 0)
+        self.assertEqual(data_manager.get_user(9).watched_movies, {})
+        self.assertEqual(data_manager.get_next_user_id(), new_id + 1)
+        with self.assertRaises(ValueError):
+            data_manager.add_user(User(data_manager.get_next_user_id(), "Новый", "pw"))
+
+        expected = state(data_manager) # полная загрузка: журнал сворачивается в снимок при закрытии
+        data_manager = self.reopen()
+        self.assertFalse(os.path.exists(data_manager._storage.journal_filename))
+        self.assertEqual(state(data_manager), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
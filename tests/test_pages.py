@@ -0,0 +1,76 @@
+# Постраничная выдача: страницы совпадают с полным списком, первая страница идёт через кэш
+import unittest
+
+from recomandator3000 import CachedStrategy, GenreBasedStrategy, RecommendationCache, SimilarUserStrategy
+from tests.support import DataTestCase
+
+
+class PagesTest(DataTestCase):
+    SEED = 2
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.data_manager.get_user(self.rng.randint(1, self.N_USERS))
+
+    def all_pages(self, strategy, page_size: int):
+        movies, cursor = strategy.get_page(self.user, page_size=page_size)
+        while cursor is not None:
+            page, cursor = strategy.get_page(self.user, page_size=page_size, cursor=cursor)
+            movies.extend(page)
+        return [movie.movie_id for movie in movies]
+
+    def test_pages_match_full_list(self):
+        for strategy in (GenreBasedStrategy(self.data_manager), SimilarUserStrategy(self.data_manager)):
+            expected = [movie.movie_id for movie in strategy.get_recommendations(self.user, max_results=1000)]
+            cached = CachedStrategy(strategy, RecommendationCache(self.data_manager))
+            for paged in (strategy, cached):
+                self.assertEqual(self.all_pages(paged, 7), expected)
+
+    def test_first_page_cached(self):
+        cache = RecommendationCache(self.data_manager)
+        strategy = CachedStrategy(SimilarUserStrategy(self.data_manager), cache)
+        pages = [strategy.get_page(self.user, page_size=5) for _ in range(3)]
+        self.assertEqual(cache.stats()["misses"], 1)
+        self.assertEqual(cache.stats()["hits"], 2)
+        self.assertEqual(cache.stats()["size"], 1)
+        self.assertEqual(pages[0][0], pages[2][0])
+
+        # новая оценка - запись устарела
+        self.user.add_rating(next(iter(self.user.watched_movies)), 10)
+        strategy.get_page(self.user, page_size=5)
+        self.assertEqual(cache.stats()["misses"], 2)
+
+    def test_next_pages_resume(self):
+        # следующие страницы - из того же перебора, и при промахе кэша, и при попадании
+        inner = SimilarUserStrategy(self.data_manager)
+        calls = []
+        scores = inner._scores
+        inner._scores = lambda *args: calls.append(args) or scores(*args)
+        strategy = CachedStrategy(inner, RecommendationCache(self.data_manager))
+        _, cursor = strategy.get_page(self.user, page_size=3)
+        for _ in range(2):
+            _, cursor = strategy.get_page(self.user, page_size=3, cursor=cursor)
+        _, cursor = strategy.get_page(self.user, page_size=3) # попадание в кэш
+        strategy.get_page(self.user, page_size=3, cursor=cursor)
+        self.assertEqual(len(calls), 1)
+
+    def test_page_size(self):
+        strategy = GenreBasedStrategy(self.data_manager)
+        for page_size in (0, -1):
+            with self.assertRaises(ValueError):
+                strategy.get_page(self.user, page_size=page_size)
+
+    def test_stale_cursor_restarts(self):
+        strategy = CachedStrategy(GenreBasedStrategy(self.data_manager), RecommendationCache(self.data_manager))
+        first, cursor = strategy.get_page(self.user, page_size=3)
+        self.assertIsNotNone(cursor)
+        self.user.set_preferred_genres(list(self.user.preferred_genres))
+        second, _ = strategy.get_page(self.user, page_size=3, cursor=cursor)
+        expected = strategy.get_recommendations(self.user, max_results=6)[3:]
+        self.assertEqual([movie.movie_id for movie in second], [movie.movie_id for movie in expected])
+        with self.assertRaises(ValueError):
+            strategy.get_page(self.user, cursor="не курсор")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,190 @@
+# HTTP-сервис: блокировка чтения-записи DataManager и обработчики запросов
+import asyncio
+import http.client
+import json
+import threading
+import time
+import unittest
+
+from recomandator3000 import GenreBasedStrategy, RatingBasedStrategy, ReadWriteLock, RecommendationService
+from tests.support import DataTestCase
+
+
+class ReadWriteLockTest(unittest.TestCase):
+    def test_readers_and_writers_exclusive(self):
+        lock = ReadWriteLock()
+        state = {"readers": 0, "writers": 0, "max_readers": 0}
+        state_lock = threading.Lock()
+        errors = []
+
+        def enter(kind):
+            with state_lock:
+                state[kind] += 1
+                if state["writers"] > 1 or (state["writers"] and state["readers"]):
+                    errors.append(dict(state))
+                state["max_readers"] = max(state["max_readers"], state["readers"])
+
+        def leave(kind):
+            with state_lock:
+                state[kind] -= 1
+
+        def reader():
+            for _ in range(200):
+                with lock.reader:
+                    enter("readers")
+                    with lock.reader: # повторное чтение в том же потоке
+                        time.sleep(0)
+                    leave("readers")
+
+        def writer():
+            for _ in range(100):
+                with lock.writer:
+                    enter("writers")
+                    with lock.reader: # чтение под своей записью не ждёт
+                        time.sleep(0)
+                    leave("writers")
+
+        threads = [threading.Thread(target=reader) for _ in range(6)] + \
+                  [threading.Thread(target=writer) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=30)
+        self.assertFalse(any(thread.is_alive() for thread in threads), "взаимоблокировка")
+        self.assertEqual(errors, [])
+        self.assertEqual((state["readers"], state["writers"]), (0, 0))
+
+    def test_writer_reentrant(self):
+        lock = ReadWriteLock()
+        with lock.writer:
+            with lock.writer:
+                pass
+            self.assertEqual(lock._writer, threading.get_ident())
+        self.assertIsNone(lock._writer)
+
+    def test_no_upgrade_from_reader(self):
+        lock = ReadWriteLock()
+        with lock.reader:
+            with self.assertRaises(RuntimeError):
+                lock.acquire_write()
+        with lock.writer: # блокировка не осталась занятой
+            pass
+
+    def test_waiting_writer_not_starved(self):
+        # новые читатели не проходят вперёд ждущего писателя
+        lock = ReadWriteLock()
+        order = []
+        lock.acquire_read()
+        writer = threading.Thread(target=lambda: (lock.acquire_write(), order.append("writer"), lock.release_write()))
+        writer.start()
+        while not lock._waiting_writers:
+            time.sleep(0.001)
+        reader = threading.Thread(target=lambda: (lock.acquire_read(), order.append("reader"), lock.release_read()))
+        reader.start()
+        time.sleep(0.05)
+        self.assertEqual(order, [])
+        lock.release_read()
+        writer.join(timeout=5)
+        reader.join(timeout=5)
+        self.assertEqual(order, ["writer", "reader"])
+
+
+class ServiceTest(DataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.strategies = {"rating": RatingBasedStrategy(self.data_manager),
+                           "genre": GenreBasedStrategy(self.data_manager)}
+        self.service = RecommendationService(self.data_manager, self.strategies, workers=2)
+
+    def tearDown(self):
+        self.service._executor.shutdown(wait=True)
+        super().tearDown()
+
+    def call(self, path: str, data=None, method: str = "POST"):
+        body = data if isinstance(data, bytes) else json.dumps(data).encode("utf-8") if data is not None else b""
+        return self.service.handle(method, path, body)
+
+    def login(self, name: str = "user1"):
+        status, payload = self.call("/login", {"name": name, "password": "secret"})
+        self.assertEqual(status, 200)
+        return payload["token"]
+
+    def test_register_and_login(self):
+        status, payload = self.call("/register", {"name": "Новый", "password": "pw"})
+        self.assertEqual(status, 200)
+        self.assertEqual(self.data_manager.get_user(payload["user_id"]).name, "Новый")
+        self.assertEqual(self.call("/register", {"name": "НОВЫЙ", "password": "pw"})[0], 409)
+        self.assertEqual(self.call("/register", {"name": " ", "password": "pw"})[0], 400)
+        self.assertEqual(self.call("/login", {"name": "новый", "password": "pw"})[0], 200)
+        self.assertEqual(self.call("/login", {"name": "Новый", "password": "нет"})[0], 401)
+
+    def test_rate_and_preferences(self):
+        token = self.login()
+        user = self.data_manager.get_user(1)
+        movie_id = next(m for m in range(1, self.N_MOVIES + 1) if m not in user.watched_movies)
+        self.assertEqual(self.call("/rate", {"token": token, "movie_id": movie_id, "rating": 7})[0], 200)
+        self.assertEqual(user.watched_movies[movie_id], 7.0)
+        self.assertEqual(self.call("/rate", {"token": token, "movie_id": 10 ** 6, "rating": 7})[0], 404)
+        self.assertEqual(self.call("/rate", {"token": token, "movie_id": movie_id, "rating": 11})[0], 400)
+        self.assertEqual(self.call("/rate", {"token": token, "movie_id": movie_id})[0], 400)
+        self.assertEqual(self.call("/rate", {"movie_id": movie_id, "rating": 7})[0], 401)
+
+        status, payload = self.call("/preferences", {"token": token, "genres": ["Драма", "нет такого"]})
+        self.assertEqual((status, payload), (200, {"genres": ["Драма"]}))
+        self.assertEqual(self.call("/preferences", {"token": token, "genres": ["нет такого"]})[0], 400)
+
+    def test_recommend_pages(self):
+        token = self.login()
+        user = self.data_manager.get_user(1)
+        expected = [m.movie_id for m in self.strategies["rating"].get_recommendations(user, max_results=12)]
+        status, first = self.call("/recommend", {"token": token, "strategy": "rating", "max_results": 6})
+        self.assertEqual(status, 200)
+        status, second = self.call("/recommend", {"token": token, "strategy": "rating", "max_results": 6,
+                                                  "cursor": first["cursor"]})
+        self.assertEqual(status, 200)
+        self.assertEqual([m["id"] for m in first["movies"] + second["movies"]], expected)
+        self.assertEqual(self.call("/recommend", {"token": token, "strategy": "нет"})[0], 400)
+
+    def test_bad_requests(self):
+        token = self.login()
+        self.assertEqual(self.call("/nowhere", {})[0], 404)
+        self.assertEqual(self.call("/login", {}, method="GET")[0], 404)
+        self.assertEqual(self.call("/login", b"{not json")[0], 400)
+        self.assertEqual(self.call("/login", b"[]")[0], 400)
+        self.assertEqual(self.call("/recommend", {"token": token, "min_year": "вчера"})[0], 400)
+        # int(inf) - OverflowError: ответ 500 вместо оборванного соединения
+        status, payload = self.call("/recommend", b'{"token": "%s", "max_results": 1e400}' % token.encode())
+        self.assertEqual(status, 500)
+        self.assertIn("OverflowError", payload["error"])
+
+    def test_serve_off_main_thread(self):
+        # add_signal_handler вне главного потока бросает RuntimeError - сервис всё равно запускается
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+        port = []
+        task = loop.create_task(self.service.serve("127.0.0.1", 0, lambda p: (port.append(p), ready.set())))
+
+        def run():
+            try:
+                loop.run_until_complete(task)
+            except asyncio.CancelledError:
+                pass
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        try:
+            self.assertTrue(ready.wait(10))
+            connection = http.client.HTTPConnection("127.0.0.1", port[0], timeout=10)
+            connection.request("POST", "/login", json.dumps({"name": "user1", "password": "secret"}))
+            response = connection.getresponse()
+            self.assertEqual(response.status, 200)
+            self.assertIn("token", json.loads(response.read()))
+            connection.close()
+        finally:
+            loop.call_soon_threadsafe(task.cancel)
+            thread.join(timeout=10)
+            loop.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+# Хранилище SQLite: ленивая загрузка пользователей, сохранение изменений между запусками, fork
+import multiprocessing
+import sqlite3
+import unittest
+
+from recomandator3000 import DataManager, Genre, Movie, SqliteStorage, User
+from tests.support import DataTestCase
+
+
+class SqliteStorageTest(DataTestCase):
+    FILE_NAME = "data.db"
+    N_USERS = 60
+
+    def reopen(self):
+        self.data_manager.close()
+        self.data_manager = DataManager(self.path)
+        return self.data_manager
+
+    def test_storage_by_extension(self):
+        self.assertIsInstance(self.data_manager._storage, SqliteStorage)
+
+    def test_lazy_after_restart(self):
+        expected = {user.user_id: (dict(user.watched_movies), user.preferred_genres)
+                    for user in self.data_manager.get_all_users()}
+        data_manager = self.reopen()
+        # пользователи читаются запросами по одному, каталог - целиком
+        self.assertFalse(data_manager._all_users_loaded)
+        self.assertEqual(data_manager._users, {})
+        self.assertEqual(len(data_manager.get_all_movies()), self.N_MOVIES)
+        self.assertEqual(data_manager.get_next_user_id(), self.N_USERS + 1)
+
+        user = data_manager.get_user_by_name("USER7")
+        self.assertEqual(user.user_id, 7)
+        self.assertEqual((dict(user.watched_movies), user.preferred_genres), expected[7])
+        self.assertIsNotNone(data_manager.authenticate("user8", "secret"))
+        self.assertEqual(sorted(data_manager._users), [7, 8])
+        self.assertIsNone(data_manager.get_user(10 ** 6))
+
+        self.assertEqual({user.user_id: (dict(user.watched_movies), user.preferred_genres)
+                          for user in data_manager.get_all_users()}, expected)
+
+    def test_changes_survive_restart(self):
+        data_manager = self.data_manager
+        self.random_writes(300, replace_share=0.05) # больше COMMIT_BATCH
+        data_manager.get_user(1).set_preferred_genres([Genre.HORROR, Genre.COMEDY])
+        data_manager.apply_ratings([(data_manager.get_user(2), 1, 1), (data_manager.get_user(3), 1, 2)])
+        new_id = data_manager.get_next_user_id()
+        data_manager.add_user(User(new_id, "новый", "pw"))
+        data_manager.get_user(new_id).add_rating(4, 7)
+        data_manager.add_user(User(5, "user5", "secret")) # замена: оценки удаляются и в базе
+        expected = {user.user_id: (user.name, dict(user.watched_movies), user.preferred_genres)
+                    for user in data_manager.get_all_users()}
+
+        data_manager = self.reopen()
+        self.assertEqual(data_manager.get_user(5).watched_movies, {})
+        self.assertEqual(data_manager.get_user(1).preferred_genres, (Genre.HORROR, Genre.COMEDY))
+        self.assertEqual({user.user_id: (user.name, dict(user.watched_movies), user.preferred_genres)
+                          for user in data_manager.get_all_users()}, expected)
+
+    def test_unique_names(self):
+        data_manager = self.reopen()
+        # имя занято ещё не загруженным пользователем - проверка идёт запросом к базе
+        with self.assertRaises(ValueError):
+            data_manager.add_user(User(data_manager.get_next_user_id(), "User3", "pw"))
+        # и сама схема не пускает два имени с одним ключом
+        with self.assertRaises(sqlite3.IntegrityError):
+            data_manager._storage.conn.execute("INSERT INTO users (id, name, name_key, password) VALUES (?, ?, ?, ?)",
+                                               (10 ** 6, "USER3", "user3", "pw"))
+        self.assertEqual(data_manager.get_user_by_name("user3").user_id, 3)
+
+    def test_catalog_replaced(self):
+        with self.data_manager.bulk_update():
+            self.data_manager.clear_movies()
+            self.data_manager.add_movie(Movie(1, "Один", [Genre.DRAMA], "Режиссёр", 2001, 7.0))
+            self.data_manager.add_movie(Movie(500, "Пятьсот", [], "Режиссёр", 2002, 6.0))
+        data_manager = self.reopen()
+        self.assertEqual([(m.movie_id, m.genres) for m in data_manager.get_all_movies()],
+                         [(1, [Genre.DRAMA]), (500, [])])
+        self.assertEqual(data_manager.get_next_movie_id(), 501)
+
+    @unittest.skipUnless("fork" in multiprocessing.get_all_start_methods(), "нужен fork")
+    def test_fork_uses_own_connection(self):
+        parent_connection = self.data_manager._storage.conn
+
+        def child():
+            # соединение родителя после fork не используется - дочерний процесс открывает своё
+            storage = self.data_manager._storage
+            self.data_manager.get_user(2).add_rating(3, 10)
+            storage.flush()
+            assert storage.conn is not parent_connection
+            storage.close(self.data_manager)
+
+        process = multiprocessing.get_context("fork").Process(target=child)
+        process.start()
+        process.join(timeout=30)
+        self.assertEqual(process.exitcode, 0)
+        # соединение родителя цело, запись дочернего процесса видна
+        self.assertIs(self.data_manager._storage.conn, parent_connection)
+        self.assertEqual(parent_connection.execute(
+            "SELECT rating FROM ratings WHERE user_id = 2 AND movie_id = 3").fetchone(), (10.0,))
+
+
+if __name__ == "__main__":
+    unittest.main()
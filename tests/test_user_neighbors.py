@@ -0,0 +1,54 @@
+# Готовые списки похожих пользователей (UserNeighborIndex) после изменений оценок
+# совпадают со сходством, посчитанным с нуля
+import unittest
+
+from recomandator3000 import SimilarUserStrategy, User, UserNeighborIndex
+from tests.support import DataTestCase
+
+
+class UserNeighborIndexTest(DataTestCase):
+    N_USERS = 200
+    SEED = 5
+
+    def expected_neighbors(self, index: UserNeighborIndex, full: SimilarUserStrategy, user: User):
+        similarities = full._similarities(user)
+        expected = {other_id: similarity for other_id, similarity in similarities.items()
+                    if similarity >= index.min_similarity}
+        if index.max_neighbors is None:
+            return expected
+        # тот же порядок, что и в индексе: сходство, число общих фильмов, меньший id
+        common = lambda other_id: len(user.watched_movies.keys() &
+                                      self.data_manager.get_user(other_id).watched_movies.keys())
+        best = sorted(expected, key=lambda other_id: (-expected[other_id], -common(other_id), other_id))
+        return {other_id: expected[other_id] for other_id in best[:index.max_neighbors]}
+
+    def check(self, max_neighbors):
+        full = SimilarUserStrategy(self.data_manager)
+        index = UserNeighborIndex(self.data_manager, max_neighbors, repair_every=200)
+        indexed = SimilarUserStrategy(self.data_manager, neighbor_index=index)
+        user_ids = [user.user_id for user in self.rng.sample(self.data_manager.get_all_users(), 40)]
+        for user_id in user_ids: # списки должны существовать, чтобы их обновляли записи
+            index.neighbors(self.data_manager.get_user(user_id))
+
+        for _ in range(5):
+            self.random_writes(300, replace_share=0.01)
+            for user_id in user_ids:
+                user = self.data_manager.get_user(user_id)
+                self.assertEqual(index.neighbors(user), self.expected_neighbors(index, full, user),
+                                 f"пользователь {user_id}")
+                if max_neighbors is None:
+                    self.assertEqual([movie.movie_id for movie in indexed.get_recommendations(user)],
+                                     [movie.movie_id for movie in full.get_recommendations(user)])
+
+    def test_small_lists(self):
+        self.check(3)
+
+    def test_default_lists(self):
+        self.check(10)
+
+    def test_unbounded_lists(self):
+        self.check(None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+# Имена пользователей без учёта регистра (casefold) и старые данные, где такие имена совпадают
+import json
+import os
+import tempfile
+import unittest
+import warnings
+
+from recomandator3000 import DataManager, User
+
+
+class NameClashTest(unittest.TestCase):
+    def setUp(self):
+        # data.json из версии, сравнивавшей имена через lower(): "Straße" и "STRASSE" тогда различались
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "data.json")
+        users = {"1": {"name": "Straße", "password": "a", "watched": {"1": 8}, "preferred_genres": []},
+                 "2": {"name": "STRASSE", "password": "b", "watched": {"2": 6}, "preferred_genres": []},
+                 "3": {"name": "Иван", "password": "c", "watched": {}, "preferred_genres": []}}
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"users": users}, f, ensure_ascii=False)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def open(self, lazy: bool = False):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            data_manager = DataManager(self.path, lazy=lazy)
+            data_manager._ensure_all_users()
+        return data_manager, caught
+
+    def test_clash_loads_with_warning(self):
+        data_manager, caught = self.open()
+        self.assertEqual(len(caught), 1)
+        self.assertIn("STRASSE", str(caught[0].message))
+        # оба пользователя и их оценки на месте, по имени находится первый
+        self.assertEqual(data_manager.get_user(2).watched_movies, {2: 6})
+        self.assertEqual(data_manager.get_user_by_name("strasse").user_id, 1)
+        self.assertIsNotNone(data_manager.authenticate("Straße", "a"))
+        self.assertIsNone(data_manager.authenticate("STRASSE", "b"))
+        self.assertEqual(data_manager.get_user_by_name("иван").user_id, 3)
+
+        # новые совпадения по-прежнему запрещены
+        with self.assertRaises(ValueError):
+            data_manager.add_user(User(data_manager.get_next_user_id(), "strasse", "x"))
+        # замена второго пользователя не отнимает имя у первого
+        data_manager.get_user(2).add_rating(3, 5)
+        data_manager.add_user(User(2, "STRASSE", "b"))
+        self.assertEqual(data_manager.get_user_by_name("Strasse").user_id, 1)
+        data_manager.close()
+
+        # при следующем запуске данные те же
+        data_manager, caught = self.open()
+        self.assertEqual(len(caught), 1)
+        self.assertEqual(sorted(user.user_id for user in data_manager.get_all_users()), [1, 2, 3])
+        data_manager.close()
+
+    def test_clash_lazy(self):
+        data_manager, _ = self.open(lazy=True)
+        self.assertEqual(sorted(user.user_id for user in data_manager.get_all_users()), [1, 2, 3])
+        self.assertEqual(data_manager.get_user_by_name("STRASSE").user_id, 1)
+        data_manager.close()
+
+
+if __name__ == "__main__":
+    unittest.main()